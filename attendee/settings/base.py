@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -204,3 +205,25 @@ STORAGES = {
 AWS_S3_SIGNATURE_VERSION = "s3v4"
 AWS_RECORDING_STORAGE_BUCKET_NAME = os.getenv("AWS_RECORDING_STORAGE_BUCKET_NAME")
 CHARGE_CREDITS_FOR_BOTS = os.getenv("CHARGE_CREDITS_FOR_BOTS", "false") == "true"
+
+# Maximum number of concurrent transcription requests per project and provider. 0 disables the limit.
+TRANSCRIPTION_MAX_CONCURRENCY_PER_PROJECT = int(os.getenv("TRANSCRIPTION_MAX_CONCURRENCY_PER_PROJECT", "10"))
+# Slots of the above that only utterances from meetings in progress may use
+TRANSCRIPTION_RESERVED_LIVE_SLOTS = int(os.getenv("TRANSCRIPTION_RESERVED_LIVE_SLOTS", "2"))
+# When greater than 0, per participant utterances are transcribed after this many seconds, together with the other
+# utterances from the same recording that are waiting by then, in a single provider request. 0 transcribes each utterance on its own.
+TRANSCRIPTION_BATCH_WINDOW_SECONDS = float(os.getenv("TRANSCRIPTION_BATCH_WINDOW_SECONDS", "0"))
+
+# When enabled, bots append utterances and captions to a Redis stream instead of writing them to the database.
+# The stream is written to the database by the run_write_behind_ingest_worker command, which must be running.
+BOT_WRITE_BEHIND_ENABLED = os.getenv("BOT_WRITE_BEHIND_ENABLED", "false") == "true"
+
+# Decoded media (e.g. PCM for audio media requests) is cached in this directory, which bots on the same node share.
+# The least recently used entries are removed once it holds more than MEDIA_CACHE_MAX_BYTES.
+MEDIA_CACHE_DIRECTORY = os.getenv("MEDIA_CACHE_DIRECTORY", os.path.join(tempfile.gettempdir(), "attendee_media_cache"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Synthesized speech is cached in memory in each bot, up to this many bytes, and optionally in object storage
+# (AWS_RECORDING_STORAGE_BUCKET_NAME), which all bots share.
+TEXT_TO_SPEECH_CACHE_MEMORY_MAX_BYTES = int(os.getenv("TEXT_TO_SPEECH_CACHE_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))
+TEXT_TO_SPEECH_CACHE_STORAGE_ENABLED = os.getenv("TEXT_TO_SPEECH_CACHE_STORAGE_ENABLED", "false") == "true"
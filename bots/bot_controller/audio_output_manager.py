@@ -1,91 +1,237 @@
+import logging
 import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-from bots.utils import mp3_to_pcm
+from django.db import connection
+from django.utils import timezone
+
+from bots.media_cache import get_pcm_for_media_blob
 
 from .text_to_speech import generate_audio_from_text
 
+logger = logging.getLogger(__name__)
+
+
+class PreparedAudio:
+    def __init__(self, audio_media_request, raw_audio_pcm_bytes):
+        self.audio_media_request = audio_media_request
+        self.raw_audio_pcm_bytes = raw_audio_pcm_bytes
+        # Monotonic clock times at which the audio's first sample plays, at which the audio sent so far will have
+        # played, and, once all of it has been sent, at which its last sample plays
+        self.started_at = None
+        self.sent_until = None
+        self.finishes_at = None
+        self.underrun_count = 0
+        # From the request's creation until its first frame was handed to the output
+        self.start_latency_ms = None
+
+    def playout_position_ms(self, now):
+        if self.started_at is None:
+            return 0
+        return max(min(now, self.sent_until) - self.started_at, 0) * 1000
+
 
 class AudioOutputManager:
+    """
+    Plays audio media requests through play_raw_audio_callback from a thread of its own. The audio is sent in
+    FRAME_MS frames, each one LOOKAHEAD_MS before it's due to play according to the monotonic clock, so timing
+    doesn't drift over long clips and playback stops within a frame. If a frame is sent after it was due, the
+    output ran dry (an underrun) and the schedule restarts from that moment.
+
+    Requests finish when the last of their audio has played, according to that schedule.
+    """
+
     SAMPLE_RATE = 44100
+    BYTES_PER_SAMPLE = 2
+    FRAME_MS = 20
+    LOOKAHEAD_MS = 60
+    # How many of the enqueued requests have their audio synthesized or decoded while the current one plays
+    PREFETCH_COUNT = 2
 
     def __init__(
         self,
         currently_playing_audio_media_request_finished_callback,
         play_raw_audio_callback,
     ):
-        self.currently_playing_audio_media_request = None
-        self.currently_playing_audio_media_request_started_at = None
-        self.currently_playing_audio_media_request_duration_ms = None
         self.currently_playing_audio_media_request_finished_callback = currently_playing_audio_media_request_finished_callback
         self.play_raw_audio_callback = play_raw_audio_callback
-        self.currently_playing_audio_media_request_raw_audio_pcm_bytes = None
         self.audio_thread = None
-        self.stop_audio_thread = False
+        self.stop_event = threading.Event()
+
+        self.lock = threading.Lock()
+        # The request that's playing, followed by any that the audio thread has already started right after it
+        self.playout = []
+        # Media request id to the future of its PreparedAudio, in the order they'll be played
+        self.prefetched_audio = OrderedDict()
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio_prefetch")
+
+    def prepare_audio(self, audio_media_request):
+        if audio_media_request.media_blob:
+            # Handle raw audio blob case
+            return PreparedAudio(audio_media_request, get_pcm_for_media_blob(audio_media_request.media_blob, sample_rate=self.SAMPLE_RATE))
+
+        # Handle text-to-speech case
+        audio_blob, _ = generate_audio_from_text(
+            text=audio_media_request.text_to_speak,
+            settings=audio_media_request.text_to_speech_settings,
+            sample_rate=self.SAMPLE_RATE,
+            bot=audio_media_request.bot,
+        )
+        return PreparedAudio(audio_media_request, audio_blob)
+
+    def _prefetch_audio(self, audio_media_request):
+        try:
+            return self.prepare_audio(audio_media_request)
+        finally:
+            # Don't keep a database connection open for this thread between prefetches
+            connection.close()
+
+    def prefetch_audio_media_requests(self, audio_media_requests):
+        """
+        Starts preparing the audio of the requests that will play next, in the order given, so each one can start
+        as soon as the one before it finishes. Preparation of requests that are no longer upcoming is cancelled.
+        """
+        with self.lock:
+            playing_ids = {prepared_audio.audio_media_request.id for prepared_audio in self.playout}
+            previously_prefetched_audio = self.prefetched_audio
+            self.prefetched_audio = OrderedDict()
+            for audio_media_request in audio_media_requests:
+                if len(self.prefetched_audio) >= self.PREFETCH_COUNT:
+                    break
+                if audio_media_request.id in playing_ids:
+                    continue
+                future = previously_prefetched_audio.pop(audio_media_request.id, None)
+                if future is None:
+                    future = self.prefetch_executor.submit(self._prefetch_audio, audio_media_request)
+                self.prefetched_audio[audio_media_request.id] = future
+
+        for future in previously_prefetched_audio.values():
+            future.cancel()
 
-    def _play_audio_chunks(self, audio_data, chunk_size):
-        for i in range(0, len(audio_data), chunk_size):
-            if self.stop_audio_thread:
-                break
-            chunk = audio_data[i : i + chunk_size]
-            self.play_raw_audio_callback(bytes=chunk, sample_rate=self.SAMPLE_RATE)
-            time.sleep(0.9)  # the chunk size is a second's worth of audio so we'll sleep for almost that much
+    def _take_next_prefetched_audio(self, starts_at):
+        """
+        Called by the audio thread when it has sent all of the current request's audio. Moves the next request's
+        audio into the playout if it's ready, so it plays without a gap.
+        """
+        with self.lock:
+            if not self.prefetched_audio or not self.playout or self.stop_event.is_set():
+                return None
+            media_request_id, future = next(iter(self.prefetched_audio.items()))
+            if not future.done() or future.cancelled() or future.exception():
+                # Left for start_playing_audio_media_request, which waits for it or reports the failure
+                return None
+            del self.prefetched_audio[media_request_id]
+            prepared_audio = future.result()
+            prepared_audio.started_at = prepared_audio.sent_until = starts_at
+            self.playout.append(prepared_audio)
+            return prepared_audio
+
+    def _play_audio_frames(self, prepared_audio):
+        bytes_per_second = self.SAMPLE_RATE * self.BYTES_PER_SAMPLE
+        frame_size = bytes_per_second * self.FRAME_MS // 1000
+        lookahead_seconds = self.LOOKAHEAD_MS / 1000
+
+        # When the next frame is due to play. The first frame plays as soon as it's sent.
+        next_frame_plays_at = prepared_audio.started_at = prepared_audio.sent_until = time.monotonic()
+        first_frame = True
+        while prepared_audio:
+            audio_data = prepared_audio.raw_audio_pcm_bytes
+            for offset in range(0, len(audio_data), frame_size):
+                timeout = next_frame_plays_at - lookahead_seconds - time.monotonic()
+                if timeout > 0:
+                    self.stop_event.wait(timeout)
+                if self.stop_event.is_set():
+                    return
+
+                now = time.monotonic()
+                if first_frame:
+                    first_frame = False
+                elif now > next_frame_plays_at:
+                    # Everything sent so far has already played, so this frame plays late
+                    prepared_audio.underrun_count += 1
+                    next_frame_plays_at = now
+
+                if offset == 0:
+                    self._record_start_latency(prepared_audio)
+                frame = audio_data[offset : offset + frame_size]
+                self.play_raw_audio_callback(bytes=frame, sample_rate=self.SAMPLE_RATE)
+                next_frame_plays_at += len(frame) / bytes_per_second
+                prepared_audio.sent_until = next_frame_plays_at
+
+            prepared_audio.finishes_at = next_frame_plays_at
+            prepared_audio = self._take_next_prefetched_audio(next_frame_plays_at)
+
+    def _record_start_latency(self, prepared_audio):
+        audio_media_request = prepared_audio.audio_media_request
+        prepared_audio.start_latency_ms = (timezone.now() - audio_media_request.created_at).total_seconds() * 1000
+        logger.info(f"Audio media request {audio_media_request.id} started playing {prepared_audio.start_latency_ms:.0f}ms after it was created")
 
     def _stop_audio_thread(self):
         """Stop the currently running audio thread if it exists."""
-        self.stop_audio_thread = True
+        self.stop_event.set()
         if self.audio_thread and self.audio_thread.is_alive():
             self.audio_thread.join()
-        self.stop_audio_thread = False
+        self.stop_event.clear()
 
     def start_playing_audio_media_request(self, audio_media_request):
+        with self.lock:
+            for prepared_audio in self.playout:
+                if prepared_audio.audio_media_request.id == audio_media_request.id:
+                    # The audio thread already started it when the previous request's audio ran out. Keep the
+                    # caller's instance, which has the request's current state.
+                    prepared_audio.audio_media_request = audio_media_request
+                    return
+            future = self.prefetched_audio.pop(audio_media_request.id, None)
+
         # Stop any existing audio playback
         self._stop_audio_thread()
 
-        if audio_media_request.media_blob:
-            # Handle raw audio blob case
-            self.currently_playing_audio_media_request_raw_audio_pcm_bytes = mp3_to_pcm(audio_media_request.media_blob.blob, sample_rate=self.SAMPLE_RATE)
-            self.currently_playing_audio_media_request_duration_ms = audio_media_request.media_blob.duration_ms
-        else:
-            # Handle text-to-speech case
-            audio_blob, duration_ms = generate_audio_from_text(
-                text=audio_media_request.text_to_speak,
-                settings=audio_media_request.text_to_speech_settings,
-                sample_rate=self.SAMPLE_RATE,
-                bot=audio_media_request.bot,
-            )
-            self.currently_playing_audio_media_request_raw_audio_pcm_bytes = audio_blob
-            self.currently_playing_audio_media_request_duration_ms = duration_ms
-
-        self.currently_playing_audio_media_request = audio_media_request
-        self.currently_playing_audio_media_request_started_at = time.time()
-
-        bytes_per_sample = 2
+        prepared_audio = future.result() if future else self.prepare_audio(audio_media_request)
+        prepared_audio.audio_media_request = audio_media_request
+        with self.lock:
+            self.playout = [prepared_audio]
+
         # Start audio playback in a new thread
-        self.audio_thread = threading.Thread(
-            target=self._play_audio_chunks,
-            args=(
-                self.currently_playing_audio_media_request_raw_audio_pcm_bytes,
-                self.SAMPLE_RATE * bytes_per_sample,
-            ),
-        )
+        self.audio_thread = threading.Thread(target=self._play_audio_frames, args=(prepared_audio,))
         self.audio_thread.start()
 
-    def currently_playing_audio_media_request_is_finished(self):
-        if not self.currently_playing_audio_media_request or not self.currently_playing_audio_media_request_started_at:
-            return False
-        elapsed_ms = (time.time() - self.currently_playing_audio_media_request_started_at) * 1000
-        if elapsed_ms > self.currently_playing_audio_media_request_duration_ms:
-            return True
-        return False
+    def playout_position_ms(self):
+        """
+        How far into the currently playing request's audio playback is.
+        """
+        with self.lock:
+            return self.playout[0].playout_position_ms(time.monotonic()) if self.playout else 0
+
+    def take_finished_audio_media_request(self):
+        with self.lock:
+            if not self.playout or self.playout[0].finishes_at is None or self.playout[0].finishes_at > time.monotonic():
+                return None, bool(self.playout)
+            # One at a time, so the request after it is still in the playout when the finished callback starts it
+            finished_audio = self.playout.pop(0)
+            more_audio_is_playing = bool(self.playout)
+
+        message = f"Finished playing audio media request {finished_audio.audio_media_request.id}: {finished_audio.playout_position_ms(finished_audio.finishes_at):.0f}ms of audio with {finished_audio.underrun_count} underruns"
+        if finished_audio.underrun_count:
+            logger.warning(message)
+        else:
+            logger.info(message)
+        return finished_audio.audio_media_request, more_audio_is_playing
 
     def clear_currently_playing_audio_media_request(self):
         self._stop_audio_thread()
-        self.currently_playing_audio_media_request = None
-        self.currently_playing_audio_media_request_started_at = None
+        with self.lock:
+            self.playout = []
+            prefetched_audio = self.prefetched_audio
+            self.prefetched_audio = OrderedDict()
+        for future in prefetched_audio.values():
+            future.cancel()
 
     def monitor_currently_playing_audio_media_request(self):
-        if self.currently_playing_audio_media_request_is_finished():
-            temp_currently_playing_audio_media_request = self.currently_playing_audio_media_request
-            self.clear_currently_playing_audio_media_request()
-            self.currently_playing_audio_media_request_finished_callback(temp_currently_playing_audio_media_request)
+        finished_audio_media_request, more_audio_is_playing = self.take_finished_audio_media_request()
+        if not finished_audio_media_request:
+            return
+        if not more_audio_is_playing:
+            self._stop_audio_thread()
+        self.currently_playing_audio_media_request_finished_callback(finished_audio_media_request)
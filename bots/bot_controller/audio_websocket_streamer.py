@@ -0,0 +1,207 @@
+import fcntl
+import logging
+import select
+import socket
+import struct
+import termios
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from websockets.exceptions import WebSocketException
+from websockets.sync.client import connect
+
+logger = logging.getLogger(__name__)
+
+# Each binary message is this header followed by 16 bit little endian mono PCM. The fields are the framing version,
+# three unused bytes, the id of the meeting audio stream the frame came from, the unix time in milliseconds at which
+# the bot received the frame and the sample rate, all unsigned.
+AUDIO_FRAME_HEADER = struct.Struct("<BxxxIQI")
+AUDIO_FRAME_VERSION = 1
+
+
+def encode_audio_frame(pcm_bytes, stream_id, timestamp_ms, sample_rate):
+    """
+    Raises struct.error if a header field doesn't fit in its type.
+    """
+    return AUDIO_FRAME_HEADER.pack(AUDIO_FRAME_VERSION, stream_id, timestamp_ms, sample_rate) + pcm_bytes
+
+
+def decode_audio_frame(message):
+    """
+    Returns the stream id, timestamp in milliseconds, sample rate and PCM of a message made by encode_audio_frame.
+    """
+    version, stream_id, timestamp_ms, sample_rate = AUDIO_FRAME_HEADER.unpack_from(message)
+    if version != AUDIO_FRAME_VERSION:
+        raise ValueError(f"Unsupported audio frame version {version}")
+    return stream_id, timestamp_ms, sample_rate, message[AUDIO_FRAME_HEADER.size :]
+
+
+def float32_to_pcm16(audio_bytes):
+    samples = np.clip(np.frombuffer(audio_bytes, dtype=np.float32), -1.0, 1.0)
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+class AudioWebsocketStreamer:
+    """
+    Forwards the meeting's audio to a websocket as it arrives, for voice agents. Frames are queued by the adapter's
+    thread and sent from a thread of its own. If the connection or the consumer can't keep up, frames are dropped
+    rather than sent late: a frame is only sent if, counting the time it was queued and the audio already waiting in
+    the socket's send buffer ahead of it, it will leave the bot within MAX_LATENCY_MS.
+    """
+
+    MAX_QUEUED_FRAMES = 100
+    MAX_LATENCY_MS = 100
+    RECONNECT_DELAY_SECONDS = 1
+    # Without a limit the kernel grows the socket's send buffer to megabytes, which would hold seconds of audio
+    # behind a slow consumer without the streamer ever seeing backpressure. This still covers a round trip of a
+    # few streams' audio on a distant link.
+    SEND_BUFFER_BYTES = 32 * 1024
+
+    def __init__(self, url):
+        self.url = url
+        self.websocket = None
+        self.sender_thread = None
+        self.stopped = False
+
+        self.condition = threading.Condition()
+        # Tuples of the monotonic time the frame was queued at, its unix timestamp in milliseconds, its float32
+        # audio, stream id and sample rate
+        self.frames = deque(maxlen=self.MAX_QUEUED_FRAMES)
+
+        self.sent_frame_count = 0
+        self.dropped_frame_count = 0
+        # Frames that couldn't be encoded, which are skipped so one bad frame doesn't stop the stream
+        self.invalid_frame_count = 0
+        self.total_latency_ms = 0
+        self.max_latency_ms = 0
+
+    def start(self):
+        self.sender_thread = threading.Thread(target=self._send_frames, name="audio_websocket_streamer", daemon=True)
+        self.sender_thread.start()
+
+    def add_audio_chunk(self, chunk_bytes, stream_id, sample_rate):
+        """
+        Queues float32 mono audio to be sent. Never blocks.
+        """
+        frame = (time.monotonic(), int(time.time() * 1000), chunk_bytes, stream_id, sample_rate)
+        with self.condition:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped_frame_count += 1
+            self.frames.append(frame)
+            self.condition.notify()
+
+    def _next_frame(self):
+        """
+        Waits for the next frame that can still be sent in time, or returns None once the streamer is stopped.
+        """
+        with self.condition:
+            while True:
+                self.condition.wait_for(lambda: self.frames or self.stopped)
+                if self.stopped:
+                    return None
+                frame = self.frames.popleft()
+                if (time.monotonic() - frame[0]) * 1000 <= self.MAX_LATENCY_MS:
+                    return frame
+                self.dropped_frame_count += 1
+
+    def _connect(self):
+        try:
+            # Compressing PCM saves little and costs latency
+            self.websocket = connect(self.url, compression=None, open_timeout=5, close_timeout=1)
+            self.websocket.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.SEND_BUFFER_BYTES)
+        except (OSError, WebSocketException) as e:
+            logger.warning(f"Could not connect to audio websocket {self.url}: {e}")
+            with self.condition:
+                self.condition.wait_for(lambda: self.stopped, timeout=self.RECONNECT_DELAY_SECONDS)
+            return False
+        logger.info(f"Connected to audio websocket {self.url}")
+        return True
+
+    def _unsent_bytes(self):
+        """
+        Returns how many bytes are waiting in the socket's send buffer, or 0 where the platform can't tell.
+        """
+        try:
+            return struct.unpack("i", fcntl.ioctl(self.websocket.socket.fileno(), termios.TIOCOUTQ, struct.pack("i", 0)))[0]
+        except (AttributeError, OSError):
+            return 0
+
+    def _encode_frame(self, frame):
+        """
+        Returns the message for the frame, or None if it can't be encoded, logging only the first such frame.
+        """
+        _, timestamp_ms, chunk_bytes, stream_id, sample_rate = frame
+        try:
+            if sample_rate <= 0:
+                raise ValueError(f"Invalid sample rate {sample_rate}")
+            return encode_audio_frame(float32_to_pcm16(chunk_bytes), stream_id, timestamp_ms, sample_rate)
+        except (struct.error, ValueError) as e:
+            if self.invalid_frame_count == 0:
+                logger.warning(f"Skipping audio frame for stream {stream_id} that can't be sent to audio websocket {self.url}: {e}")
+            self.invalid_frame_count += 1
+            return None
+
+    def _send_frame(self, frame, message):
+        """
+        Sends the frame if it can still leave the bot within MAX_LATENCY_MS. Returns the latency it was sent with, or
+        None if it was dropped.
+        """
+        queued_at, sample_rate = frame[0], frame[4]
+
+        # The audio already in the send buffer goes out first. It's counted as if it were all from this frame's stream,
+        # which overestimates the wait when several streams are sent, but never underestimates it.
+        send_buffer_ms = self._unsent_bytes() * 1000 / (2 * sample_rate)
+        remaining_ms = self.MAX_LATENCY_MS - (time.monotonic() - queued_at) * 1000 - send_buffer_ms
+        if remaining_ms <= 0:
+            return None
+        # Only blocks when the send buffer is full, in which case the frame is dropped once its deadline passes
+        _, writable, _ = select.select([], [self.websocket.socket], [], remaining_ms / 1000)
+        if not writable:
+            return None
+
+        self.websocket.send(message)
+        return (time.monotonic() - queued_at) * 1000 + send_buffer_ms
+
+    def _send_frames(self):
+        while not self.stopped:
+            if self.websocket is None and not self._connect():
+                continue
+
+            frame = self._next_frame()
+            if frame is None:
+                break
+
+            message = self._encode_frame(frame)
+            if message is None:
+                continue
+
+            try:
+                latency_ms = self._send_frame(frame, message)
+            except (OSError, WebSocketException) as e:
+                if not self.stopped:
+                    logger.warning(f"Audio websocket {self.url} disconnected: {e}")
+                self.websocket.close()
+                self.websocket = None
+                continue
+
+            if latency_ms is None:
+                self.dropped_frame_count += 1
+                continue
+            self.sent_frame_count += 1
+            self.total_latency_ms += latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        websocket = self.websocket
+        if websocket:
+            websocket.close()
+        if self.sender_thread:
+            self.sender_thread.join(timeout=5)
+
+        average_latency_ms = self.total_latency_ms / self.sent_frame_count if self.sent_frame_count else 0
+        logger.info(f"Streamed {self.sent_frame_count} audio frames to {self.url} and dropped {self.dropped_frame_count}, skipped {self.invalid_frame_count} that couldn't be encoded, latency was {average_latency_ms:.1f}ms on average and {self.max_latency_ms:.1f}ms at most")
@@ -3,11 +3,12 @@ import logging
 import os
 import signal
 import time
-import traceback
 
 import gi
 import redis
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import connection
 from django.utils import timezone
 
 from bots.bot_adapter import BotAdapter
@@ -23,24 +24,29 @@ from bots.models import (
     BotStates,
     Credentials,
     MeetingTypes,
-    Participant,
     Recording,
     RecordingFormats,
     RecordingManager,
     RecordingStates,
-    Utterance,
+    SpeakingTimeline,
+    bot_state_changed,
 )
 from bots.utils import meeting_type_from_url
+from bots.write_behind import WriteBehindQueue, WriteBehindRecordTypes, create_individual_audio_utterance, get_or_create_participant, upsert_closed_caption_utterances
 
 from .audio_output_manager import AudioOutputManager
+from .audio_websocket_streamer import AudioWebsocketStreamer
 from .automatic_leave_configuration import AutomaticLeaveConfiguration
 from .closed_caption_manager import ClosedCaptionManager
 from .file_uploader import FileUploader
 from .gstreamer_pipeline import GstreamerPipeline
 from .individual_audio_input_manager import IndividualAudioInputManager
+from .main_loop_timers import MainLoopTimers
 from .pipeline_configuration import PipelineConfiguration
+from .redis_command_coalescer import RedisCommandCoalescer
 from .rtmp_client import RTMPClient
 from .screen_and_audio_recorder import ScreenAndAudioRecorder
+from .speaking_timeline_manager import SpeakingTimelineManager
 
 gi.require_version("GLib", "2.0")
 from gi.repository import GLib
@@ -67,6 +73,8 @@ class BotController:
             should_create_debug_recording=self.bot_in_db.create_debug_recording(),
             start_recording_screen_callback=self.screen_and_audio_recorder.start_recording,
             stop_recording_screen_callback=self.screen_and_audio_recorder.stop_recording,
+            add_audio_stream_chunk_callback=self.get_add_audio_stream_chunk_callback(),
+            add_speaking_activity_callback=self.speaking_timeline_manager.add_audio_activity,
         )
 
     def get_teams_bot_adapter(self):
@@ -86,6 +94,8 @@ class BotController:
             should_create_debug_recording=self.bot_in_db.create_debug_recording(),
             start_recording_screen_callback=None,
             stop_recording_screen_callback=None,
+            add_audio_stream_chunk_callback=self.get_add_audio_stream_chunk_callback(),
+            add_speaking_activity_callback=self.speaking_timeline_manager.add_audio_activity,
         )
 
     def get_zoom_bot_adapter(self):
@@ -99,8 +109,15 @@ class BotController:
             start_recording_screen_callback=self.screen_and_audio_recorder.start_recording,
             stop_recording_screen_callback=self.screen_and_audio_recorder.stop_recording,
             automatic_leave_configuration=self.automatic_leave_configuration,
+            add_audio_stream_chunk_callback=self.get_add_audio_stream_chunk_callback(),
+            add_speaking_activity_callback=self.speaking_timeline_manager.add_audio_activity,
         )
 
+    def get_add_audio_stream_chunk_callback(self):
+        if self.audio_websocket_streamer:
+            return self.audio_websocket_streamer.add_audio_chunk
+        return None
+
     def get_meeting_type(self):
         meeting_type = meeting_type_from_url(self.bot_in_db.meeting_url)
         if meeting_type is None:
@@ -195,6 +212,8 @@ class BotController:
         termination_thread = threading.Thread(target=terminate_worker, daemon=True)
         termination_thread.start()
 
+        logger.info(f"Coalesced {self.redis_command_coalescer.coalesced_count} of the {self.redis_command_coalescer.received_count} commands received over Redis")
+
         if self.gstreamer_pipeline:
             logger.info("Telling gstreamer pipeline to cleanup...")
             self.gstreamer_pipeline.cleanup()
@@ -203,6 +222,10 @@ class BotController:
             logger.info("Telling rtmp client to cleanup...")
             self.rtmp_client.stop()
 
+        if self.audio_websocket_streamer:
+            logger.info("Telling audio websocket streamer to cleanup...")
+            self.audio_websocket_streamer.stop()
+
         if self.adapter:
             logger.info("Telling adapter to leave meeting...")
             self.adapter.leave()
@@ -244,8 +267,24 @@ class BotController:
 
         self.automatic_leave_configuration = AutomaticLeaveConfiguration()
 
+        # Identities that rarely change during a meeting, so the utterance save paths don't have to look them up every time.
+        # Cleared whenever the bot changes state, see on_bot_state_changed.
+        self.participant_ids_by_uuid = {}
+        self.recording_in_progress = None
+        # Recordings whose transcription state we've already set to in progress
+        self.recording_ids_with_transcription_in_progress = set()
+        bot_state_changed.connect(self.on_bot_state_changed)
+
+        # Set in run() if utterances should be written through the write-behind queue instead of directly to the database
+        self.write_behind_queue = None
+
+        # When this process last recorded a heartbeat, they're recorded at most once a minute
+        self.last_heartbeat_timestamp = None
+
         if self.bot_in_db.rtmp_destination_url():
             self.pipeline_configuration = PipelineConfiguration.rtmp_streaming_bot()
+        elif self.bot_in_db.websocket_audio_url():
+            self.pipeline_configuration = PipelineConfiguration.voice_agent()
         else:
             self.pipeline_configuration = PipelineConfiguration.recorder_bot()
 
@@ -295,18 +334,28 @@ class BotController:
         channel = f"bot_{self.bot_in_db.id}"
         pubsub.subscribe(channel)
 
+        if settings.BOT_WRITE_BEHIND_ENABLED:
+            self.write_behind_queue = WriteBehindQueue(redis_client)
+
         logger.info("RUNNED!")
 
+        self.main_loop_timers = MainLoopTimers(on_error_callback=self.cleanup, after_callback=self.release_idle_database_connection)
+        self.redis_command_coalescer = RedisCommandCoalescer(dispatch_command_callback=self.handle_redis_command)
+
         # Initialize core objects
+        self.speaking_timeline_manager = SpeakingTimelineManager(save_timelines_callback=self.save_speaking_timelines)
+
         # Only used for adapters that can provide per-participant audio
         self.individual_audio_input_manager = IndividualAudioInputManager(
             save_utterance_callback=self.save_individual_audio_utterance,
             get_participant_callback=self.get_participant,
+            chunks_added_callback=lambda: self.main_loop_timers.run_once("individual_audio_chunks", self.individual_audio_input_manager.process_chunks),
+            speaking_activity_callback=self.speaking_timeline_manager.add_audio_activity,
         )
 
         # Only used for adapters that can provide closed captions
         self.closed_caption_manager = ClosedCaptionManager(
-            save_utterance_callback=self.save_closed_caption_utterance,
+            save_utterances_callback=self.save_closed_caption_utterances,
             get_participant_callback=self.get_participant,
         )
 
@@ -315,6 +364,11 @@ class BotController:
             self.rtmp_client = RTMPClient(rtmp_url=self.bot_in_db.rtmp_destination_url())
             self.rtmp_client.start()
 
+        self.audio_websocket_streamer = None
+        if self.pipeline_configuration.websocket_stream_audio and self.bot_in_db.websocket_audio_url():
+            self.audio_websocket_streamer = AudioWebsocketStreamer(url=self.bot_in_db.websocket_audio_url())
+            self.audio_websocket_streamer.start()
+
         self.gstreamer_pipeline = None
         if self.should_create_gstreamer_pipeline():
             self.gstreamer_pipeline = GstreamerPipeline(
@@ -348,22 +402,29 @@ class BotController:
         import threading
 
         def redis_listener():
-            while True:
-                try:
-                    message = pubsub.get_message(timeout=1.0)
-                    if message:
-                        # Schedule Redis message handling in the main GLib loop
-                        GLib.idle_add(lambda: self.handle_redis_message(message))
-                except Exception as e:
-                    logger.info(f"Error in Redis listener: {e}")
-                    break
+            try:
+                # Blocks on the socket until a message arrives
+                for message in pubsub.listen():
+                    command = self.parse_redis_message(message)
+                    if command:
+                        # Handled in the main GLib loop, together with any duplicates that arrive shortly after
+                        self.redis_command_coalescer.add_command(command)
+            except Exception as e:
+                logger.info(f"Error in Redis listener: {e}")
 
         redis_thread = threading.Thread(target=redis_listener, daemon=True)
         redis_thread.start()
 
-        # Add timeout just for audio processing
-        self.first_timeout_call = True
-        GLib.timeout_add(100, self.on_main_loop_timeout)
+        # Each periodic task runs on its own timer, so a slow step in one of them doesn't delay the others
+        self.main_loop_timers.run_once("initial_action", self.take_initial_action)
+        self.main_loop_timers.add_timer("heartbeat", 5000, self.set_bot_heartbeat)
+        # Chunks are processed as they arrive, this only catches speakers that have gone silent
+        self.main_loop_timers.add_timer("individual_audio", 500, self.individual_audio_input_manager.process_chunks)
+        self.main_loop_timers.add_timer("captions", 1000, self.closed_caption_manager.process_captions)
+        self.main_loop_timers.add_timer("speaking_timelines", 10000, self.speaking_timeline_manager.save_changed_timelines)
+        self.main_loop_timers.add_timer("auto_leave", 1000, self.adapter.check_auto_leave_conditions)
+        self.main_loop_timers.add_timer("audio_output", 100, self.audio_output_manager.monitor_currently_playing_audio_media_request)
+        self.main_loop_timers.start_lag_monitor()
 
         # Add signal handlers so that when we get a SIGTERM or SIGINT, we can clean up the bot
         GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGTERM, self.handle_glib_shutdown)
@@ -402,14 +463,17 @@ class BotController:
 
     def take_action_based_on_audio_media_requests_in_db(self):
         media_type = BotMediaRequestMediaTypes.AUDIO
-        oldest_enqueued_media_request = self.bot_in_db.media_requests.filter(state=BotMediaRequestStates.ENQUEUED, media_type=media_type).order_by("created_at").first()
-        if not oldest_enqueued_media_request:
+        # The oldest request plays next, the ones after it are prepared in the background
+        enqueued_media_requests = list(self.bot_in_db.media_requests.filter(state=BotMediaRequestStates.ENQUEUED, media_type=media_type).order_by("created_at")[: AudioOutputManager.PREFETCH_COUNT + 1])
+        if not enqueued_media_requests:
             return
         currently_playing_media_request = self.bot_in_db.media_requests.filter(state=BotMediaRequestStates.PLAYING, media_type=media_type).first()
         if currently_playing_media_request:
             logger.info(f"Currently playing media request {currently_playing_media_request.id} so cannot play another media request")
+            self.audio_output_manager.prefetch_audio_media_requests(enqueued_media_requests)
             return
 
+        oldest_enqueued_media_request = enqueued_media_requests[0]
         try:
             BotMediaRequestManager.set_media_request_playing(oldest_enqueued_media_request)
             self.audio_output_manager.start_playing_audio_media_request(oldest_enqueued_media_request)
@@ -417,30 +481,30 @@ class BotController:
             logger.info(f"Error sending raw audio: {e}")
             BotMediaRequestManager.set_media_request_failed_to_play(oldest_enqueued_media_request)
 
+        self.audio_output_manager.prefetch_audio_media_requests(enqueued_media_requests[1:])
+
     def take_action_based_on_image_media_requests_in_db(self):
         media_type = BotMediaRequestMediaTypes.IMAGE
 
-        # Get all enqueued image media requests for this bot, ordered by creation time
-        enqueued_requests = self.bot_in_db.media_requests.filter(state=BotMediaRequestStates.ENQUEUED, media_type=media_type).order_by("created_at")
+        # Only the most recently created enqueued image is shown, the ones before it are superseded
+        enqueued_requests = self.bot_in_db.media_requests.filter(state=BotMediaRequestStates.ENQUEUED, media_type=media_type)
+        most_recent_request = enqueued_requests.order_by("-created_at", "-id").first()
 
-        if not enqueued_requests.exists():
+        if not most_recent_request:
             return
 
-        # Get the most recently created request
-        most_recent_request = enqueued_requests.last()
-
         # Mark the most recent request as FINISHED
         try:
             BotMediaRequestManager.set_media_request_playing(most_recent_request)
-            self.adapter.send_raw_image(most_recent_request.media_blob.blob)
+            # BinaryField values are memoryviews on Postgres
+            self.adapter.send_raw_image(bytes(most_recent_request.media_blob.blob))
             BotMediaRequestManager.set_media_request_finished(most_recent_request)
         except Exception as e:
             logger.info(f"Error sending raw image: {e}")
             BotMediaRequestManager.set_media_request_failed_to_play(most_recent_request)
 
-        # Mark all other enqueued requests as DROPPED
-        for request in enqueued_requests.exclude(id=most_recent_request.id):
-            BotMediaRequestManager.set_media_request_dropped(request)
+        # Mark all older enqueued requests as DROPPED. Ones created since the query above are left for the next sync.
+        BotMediaRequestManager.set_media_requests_dropped(enqueued_requests.filter(created_at__lte=most_recent_request.created_at).exclude(id=most_recent_request.id))
 
     def take_action_based_on_media_requests_in_db(self):
         self.take_action_based_on_audio_media_requests_in_db()
@@ -461,124 +525,114 @@ class BotController:
         self.cleanup()
         return False
 
-    def handle_redis_message(self, message):
+    def parse_redis_message(self, message):
         if message and message["type"] == "message":
             data = json.loads(message["data"].decode("utf-8"))
-            command = data.get("command")
-
-            if command == "sync":
-                logger.info(f"Syncing bot {self.bot_in_db.object_id}")
-                self.bot_in_db.refresh_from_db()
-                self.take_action_based_on_bot_in_db()
-            elif command == "sync_media_requests":
-                logger.info(f"Syncing media requests for bot {self.bot_in_db.object_id}")
-                self.bot_in_db.refresh_from_db()
-                self.take_action_based_on_media_requests_in_db()
-            else:
-                logger.info(f"Unknown command: {command}")
+            return data.get("command")
+        return None
+
+    def handle_redis_message(self, message):
+        command = self.parse_redis_message(message)
+        if command:
+            self.handle_redis_command(command)
+
+    def handle_redis_command(self, command):
+        if command == "sync":
+            logger.info(f"Syncing bot {self.bot_in_db.object_id}")
+            self.bot_in_db.refresh_from_db()
+            self.take_action_based_on_bot_in_db()
+        elif command == "sync_media_requests":
+            logger.info(f"Syncing media requests for bot {self.bot_in_db.object_id}")
+            self.bot_in_db.refresh_from_db()
+            self.take_action_based_on_media_requests_in_db()
+        else:
+            logger.info(f"Unknown command: {command}")
 
     def set_bot_heartbeat(self):
-        if self.bot_in_db.last_heartbeat_timestamp is None or self.bot_in_db.last_heartbeat_timestamp <= int(timezone.now().timestamp()) - 60:
+        current_timestamp = int(timezone.now().timestamp())
+        if self.last_heartbeat_timestamp is None or self.last_heartbeat_timestamp <= current_timestamp - 60:
             self.bot_in_db.set_heartbeat()
-
-    def on_main_loop_timeout(self):
-        try:
-            if self.first_timeout_call:
-                logger.info("First timeout call - taking initial action")
-                self.bot_in_db.refresh_from_db()
-                self.take_action_based_on_bot_in_db()
-                self.first_timeout_call = False
-
-            # Set heartbeat
-            self.set_bot_heartbeat()
-
-            # Process audio chunks
-            self.individual_audio_input_manager.process_chunks()
-
-            # Process captions
-            self.closed_caption_manager.process_captions()
-
-            # Check if auto-leave conditions are met
-            self.adapter.check_auto_leave_conditions()
-
-            # Process audio output
-            self.audio_output_manager.monitor_currently_playing_audio_media_request()
-            return True
-
-        except Exception as e:
-            logger.info(f"Error in timeout callback: {e}")
-            logger.info("Traceback:")
-            logger.info(traceback.format_exc())
-            self.cleanup()
-            return False
+            self.last_heartbeat_timestamp = current_timestamp
+
+    def take_initial_action(self):
+        logger.info("Taking initial action")
+        self.bot_in_db.refresh_from_db()
+        self.take_action_based_on_bot_in_db()
+        self.set_bot_heartbeat()
+
+    def release_idle_database_connection(self):
+        # In write-behind mode the database is only needed for the occasional state transition or media request,
+        # so don't hold on to a connection between them
+        if self.write_behind_queue:
+            connection.close()
+
+    def on_bot_state_changed(self, sender, bot, **kwargs):
+        if bot.id != self.bot_in_db.id:
+            return
+        # Recordings start and finish on state transitions, so whatever we cached may no longer be current
+        self.recording_in_progress = None
+        self.participant_ids_by_uuid = {}
 
     def get_recording_in_progress(self):
-        recordings_in_progress = Recording.objects.filter(bot=self.bot_in_db, state=RecordingStates.IN_PROGRESS)
-        if recordings_in_progress.count() == 0:
-            raise Exception("No recording in progress found")
-        if recordings_in_progress.count() > 1:
-            raise Exception(f"Expected at most one recording in progress for bot {self.bot_in_db.object_id}, but found {recordings_in_progress.count()}")
-        return recordings_in_progress.first()
+        if self.recording_in_progress:
+            return self.recording_in_progress
 
-    def save_closed_caption_utterance(self, message):
-        participant, _ = Participant.objects.get_or_create(
-            bot=self.bot_in_db,
-            uuid=message["participant_uuid"],
-            defaults={
-                "user_uuid": message["participant_user_uuid"],
-                "full_name": message["participant_full_name"],
-            },
-        )
+        # Fetch at most two rows in one query, that's enough to tell whether there is exactly one
+        recordings_in_progress = list(Recording.objects.filter(bot=self.bot_in_db, state=RecordingStates.IN_PROGRESS)[:2])
+        if len(recordings_in_progress) == 0:
+            raise Exception("No recording in progress found")
+        if len(recordings_in_progress) > 1:
+            raise Exception(f"Expected at most one recording in progress for bot {self.bot_in_db.object_id}, but found {Recording.objects.filter(bot=self.bot_in_db, state=RecordingStates.IN_PROGRESS).count()}")
+        self.recording_in_progress = recordings_in_progress[0]
+        return self.recording_in_progress
+
+    def get_participant_id(self, message):
+        """
+        Returns the id of the participant the message is from, creating the participant record if it doesn't exist
+        """
+        participant_id = self.participant_ids_by_uuid.get(message["participant_uuid"])
+        if participant_id is None:
+            participant = get_or_create_participant(self.bot_in_db.id, message)
+            participant_id = participant.id
+            self.participant_ids_by_uuid[participant.uuid] = participant_id
+        return participant_id
+
+    def set_recording_transcription_in_progress(self, recording):
+        if recording.id in self.recording_ids_with_transcription_in_progress:
+            return
+        RecordingManager.set_recording_transcription_in_progress(recording)
+        self.recording_ids_with_transcription_in_progress.add(recording.id)
 
-        # Create new utterance record
+    def save_closed_caption_utterances(self, messages):
         recording_in_progress = self.get_recording_in_progress()
-        source_uuid = f"{recording_in_progress.object_id}-{message['source_uuid_suffix']}"
-        utterance, _ = Utterance.objects.update_or_create(
-            recording=recording_in_progress,
-            source_uuid=source_uuid,
-            defaults={
-                "source": Utterance.Sources.CLOSED_CAPTION_FROM_PLATFORM,
-                "participant": participant,
-                "transcription": {"transcript": message["text"]},
-                "timestamp_ms": message["timestamp_ms"],
-                "duration_ms": message["duration_ms"],
-                "sample_rate": None,
-            },
-        )
 
-        RecordingManager.set_recording_transcription_in_progress(recording_in_progress)
+        if self.write_behind_queue:
+            self.write_behind_queue.append(WriteBehindRecordTypes.CLOSED_CAPTION_UTTERANCE, self.bot_in_db.id, recording_in_progress, messages)
+            return
 
-    def save_individual_audio_utterance(self, message):
-        from bots.tasks.process_utterance_task import process_utterance
+        upsert_closed_caption_utterances(recording_in_progress, [(message, self.get_participant_id(message)) for message in messages])
+        self.set_recording_transcription_in_progress(recording_in_progress)
 
+    def save_individual_audio_utterance(self, message):
         logger.info("Received message that new utterance was detected")
 
-        # Create participant record if it doesn't exist
-        participant, _ = Participant.objects.get_or_create(
-            bot=self.bot_in_db,
-            uuid=message["participant_uuid"],
-            defaults={
-                "user_uuid": message["participant_user_uuid"],
-                "full_name": message["participant_full_name"],
-            },
-        )
-
-        # Create new utterance record
         recording_in_progress = self.get_recording_in_progress()
-        utterance = Utterance.objects.create(
-            source=Utterance.Sources.PER_PARTICIPANT_AUDIO,
-            recording=recording_in_progress,
-            participant=participant,
-            audio_blob=message["audio_data"],
-            audio_format=Utterance.AudioFormat.PCM,
-            timestamp_ms=message["timestamp_ms"],
-            duration_ms=len(message["audio_data"]) / 64,
-            sample_rate=message["sample_rate"],
-        )
 
-        # Process the utterance immediately
-        process_utterance.delay(utterance.id)
-        return
+        if self.write_behind_queue:
+            self.write_behind_queue.append(WriteBehindRecordTypes.INDIVIDUAL_AUDIO_UTTERANCE, self.bot_in_db.id, recording_in_progress, [message])
+            return
+
+        # Create new utterance record and queue it for transcription, the participant and recording normally come from memory
+        create_individual_audio_utterance(recording_in_progress, self.get_participant_id(message), message)
+
+    def save_speaking_timelines(self, timelines):
+        for speaker_id, timeline in timelines:
+            participant = self.get_participant(speaker_id)
+            SpeakingTimeline.objects.update_or_create(
+                bot=self.bot_in_db,
+                speaker_id=str(speaker_id),
+                defaults={**timeline, "participant_id": self.get_participant_id(participant) if participant else None},
+            )
 
     def on_message_from_adapter(self, message):
         GLib.idle_add(lambda: self.take_action_based_on_message_from_adapter(message))
@@ -590,6 +644,9 @@ class BotController:
         if self.closed_caption_manager:
             logger.info("Flushing captions...")
             self.closed_caption_manager.flush_captions()
+        if self.speaking_timeline_manager:
+            logger.info("Saving speaking timelines...")
+            self.speaking_timeline_manager.save_changed_timelines()
 
     def save_debug_recording(self):
         # Only save if the file exists
@@ -1,36 +1,78 @@
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Captions are upserted once they've gone this long without changing, or this long after creation if they keep changing
+UPSERT_DELAY_SECONDS = 15
+# Captions that have been upserted and haven't changed in this long are dropped from memory
+EVICTION_DELAY_SECONDS = 60
+# How long to wait before trying again to upsert a caption whose participant isn't known yet
+PARTICIPANT_RETRY_DELAY_SECONDS = 1
 
 
 class CaptionEntry:
-    def __init__(self, caption_data: dict):
+    __slots__ = ("key", "caption_data", "created_at", "created_at_monotonic", "modified_at_monotonic", "last_upsert_to_db_at_monotonic", "schedule_id")
+
+    def __init__(self, key: str, caption_data: dict):
+        self.key = key
         self.caption_data = caption_data
-        self.created_at = datetime.utcnow()
-        self.modified_at = self.created_at
-        self.last_upsert_to_db_at: Optional[datetime] = None
+        # Wall clock time is only used for the utterance timestamp, all scheduling uses the monotonic clock
+        self.created_at = time.time()
+        self.created_at_monotonic = time.monotonic()
+        self.modified_at_monotonic = self.created_at_monotonic
+        self.last_upsert_to_db_at_monotonic: Optional[float] = None
+        # Identifies the entry's current item in the deadline heap, any other items for it are stale
+        self.schedule_id: Optional[int] = None
 
     def update(self, caption_data: dict):
         self.caption_data = caption_data
-        self.modified_at = datetime.utcnow()
+        self.modified_at_monotonic = time.monotonic()
+
+    def has_changes_to_upsert(self) -> bool:
+        return self.last_upsert_to_db_at_monotonic is None or self.modified_at_monotonic > self.last_upsert_to_db_at_monotonic
+
+    def next_deadline(self) -> float:
+        """
+        The monotonic time at which this entry next needs attention, either to be upserted or to be evicted.
+        """
+        # If never upserted to db, it's upserted a few seconds after creation
+        if self.last_upsert_to_db_at_monotonic is None:
+            return self.created_at_monotonic + UPSERT_DELAY_SECONDS
 
-    def should_upsert_to_db(self, should_flush=False) -> bool:
-        # If never upserted to db, and it's been at least a few seconds since creation
-        if not self.last_upsert_to_db_at:
-            return ((datetime.utcnow() - self.created_at) > timedelta(seconds=15)) or should_flush
+        # If modified since last upsert to db, it's upserted once it hasn't been updated recently
+        if self.modified_at_monotonic > self.last_upsert_to_db_at_monotonic:
+            return self.modified_at_monotonic + UPSERT_DELAY_SECONDS
 
-        # If modified since last upsert to db and hasn't been updated recently
-        return self.modified_at > self.last_upsert_to_db_at and (((datetime.utcnow() - self.modified_at) > timedelta(seconds=15)) or should_flush)
+        return self.modified_at_monotonic + EVICTION_DELAY_SECONDS
 
     def mark_upserted_to_db(self):
-        self.last_upsert_to_db_at = datetime.utcnow()
+        self.last_upsert_to_db_at_monotonic = time.monotonic()
 
 
 class ClosedCaptionManager:
-    def __init__(self, *, save_utterance_callback, get_participant_callback):
+    """
+    Keeps captions in memory while they are being edited and upserts them to the database once they settle.
+
+    Every entry has one current item in a min-heap keyed by the time it was scheduled to need attention. Most
+    updates only push an entry's deadline later, so they don't touch the heap; when an item comes due the entry's
+    actual deadline is recomputed and the item is pushed back if it isn't due yet. Only the first update after an
+    upsert can bring the deadline forward, and that update schedules a new item. Each tick therefore only looks
+    at captions that are due.
+    """
+
+    def __init__(self, *, save_utterances_callback, get_participant_callback):
         self.captions: Dict[str, CaptionEntry] = {}
-        self.save_utterance_callback = save_utterance_callback
+        self.deadlines: List[Tuple[float, int, CaptionEntry]] = []
+        # Breaks ties between equal deadlines so entries themselves are never compared
+        self.deadline_counter = itertools.count()
+        self.save_utterances_callback = save_utterances_callback
         self.get_participant_callback = get_participant_callback
 
+    def schedule(self, entry: CaptionEntry, deadline: Optional[float] = None):
+        entry.schedule_id = next(self.deadline_counter)
+        heapq.heappush(self.deadlines, (entry.next_deadline() if deadline is None else deadline, entry.schedule_id, entry))
+
     def upsert_caption(self, caption_data: dict):
         """
         Update or insert a caption into the in-memory store
@@ -39,39 +81,81 @@ class ClosedCaptionManager:
         device_id = caption_data["deviceId"]
         key = f"{device_id}:{caption_id}"
 
-        if key in self.captions:
-            self.captions[key].update(caption_data)
+        entry = self.captions.get(key)
+        if entry:
+            was_upserted = not entry.has_changes_to_upsert()
+            entry.update(caption_data)
+            # The entry was waiting to be evicted, it now needs to be upserted sooner than that
+            if was_upserted:
+                self.schedule(entry)
         else:
-            self.captions[key] = CaptionEntry(caption_data)
+            entry = CaptionEntry(key, caption_data)
+            self.captions[key] = entry
+            self.schedule(entry)
 
     def flush_captions(self):
         self.process_captions(should_flush=True)
 
     def process_captions(self, should_flush=False):
         """
-        Process captions that are ready to be upserted to the database
+        Process captions that are ready to be upserted to the database. All of them are saved with a single call to save_utterances_callback.
         """
-        for key, entry in list(self.captions.items()):
-            if entry.should_upsert_to_db(should_flush=should_flush):
-                device_id = entry.caption_data["deviceId"]
-                participant = self.get_participant_callback(device_id)
-
-                if participant:
-                    # Save as an utterance
-                    self.save_utterance_callback(
-                        {
-                            **participant,
-                            "timestamp_ms": int(entry.created_at.timestamp() * 1000),
-                            "duration_ms": int((entry.modified_at - entry.created_at).total_seconds() * 1000),
-                            "text": entry.caption_data.get("text", ""),
-                            "source_uuid_suffix": f"{entry.caption_data['deviceId']}-{entry.caption_data['captionId']}",
-                            "sample_rate": None,
-                        }
-                    )
-
-                    # Mark as upserted and remove if it hasn't been modified recently
-                    entry.mark_upserted_to_db()
-
-                    # If this caption hasn't been modified in a while, remove it from memory
-                    if (datetime.utcnow() - entry.modified_at) > timedelta(seconds=60):
-                        del self.captions[key]
+        utterances = []
+
+        if should_flush:
+            for entry in self.captions.values():
+                if entry.has_changes_to_upsert():
+                    self.upsert_entry(entry, utterances)
+            self.save_utterances(utterances)
+            return
+
+        now = time.monotonic()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, schedule_id, entry = heapq.heappop(self.deadlines)
+            # Skip entries that were evicted or rescheduled since this item was pushed
+            if entry.schedule_id != schedule_id or self.captions.get(entry.key) is not entry:
+                continue
+
+            if entry.next_deadline() > now:
+                self.schedule(entry)
+                continue
+
+            if entry.has_changes_to_upsert():
+                if self.upsert_entry(entry, utterances):
+                    self.schedule(entry)
+                else:
+                    self.schedule(entry, deadline=now + PARTICIPANT_RETRY_DELAY_SECONDS)
+            else:
+                # This caption hasn't been modified in a while, remove it from memory
+                del self.captions[entry.key]
+
+        self.save_utterances(utterances)
+
+    def save_utterances(self, utterances: List[dict]):
+        if utterances:
+            self.save_utterances_callback(utterances)
+
+    def upsert_entry(self, entry: CaptionEntry, utterances: List[dict]) -> bool:
+        """
+        Adds the caption to the utterances to save and marks it as upserted. Returns False if its participant isn't known yet.
+        """
+        device_id = entry.caption_data["deviceId"]
+        participant = self.get_participant_callback(device_id)
+
+        if not participant:
+            return False
+
+        # Save as an utterance
+        utterances.append(
+            {
+                **participant,
+                "timestamp_ms": int(entry.created_at * 1000),
+                "duration_ms": int((entry.modified_at_monotonic - entry.created_at_monotonic) * 1000),
+                "text": entry.caption_data.get("text", ""),
+                "source_uuid_suffix": f"{entry.caption_data['deviceId']}-{entry.caption_data['captionId']}",
+                "sample_rate": None,
+            }
+        )
+
+        entry.mark_upserted_to_db()
+        return True
@@ -16,11 +16,16 @@ def calculate_normalized_rms(audio_bytes):
 
 
 class IndividualAudioInputManager:
-    def __init__(self, *, save_utterance_callback, get_participant_callback):
+    def __init__(self, *, save_utterance_callback, get_participant_callback, chunks_added_callback=None, speaking_activity_callback=None):
         self.queue = queue.Queue()
 
         self.save_utterance_callback = save_utterance_callback
         self.get_participant_callback = get_participant_callback
+        # Called when chunks arrive and no call to process_chunks is pending, so they can be processed right away rather than on the next poll
+        self.chunks_added_callback = chunks_added_callback
+        self.processing_scheduled = False
+        # Called with each chunk's speaker, start, duration and whether it had speech in it
+        self.speaking_activity_callback = speaking_activity_callback
 
         self.utterances = {}
         self.sample_rate = 32000
@@ -34,8 +39,12 @@ class IndividualAudioInputManager:
 
     def add_chunk(self, speaker_id, chunk_time, chunk_bytes):
         self.queue.put((speaker_id, chunk_time, chunk_bytes))
+        if self.chunks_added_callback and not self.processing_scheduled:
+            self.processing_scheduled = True
+            self.chunks_added_callback()
 
     def process_chunks(self):
+        self.processing_scheduled = False
         while not self.queue.empty():
             speaker_id, chunk_time, chunk_bytes = self.queue.get()
             self.process_chunk(speaker_id, chunk_time, chunk_bytes)
@@ -60,6 +69,9 @@ class IndividualAudioInputManager:
     def process_chunk(self, speaker_id, chunk_time, chunk_bytes):
         audio_is_silent = self.silence_detected(chunk_bytes) if chunk_bytes else True
 
+        if chunk_bytes and self.speaking_activity_callback:
+            self.speaking_activity_callback(speaker_id, chunk_time.timestamp() * 1000, len(chunk_bytes) * 1000 / (2 * self.sample_rate), not audio_is_silent)
+
         # Initialize buffer and timing for new speaker
         if speaker_id not in self.utterances or len(self.utterances[speaker_id]) == 0:
             if audio_is_silent:
@@ -0,0 +1,108 @@
+import logging
+import time
+import traceback
+from typing import Callable, Dict, Optional
+
+import gi
+
+gi.require_version("GLib", "2.0")
+from gi.repository import GLib
+
+logger = logging.getLogger(__name__)
+
+
+class MainLoopTimer:
+    """
+    Keeps track of how late a timer fires. GLib schedules a timer's next run an interval after the current one started,
+    so a timer is late by however long the main loop was busy with something else when it came due.
+    """
+
+    __slots__ = ("name", "interval_seconds", "last_fired_at", "fire_count", "total_lag_seconds", "max_lag_seconds")
+
+    def __init__(self, name: str, interval_ms: int):
+        self.name = name
+        self.interval_seconds = interval_ms / 1000
+        self.last_fired_at: Optional[float] = None
+        self.reset_lag()
+
+    def reset_lag(self):
+        self.fire_count = 0
+        self.total_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def record_fire(self, now: float):
+        if self.last_fired_at is not None:
+            lag_seconds = max(now - self.last_fired_at - self.interval_seconds, 0.0)
+            self.fire_count += 1
+            self.total_lag_seconds += lag_seconds
+            self.max_lag_seconds = max(self.max_lag_seconds, lag_seconds)
+        self.last_fired_at = now
+
+
+class MainLoopTimers:
+    """
+    Runs each of the bot's periodic tasks on its own GLib timer, so a slow step in one of them (e.g. a database
+    write) doesn't hold up the others until the next shared tick. Also reports how late each timer fires, which
+    is how long the main loop was blocked.
+
+    If a task raises, on_error_callback is called and that task's timer is stopped.
+    """
+
+    LAG_REPORT_INTERVAL_SECONDS = 60
+    # Timers that fire this much later than they should are reported as warnings
+    LAG_WARNING_SECONDS = 0.5
+
+    def __init__(self, *, on_error_callback: Callable[[], None], after_callback: Optional[Callable[[], None]] = None):
+        self.on_error_callback = on_error_callback
+        self.after_callback = after_callback
+        self.timers: Dict[str, MainLoopTimer] = {}
+
+    def run_task(self, name: str, callback: Callable[[], None]) -> bool:
+        try:
+            callback()
+        except Exception as e:
+            logger.info(f"Error in {name} callback: {e}")
+            logger.info("Traceback:")
+            logger.info(traceback.format_exc())
+            self.on_error_callback()
+            return False
+
+        if self.after_callback:
+            self.after_callback()
+        return True
+
+    def add_timer(self, name: str, interval_ms: int, callback: Callable[[], None]):
+        timer = MainLoopTimer(name, interval_ms)
+        self.timers[name] = timer
+
+        def on_timeout():
+            timer.record_fire(time.monotonic())
+            return self.run_task(name, callback)
+
+        GLib.timeout_add(interval_ms, on_timeout)
+
+    def run_once(self, name: str, callback: Callable[[], None]):
+        """
+        Runs the callback on the main loop as soon as it's idle. Safe to call from other threads.
+        """
+
+        def on_idle():
+            self.run_task(name, callback)
+            return False
+
+        GLib.idle_add(on_idle)
+
+    def start_lag_monitor(self):
+        GLib.timeout_add_seconds(self.LAG_REPORT_INTERVAL_SECONDS, self.report_lag)
+
+    def report_lag(self) -> bool:
+        for timer in self.timers.values():
+            if timer.fire_count == 0:
+                continue
+            message = f"Main loop timer {timer.name} fired {timer.fire_count} times, on average {timer.total_lag_seconds / timer.fire_count * 1000:.1f}ms late and at most {timer.max_lag_seconds * 1000:.1f}ms late"
+            if timer.max_lag_seconds > self.LAG_WARNING_SECONDS:
+                logger.warning(message)
+            else:
+                logger.info(message)
+            timer.reset_lag()
+        return True
@@ -12,6 +12,7 @@ class PipelineConfiguration:
     transcribe_audio: bool
     rtmp_stream_audio: bool
     rtmp_stream_video: bool
+    websocket_stream_audio: bool
 
     def __post_init__(self):
         # Convert to FrozenSet of FrozenSet[str]
@@ -22,7 +23,7 @@ class PipelineConfiguration:
                 # RTMP streaming configuration
                 frozenset({"rtmp_stream_audio", "rtmp_stream_video", "transcribe_audio"}),
                 # Voice agent configuration
-                frozenset({"transcribe_audio"}),
+                frozenset({"transcribe_audio", "websocket_stream_audio"}),
             }
         )
 
@@ -41,6 +42,7 @@ class PipelineConfiguration:
             transcribe_audio=True,
             rtmp_stream_audio=False,
             rtmp_stream_video=False,
+            websocket_stream_audio=False,
         )
 
     @classmethod
@@ -51,6 +53,7 @@ class PipelineConfiguration:
             transcribe_audio=True,
             rtmp_stream_audio=True,
             rtmp_stream_video=True,
+            websocket_stream_audio=False,
         )
 
     @classmethod
@@ -61,4 +64,5 @@ class PipelineConfiguration:
             transcribe_audio=True,
             rtmp_stream_audio=False,
             rtmp_stream_video=False,
+            websocket_stream_audio=True,
         )
@@ -0,0 +1,57 @@
+import logging
+import threading
+from typing import Callable, Dict
+
+import gi
+
+gi.require_version("GLib", "2.0")
+from gi.repository import GLib
+
+logger = logging.getLogger(__name__)
+
+
+class RedisCommandCoalescer:
+    """
+    Collects the commands that arrive on a bot's Redis channel and hands them to the main loop in batches. Every
+    command makes the bot re-read its state from the database, so when the same command arrives several times
+    within COALESCE_WINDOW_MS, e.g. because of a burst of API calls, it's only dispatched once.
+
+    add_command can be called from any thread, commands are dispatched on the main loop.
+    """
+
+    COALESCE_WINDOW_MS = 100
+
+    def __init__(self, *, dispatch_command_callback: Callable[[str], None]):
+        self.dispatch_command_callback = dispatch_command_callback
+        self.lock = threading.Lock()
+        # Used as an ordered set, so commands are dispatched in the order they first arrived
+        self.pending_commands: Dict[str, None] = {}
+        self.dispatch_scheduled = False
+        self.received_count = 0
+        self.dispatched_count = 0
+
+    @property
+    def coalesced_count(self) -> int:
+        with self.lock:
+            return self.received_count - self.dispatched_count - len(self.pending_commands)
+
+    def add_command(self, command: str):
+        with self.lock:
+            self.received_count += 1
+            self.pending_commands[command] = None
+            if self.dispatch_scheduled:
+                return
+            self.dispatch_scheduled = True
+
+        GLib.timeout_add(self.COALESCE_WINDOW_MS, self.dispatch_pending_commands)
+
+    def dispatch_pending_commands(self) -> bool:
+        with self.lock:
+            commands = list(self.pending_commands)
+            self.pending_commands.clear()
+            self.dispatch_scheduled = False
+            self.dispatched_count += len(commands)
+
+        for command in commands:
+            self.dispatch_command_callback(command)
+        return False
@@ -0,0 +1,104 @@
+import threading
+
+import numpy as np
+
+# Audio quieter than this, as a fraction of full scale, is treated as silence. The same threshold as
+# IndividualAudioInputManager uses before running voice activity detection.
+SPEAKING_RMS_THRESHOLD = 0.01
+
+
+def float32_audio_is_speaking(audio_data):
+    if len(audio_data) == 0:
+        return False
+    return float(np.sqrt(np.mean(np.square(audio_data)))) >= SPEAKING_RMS_THRESHOLD
+
+
+class SpeakerTimeline:
+    """
+    When one speaker was speaking, as [start_ms, duration_ms] segments in order, with the totals kept up to date
+    as audio is added.
+
+    There are at most max_segments segments, so the timeline saved for a long meeting stays small. Past that, the two
+    segments with the shortest pause between them are merged, so the segments lose detail but speaking_ms stays exact.
+    """
+
+    def __init__(self, max_segments):
+        self.max_segments = max_segments
+        self.segments = []
+        self.speaking_ms = 0
+        self.changed = False
+
+    def merge_closest_segments(self):
+        gaps = [self.segments[index + 1][0] - (self.segments[index][0] + self.segments[index][1]) for index in range(len(self.segments) - 1)]
+        index = gaps.index(min(gaps))
+        next_segment = self.segments.pop(index + 1)
+        self.segments[index][1] = max(self.segments[index][1], next_segment[0] + next_segment[1] - self.segments[index][0])
+
+    def add_speech(self, start_ms, duration_ms, merge_gap_ms):
+        end_ms = start_ms + duration_ms
+        if self.segments:
+            last_segment = self.segments[-1]
+            last_end_ms = last_segment[0] + last_segment[1]
+            if start_ms - last_end_ms <= merge_gap_ms:
+                # A pause this short is part of the same turn, so it extends the last segment
+                if end_ms > last_end_ms:
+                    last_segment[1] = end_ms - last_segment[0]
+                    self.speaking_ms += end_ms - last_end_ms
+                    self.changed = True
+                return
+
+        self.segments.append([start_ms, duration_ms])
+        self.speaking_ms += duration_ms
+        self.changed = True
+        if len(self.segments) > self.max_segments:
+            self.merge_closest_segments()
+
+    def summary(self):
+        last_segment = self.segments[-1]
+        return {
+            "segments": [list(segment) for segment in self.segments],
+            "speaking_ms": self.speaking_ms,
+            "segment_count": len(self.segments),
+            "first_spoke_at_ms": self.segments[0][0],
+            "last_spoke_at_ms": last_segment[0] + last_segment[1],
+        }
+
+
+class SpeakingTimelineManager:
+    """
+    Keeps a speaking timeline for each speaker from the loudness of their audio, as it arrives. A speaker is a
+    participant for adapters that provide per-participant audio, otherwise one of the meeting's audio streams.
+
+    Audio can be added from any thread. save_changed_timelines passes the timelines that changed since it was last
+    called to save_timelines_callback, and is called periodically and when the meeting ends.
+    """
+
+    # Pauses up to this long don't split a speaker's turn into separate segments
+    MERGE_GAP_MS = 300
+    # Around an hour of one speaker taking short turns. Keeps each save of a timeline under ~20KB.
+    MAX_SEGMENTS_PER_SPEAKER = 1000
+
+    def __init__(self, *, save_timelines_callback):
+        self.save_timelines_callback = save_timelines_callback
+        self.lock = threading.Lock()
+        self.timelines = {}
+
+    def add_audio_activity(self, speaker_id, timestamp_ms, duration_ms, is_speaking):
+        if not is_speaking:
+            return
+        with self.lock:
+            timeline = self.timelines.get(speaker_id)
+            if timeline is None:
+                timeline = self.timelines[speaker_id] = SpeakerTimeline(max_segments=self.MAX_SEGMENTS_PER_SPEAKER)
+            timeline.add_speech(int(timestamp_ms), int(duration_ms), self.MERGE_GAP_MS)
+
+    def save_changed_timelines(self):
+        with self.lock:
+            changed_timelines = []
+            for speaker_id, timeline in self.timelines.items():
+                if timeline.changed:
+                    changed_timelines.append((speaker_id, timeline.summary()))
+                    timeline.changed = False
+
+        if changed_timelines:
+            self.save_timelines_callback(changed_timelines)
@@ -2,7 +2,18 @@ import json
 
 from google.cloud import texttospeech
 
+from bots.credentials_cache import credentials_cache
 from bots.models import Credentials
+from bots.text_to_speech_cache import text_to_speech_cache
+
+
+def create_google_tts_client(credentials_data):
+    try:
+        return texttospeech.TextToSpeechClient.from_service_account_info(json.loads(credentials_data.get("service_account_json", {})))
+    except (ValueError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid Google Text-to-Speech credentials format: " + str(e)) from e
+    except Exception as e:
+        raise ValueError("Failed to initialize Google Text-to-Speech client: " + str(e)) from e
 
 
 def generate_audio_from_text(bot, text, settings, sample_rate):
@@ -24,41 +35,39 @@ def generate_audio_from_text(bot, text, settings, sample_rate):
     """
 
     # Additional providers will be added, for now we only support Google TTS
-    google_tts_credentials = bot.project.credentials.filter(credential_type=Credentials.CredentialTypes.GOOGLE_TTS).first()
+    google_tts_credentials = credentials_cache.get_credentials(bot.project_id, Credentials.CredentialTypes.GOOGLE_TTS)
 
     if not google_tts_credentials:
         raise ValueError("Could not find Google Text-to-Speech credentials.")
 
-    try:
-        # Create client with credentials
-        client = texttospeech.TextToSpeechClient.from_service_account_info(json.loads(google_tts_credentials.get_credentials().get("service_account_json", {})))
-    except (ValueError, json.JSONDecodeError) as e:
-        raise ValueError("Invalid Google Text-to-Speech credentials format: " + str(e)) from e
-    except Exception as e:
-        raise ValueError("Failed to initialize Google Text-to-Speech client: " + str(e)) from e
-
-    # Set up text input
-    synthesis_input = texttospeech.SynthesisInput(text=text)
-
     # Get Google settings
     google_settings = settings.get("google", {})
     language_code = google_settings.get("voice_language_code")
     voice_name = google_settings.get("voice_name")
 
-    # Build voice parameters
-    voice = texttospeech.VoiceSelectionParams(language_code=language_code, name=voice_name)
+    def synthesize():
+        client = credentials_cache.get_client(google_tts_credentials, "google_tts", create_google_tts_client)
+
+        # Set up text input
+        synthesis_input = texttospeech.SynthesisInput(text=text)
+
+        # Build voice parameters
+        voice = texttospeech.VoiceSelectionParams(language_code=language_code, name=voice_name)
+
+        # Configure audio output as PCM (LINEAR16)
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+            sample_rate_hertz=sample_rate,
+        )
 
-    # Configure audio output as PCM (LINEAR16)
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.LINEAR16,
-        sample_rate_hertz=sample_rate,  # Using 8kHz sample rate
-    )
+        # Perform the text-to-speech request
+        response = client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
 
-    # Perform the text-to-speech request
-    response = client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
+        # Skip the WAV header (first 44 bytes) to get raw PCM data
+        return response.audio_content[44:]
 
-    # Skip the WAV header (first 44 bytes) to get raw PCM data
-    audio_content = response.audio_content[44:]
+    cache_key = text_to_speech_cache.key("google", text, {"voice_language_code": language_code, "voice_name": voice_name}, sample_rate)
+    audio_content = text_to_speech_cache.get_or_synthesize(cache_key, synthesize)
 
     # Calculate duration in milliseconds
     # For LINEAR16: 2 bytes per sample, sample_rate samples per second
@@ -19,6 +19,11 @@ urlpatterns = [
         bots_api_views.TranscriptView.as_view(),
         name="bot-transcript",
     ),
+    path(
+        "bots/<str:object_id>/speaking_timeline",
+        bots_api_views.SpeakingTimelineView.as_view(),
+        name="bot-speaking-timeline",
+    ),
     path(
         "bots/<str:object_id>/recording",
         bots_api_views.RecordingView.as_view(),
@@ -1,8 +1,6 @@
-import json
 import logging
 import os
 
-import redis
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 from drf_spectacular.utils import (
@@ -28,14 +26,17 @@ from .models import (
     MediaBlob,
     Recording,
     RecordingTypes,
+    SpeakingTimeline,
     TranscriptionProviders,
     TranscriptionTypes,
     Utterance,
 )
+from .redis_utils import publish_bot_commands
 from .serializers import (
     BotSerializer,
     CreateBotSerializer,
     RecordingSerializer,
+    SpeakingTimelineSerializer,
     SpeechSerializer,
     TranscriptUtteranceSerializer,
 )
@@ -113,11 +114,7 @@ class NotFoundView(APIView):
 
 
 def send_sync_command(bot, command="sync"):
-    redis_url = os.getenv("REDIS_URL") + ("?ssl_cert_reqs=none" if os.getenv("DISABLE_REDIS_SSL") else "")
-    redis_client = redis.from_url(redis_url)
-    channel = f"bot_{bot.id}"
-    message = {"command": command}
-    redis_client.publish(channel, json.dumps(message))
+    publish_bot_commands([bot.id], command)
 
 
 def launch_bot(bot):
@@ -183,11 +180,13 @@ class BotCreateView(APIView):
         bot_name = serializer.validated_data["bot_name"]
         transcription_settings = serializer.validated_data["transcription_settings"]
         rtmp_settings = serializer.validated_data["rtmp_settings"]
+        websocket_settings = serializer.validated_data["websocket_settings"]
         recording_settings = serializer.validated_data["recording_settings"]
         debug_settings = serializer.validated_data["debug_settings"]
         settings = {
             "transcription_settings": transcription_settings,
             "rtmp_settings": rtmp_settings,
+            "websocket_settings": websocket_settings,
             "recording_settings": recording_settings,
             "debug_settings": debug_settings,
         }
@@ -636,6 +635,70 @@ class TranscriptView(APIView):
             return Response({"error": "Bot not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+class SpeakingTimelineView(APIView):
+    authentication_classes = [ApiKeyAuthentication]
+
+    @extend_schema(
+        operation_id="Get Bot Speaking Timeline",
+        summary="Get how long each speaker has spoken for",
+        description="If the meeting is still in progress, this returns the speaking time so far, which is updated every few seconds. Speakers are participants where the meeting platform provides per-participant audio. The Google Meet, Teams and Zoom bots receive the meeting's audio as streams rather than per participant, so their timelines have a speaker_type of audio_stream and no speaker name, and the speaker_id is the stream's number, counting from 0 in the order the streams arrived. Google Meet plays whoever is loudest on each of its streams, so a stream isn't one participant, and Teams mixes the whole meeting into stream 0, so it has one timeline for everyone.",
+        responses={
+            200: OpenApiResponse(
+                response=SpeakingTimelineSerializer(many=True),
+                description="Speaking time of each speaker, with the most talkative first",
+            ),
+            404: OpenApiResponse(description="Bot not found"),
+        },
+        parameters=[
+            *TokenHeaderParameter,
+            OpenApiParameter(
+                name="object_id",
+                type=str,
+                location=OpenApiParameter.PATH,
+                description="Bot ID",
+                examples=[OpenApiExample("Bot ID Example", value="bot_xxxxxxxxxxx")],
+            ),
+            OpenApiParameter(
+                name="include_segments",
+                type=bool,
+                location=OpenApiParameter.QUERY,
+                description="Whether to include when each speaker was speaking, as [start_ms, duration_ms] pairs. Each speaker has at most 1000, in long meetings the closest ones are merged.",
+            ),
+        ],
+        tags=["Bots"],
+    )
+    def get(self, request, object_id):
+        try:
+            bot = Bot.objects.get(object_id=object_id, project=request.auth.project)
+        except Bot.DoesNotExist:
+            return Response({"error": "Bot not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        include_segments = request.query_params.get("include_segments", "").lower() == "true"
+        speaking_timelines = SpeakingTimeline.objects.select_related("participant").filter(bot=bot).order_by("-speaking_ms")
+        if not include_segments:
+            # The totals are stored with the timeline, so the segments don't need to be loaded
+            speaking_timelines = speaking_timelines.defer("segments")
+
+        speaking_timeline_data = []
+        for speaking_timeline in speaking_timelines:
+            data = {
+                "speaker_id": speaking_timeline.speaker_id,
+                "speaker_type": "participant" if speaking_timeline.participant_id else "audio_stream",
+                "speaker_name": speaking_timeline.participant.full_name if speaking_timeline.participant else None,
+                "speaker_uuid": speaking_timeline.participant.uuid if speaking_timeline.participant else None,
+                "speaking_ms": speaking_timeline.speaking_ms,
+                "segment_count": speaking_timeline.segment_count,
+                "first_spoke_at_ms": speaking_timeline.first_spoke_at_ms,
+                "last_spoke_at_ms": speaking_timeline.last_spoke_at_ms,
+            }
+            if include_segments:
+                data["segments"] = speaking_timeline.segments
+            speaking_timeline_data.append(data)
+
+        serializer = SpeakingTimelineSerializer(speaking_timeline_data, many=True)
+        return Response(serializer.data)
+
+
 class BotDetailView(APIView):
     authentication_classes = [ApiKeyAuthentication]
 
@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CachedCredentials:
+    def __init__(self, credentials_id, project_id, credential_type, updated_at, data):
+        self.credentials_id = credentials_id
+        self.project_id = project_id
+        self.credential_type = credential_type
+        self.updated_at = updated_at
+        self.data = data
+        self.cached_at = time.monotonic()
+
+    @property
+    def version_key(self):
+        """Identifies this exact version of the credentials. Changes whenever the credentials are re-saved."""
+        return (self.credentials_id, self.updated_at)
+
+
+class CredentialsCache:
+    """
+    Worker process level cache of decrypted credentials and the provider clients built from them.
+
+    Entries are keyed by project and credential type and are only reused while the credentials row's
+    updated_at matches the cached one, so a credential change in any process invalidates the cached
+    value everywhere on the next lookup. The check costs one narrow query that does not fetch or decrypt
+    the encrypted blob. Entries also expire after TTL_SECONDS so that deleted credentials and idle
+    clients don't live forever.
+    """
+
+    TTL_SECONDS = 300
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.credentials = {}
+        self.clients = {}
+
+    def get_credentials(self, project_id, credential_type):
+        """
+        Returns a CachedCredentials for the project and credential type, or None if the project has no such credentials.
+        """
+        from bots.models import Credentials
+
+        current_version = Credentials.objects.filter(project_id=project_id, credential_type=credential_type).values_list("id", "updated_at").first()
+        key = (project_id, credential_type)
+
+        if current_version is None:
+            self.invalidate(project_id, credential_type)
+            return None
+
+        with self.lock:
+            cached = self.credentials.get(key)
+        if cached and cached.version_key == tuple(current_version) and time.monotonic() - cached.cached_at < self.TTL_SECONDS:
+            return cached
+
+        credentials_record = Credentials.objects.filter(id=current_version[0]).first()
+        if credentials_record is None:
+            self.invalidate(project_id, credential_type)
+            return None
+
+        cached = CachedCredentials(
+            credentials_id=credentials_record.id,
+            project_id=project_id,
+            credential_type=credential_type,
+            updated_at=credentials_record.updated_at,
+            data=credentials_record.get_credentials(),
+        )
+        with self.lock:
+            # Drop anything built from an older version of these credentials
+            self.clients = {client_key: client for client_key, client in self.clients.items() if client_key[0] != key}
+            self.credentials[key] = cached
+        return cached
+
+    def get_client(self, cached_credentials, client_name, factory):
+        """
+        Returns a provider client built from the cached credentials, creating it with factory(credentials_data) on first use.
+        Clients are reused for as long as the credentials they were built from are current.
+        """
+        key = (cached_credentials.project_id, cached_credentials.credential_type)
+        client_key = (key, client_name, cached_credentials.version_key)
+
+        with self.lock:
+            if client_key in self.clients:
+                return self.clients[client_key]
+
+        client = factory(cached_credentials.data)
+
+        with self.lock:
+            return self.clients.setdefault(client_key, client)
+
+    def invalidate(self, project_id, credential_type):
+        key = (project_id, credential_type)
+        with self.lock:
+            self.credentials.pop(key, None)
+            self.clients = {client_key: client for client_key, client in self.clients.items() if client_key[0] != key}
+
+    def clear(self):
+        with self.lock:
+            self.credentials.clear()
+            self.clients.clear()
+
+
+credentials_cache = CredentialsCache()
@@ -0,0 +1,78 @@
+import logging
+
+import redis
+
+from bots.redis_utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class BotHeartbeatStore:
+    """
+    Keeps bot heartbeats in Redis sorted sets of bot id to unix timestamp, one for the first heartbeat and one for
+    the latest. Heartbeats are written here instead of to the bot's row, so they don't bump the bot's version and
+    race with state changes. The timestamps are copied to the row when the bot changes state.
+    """
+
+    FIRST_HEARTBEATS_KEY = "bot_heartbeats:first"
+    LAST_HEARTBEATS_KEY = "bot_heartbeats:last"
+    # Where terminate_bots_with_heartbeat_timeout's pass through the bots without heartbeats in Redis got to
+    ROW_FALLBACK_CURSOR_KEY = "bot_heartbeats:row_fallback_cursor"
+
+    def __init__(self, redis_client=None):
+        self._redis_client = redis_client
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = get_redis_client()
+        return self._redis_client
+
+    def record(self, bot_id, timestamp):
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.zadd(self.FIRST_HEARTBEATS_KEY, {bot_id: timestamp}, nx=True)
+        pipeline.zadd(self.LAST_HEARTBEATS_KEY, {bot_id: timestamp})
+        pipeline.execute()
+
+    def get(self, bot_id):
+        """
+        Returns the first and last heartbeat timestamps for the bot, or (None, None) if there are none. Raises
+        redis.RedisError if Redis can't be reached, so callers can tell that apart from a bot with no heartbeats.
+        """
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.zscore(self.FIRST_HEARTBEATS_KEY, bot_id)
+        pipeline.zscore(self.LAST_HEARTBEATS_KEY, bot_id)
+        first_timestamp, last_timestamp = pipeline.execute()
+
+        if first_timestamp is None or last_timestamp is None:
+            return None, None
+        return int(first_timestamp), int(last_timestamp)
+
+    def remove(self, *bot_ids):
+        if not bot_ids:
+            return
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            pipeline.zrem(self.FIRST_HEARTBEATS_KEY, *bot_ids)
+            pipeline.zrem(self.LAST_HEARTBEATS_KEY, *bot_ids)
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to remove heartbeats for bots {bot_ids} from Redis: {e}")
+
+    def get_bot_ids_with_last_heartbeat_before(self, timestamp):
+        return [int(bot_id) for bot_id in self.redis_client.zrangebyscore(self.LAST_HEARTBEATS_KEY, "-inf", f"({timestamp}")]
+
+    def get_bot_ids_without_heartbeats(self, bot_ids):
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for bot_id in bot_ids:
+            pipeline.zscore(self.LAST_HEARTBEATS_KEY, bot_id)
+        return [bot_id for bot_id, last_timestamp in zip(bot_ids, pipeline.execute()) if last_timestamp is None]
+
+    def get_row_fallback_cursor(self):
+        return int(self.redis_client.get(self.ROW_FALLBACK_CURSOR_KEY) or 0)
+
+    def set_row_fallback_cursor(self, bot_id):
+        self.redis_client.set(self.ROW_FALLBACK_CURSOR_KEY, bot_id)
+
+
+bot_heartbeat_store = BotHeartbeatStore()
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bots.models import Recording, RetranscriptionManager
+from bots.tasks.retranscribe_recording_task import retranscribe_recording
+
+
+class Command(BaseCommand):
+    help = "Re-transcribes a finished recording from its recording file. The new transcript replaces the current one once every chunk is done. The file has the mixed meeting audio, so crosstalk can end up in the utterances of whoever was speaking."
+
+    def add_arguments(self, parser):
+        parser.add_argument("recording_object_id", help="Object ID of the recording, e.g. rec_...")
+        parser.add_argument("--transcription-settings", default="{}", help='Transcription settings to use instead of the bot\'s, e.g. \'{"deepgram": {"language": "es"}}\'')
+
+    def handle(self, *args, **options):
+        try:
+            recording = Recording.objects.get(object_id=options["recording_object_id"])
+        except Recording.DoesNotExist:
+            raise CommandError(f"Recording {options['recording_object_id']} not found")
+
+        try:
+            retranscription = RetranscriptionManager.create_retranscription(recording, json.loads(options["transcription_settings"]))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        retranscribe_recording.delay(retranscription.id)
+        self.stdout.write(f"Started retranscription {retranscription.object_id}")
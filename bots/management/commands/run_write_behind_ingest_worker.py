@@ -0,0 +1,31 @@
+import logging
+import os
+import socket
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bots.write_behind import WriteBehindIngester
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Writes the records that bots in write-behind mode append to the Redis stream to the database"
+
+    def handle(self, *args, **options):
+        redis_client = redis.from_url(settings.REDIS_CELERY_URL)
+        ingester = WriteBehindIngester(redis_client, consumer_name=f"{socket.gethostname()}-{os.getpid()}")
+        ingester.ensure_consumer_group()
+
+        logger.info(f"Write-behind ingest worker {ingester.consumer_name} started")
+        while True:
+            try:
+                num_records = ingester.ingest_batch(block_ms=1000)
+                if num_records:
+                    logger.info(f"Wrote {num_records} write-behind records")
+            except redis.exceptions.ConnectionError as e:
+                logger.error(f"Lost connection to Redis: {e}")
+                time.sleep(1)
@@ -2,10 +2,10 @@ import logging
 import os
 
 from django.core.management.base import BaseCommand
-from django.db import models
 from django.utils import timezone
 from kubernetes import client, config
 
+from bots.heartbeat_store import bot_heartbeat_store
 from bots.models import Bot, BotEventManager, BotEventSubTypes, BotEventTypes
 
 logger = logging.getLogger(__name__)
@@ -14,6 +14,8 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = "Terminates bots that have not sent a heartbeat in the last ten minutes"
 
+    ROW_FALLBACK_BATCH_SIZE = 500
+
     def __init__(self):
         super().__init__()
         self.namespace = "attendee"
@@ -54,18 +56,33 @@ class Command(BaseCommand):
             if pod_error.status != 404:
                 logger.warning(f"Error deleting pod {pod_name}: {str(pod_error)}")
 
+    def get_stale_bot_ids_without_heartbeats_in_redis(self, before_timestamp):
+        """
+        Bots that Redis has no heartbeats for, e.g. because it lost its data, fall back to the timestamps in their
+        row. Each pass only checks the next ROW_FALLBACK_BATCH_SIZE running bots with a stale row timestamp, in id
+        order, so the query and the Redis lookups stay bounded however many bots are running.
+        """
+        after_bot_id = bot_heartbeat_store.get_row_fallback_cursor()
+        candidate_bot_ids = list(Bot.objects.filter(id__gt=after_bot_id, last_heartbeat_timestamp__lt=before_timestamp).exclude(state__in=BotEventManager.TERMINAL_STATES).order_by("id").values_list("id", flat=True)[: self.ROW_FALLBACK_BATCH_SIZE])
+        # Start over from the first bot once the last one has been checked
+        bot_heartbeat_store.set_row_fallback_cursor(candidate_bot_ids[-1] if len(candidate_bot_ids) == self.ROW_FALLBACK_BATCH_SIZE else 0)
+        return bot_heartbeat_store.get_bot_ids_without_heartbeats(candidate_bot_ids)
+
     def handle(self, *args, **options):
         logger.info("Terminating bots with heartbeat timeout...")
 
         try:
             ten_minutes_ago_timestamp = int(timezone.now().timestamp() - 600)
 
-            # Find non-terminal bots where:
-            # - last heartbeat is over 10 minutes ago
-            heartbeat_timeout_q_filter = models.Q(last_heartbeat_timestamp__isnull=False) & models.Q(last_heartbeat_timestamp__lt=ten_minutes_ago_timestamp)
-            problem_bots = Bot.objects.filter(~BotEventManager.get_terminal_states_q_filter() & heartbeat_timeout_q_filter)
+            # Bots whose last heartbeat in Redis is over 10 minutes ago
+            stale_bot_ids = bot_heartbeat_store.get_bot_ids_with_last_heartbeat_before(ten_minutes_ago_timestamp)
+            stale_row_bot_ids = self.get_stale_bot_ids_without_heartbeats_in_redis(ten_minutes_ago_timestamp)
+            problem_bots = list(Bot.objects.filter(id__in=stale_bot_ids + stale_row_bot_ids).exclude(BotEventManager.get_terminal_states_q_filter()))
+
+            # Stale heartbeats of bots that already ended without removing them
+            bot_heartbeat_store.remove(*(set(stale_bot_ids) - {bot.id for bot in problem_bots}))
 
-            logger.info(f"Found {problem_bots.count()} bots with heartbeat timeout")
+            logger.info(f"Found {len(problem_bots)} bots with heartbeat timeout")
 
             # Create fatal error events for each bot
             for bot in problem_bots:
@@ -0,0 +1,12 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from bots.text_to_speech_cache import text_to_speech_cache
+
+
+class Command(BaseCommand):
+    help = "Prints the text to speech cache's hit and miss counts across all bots"
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(text_to_speech_cache.get_metrics()))
@@ -0,0 +1,21 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from bots.models import TranscriptionProviders
+from bots.transcription_limiter import transcription_limiter
+
+
+class Command(BaseCommand):
+    help = "Prints transcription concurrency, queue depth and wait time metrics for every project with recent transcription activity"
+
+    def handle(self, *args, **options):
+        for provider in TranscriptionProviders:
+            provider_code = TranscriptionProviders.provider_to_api_code(provider)
+            project_ids = set()
+            for key in transcription_limiter.redis_client.scan_iter(match=f"transcription_limiter:{provider_code}:*:stats"):
+                project_ids.add(key.decode().split(":")[2])
+
+            for project_id in sorted(project_ids):
+                metrics = transcription_limiter.get_metrics(project_id, provider)
+                self.stdout.write(json.dumps({"project_id": project_id, "provider": provider_code, **metrics}))
@@ -0,0 +1,97 @@
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+
+from bots.utils import mp3_to_pcm
+
+logger = logging.getLogger(__name__)
+
+
+class MediaCache:
+    """
+    A size bounded cache of files in a directory on local disk, for media that's expensive to produce (e.g. PCM
+    decoded from an MP3) and gets reused by many bots. All bot processes on a node share the directory.
+
+    Entries are written to a temporary file and renamed into place, so readers never see a partial entry, and
+    concurrent writers of the same key just replace each other's identical file. Reading an entry touches its
+    modification time, and when the directory grows past max_bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path_for_key(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self.path_for_key(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Failed to read {key} from the media cache: {e}")
+            return None
+        return data
+
+    def put(self, key, data):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            try:
+                with os.fdopen(file_descriptor, "wb") as file:
+                    file.write(data)
+                os.replace(temporary_path, self.path_for_key(key))
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+            self.evict()
+        except OSError as e:
+            logger.warning(f"Failed to write {key} to the media cache: {e}")
+
+    def get_or_create(self, key, create):
+        data = self.get(key)
+        if data is None:
+            data = create()
+            self.put(key, data)
+        return data
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+
+media_cache = MediaCache(settings.MEDIA_CACHE_DIRECTORY, settings.MEDIA_CACHE_MAX_BYTES)
+
+
+def get_pcm_for_media_blob(media_blob, sample_rate):
+    """
+    Returns the blob's audio as mono 16 bit PCM at the given sample rate, decoding it only if no bot on this node
+    has done so already.
+    """
+    return media_cache.get_or_create(
+        f"{media_blob.checksum}-{sample_rate}.pcm",
+        lambda: mp3_to_pcm(media_blob.blob, sample_rate=sample_rate),
+    )
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:08
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_pending_transcription_count(apps, schema_editor):
+    Recording = apps.get_model("bots", "Recording")
+    Utterance = apps.get_model("bots", "Utterance")
+
+    pending_utterances = Utterance.objects.filter(recording=OuterRef("pk"), transcription__isnull=True).order_by().values("recording").annotate(count=Count("id")).values("count")
+    Recording.objects.update(pending_transcription_count=Coalesce(Subquery(pending_utterances, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0020_credittransaction_stripe_payment_intent_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='pending_transcription_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_pending_transcription_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0021_recording_pending_transcription_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Retranscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.IntegerField(choices=[(1, 'Not Started'), (2, 'In Progress'), (3, 'Complete'), (4, 'Failed')], default=1)),
+                ('transcription_settings', models.JSONField(default=dict)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('completed_chunk_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('object_id', models.CharField(editable=False, max_length=32, unique=True)),
+                ('recording', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='retranscriptions', to='bots.recording')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RetranscribedUtterance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transcription', models.JSONField()),
+                ('previous_transcription', models.JSONField(default=None, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('utterance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='retranscribed_utterances', to='bots.utterance')),
+                ('retranscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='retranscribed_utterances', to='bots.retranscription')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('retranscription', 'utterance'), name='unique_retranscribed_utterance')],
+            },
+        ),
+    ]
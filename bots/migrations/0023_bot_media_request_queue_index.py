@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0022_retranscription'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='botmediarequest',
+            index=models.Index(fields=['bot', 'media_type', 'state', 'created_at'], name='bot_media_request_queue_idx'),
+        ),
+    ]
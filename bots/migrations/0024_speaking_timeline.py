@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bots", "0023_bot_media_request_queue_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpeakingTimeline",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("speaker_id", models.CharField(max_length=255)),
+                ("segments", models.JSONField(default=list)),
+                ("speaking_ms", models.BigIntegerField(default=0)),
+                ("segment_count", models.IntegerField(default=0)),
+                ("first_spoke_at_ms", models.BigIntegerField(blank=True, null=True)),
+                ("last_spoke_at_ms", models.BigIntegerField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("bot", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="speaking_timelines", to="bots.bot")),
+                ("participant", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="speaking_timelines", to="bots.participant")),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("bot", "speaker_id"), name="unique_speaking_timeline_per_speaker")],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-19 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bots", "0024_speaking_timeline"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="retranscription",
+            name="completed_chunk_count",
+        ),
+        migrations.AddField(
+            model_name="retranscription",
+            name="completed_chunk_indexes",
+            field=models.JSONField(default=list),
+        ),
+    ]
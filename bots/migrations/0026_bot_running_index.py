@@ -0,0 +1,16 @@
+# Generated by Django 5.1.2 on 2026-10-19 04:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bots", "0025_retranscription_completed_chunk_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="bot",
+            index=models.Index(condition=models.Q(("state__in", [7, 9]), _negated=True), fields=["id"], name="bot_running_idx"),
+        ),
+    ]
@@ -1,27 +1,58 @@
 import hashlib
 import json
+import logging
 import math
 import random
 import secrets
 import string
+import time
 
+import redis
 from concurrency.exceptions import RecordModifiedError
 from concurrency.fields import IntegerVersionField
 from cryptography.fernet import Fernet, InvalidToken
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import F, Q, QuerySet
 from django.db.utils import IntegrityError
+from django.dispatch import Signal
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 
 from accounts.models import Organization
+from bots.heartbeat_store import bot_heartbeat_store
 from bots.webhook_utils import trigger_webhook
 
+logger = logging.getLogger(__name__)
+
 # Create your models here.
 
 
+def update_if_unchanged(instance: models.Model, expected_values: dict, **values) -> None:
+    """
+    Writes values to the instance's row with a single UPDATE, but only if the row still has expected_values. Versioned
+    models get a new version in the same statement, so anyone holding a stale copy of the row can't save over the change.
+
+    Raises RecordModifiedError, and leaves the instance unchanged, if the row no longer has expected_values.
+    """
+    model = type(instance)
+    if any(field.name == "updated_at" for field in model._meta.concrete_fields):
+        values.setdefault("updated_at", timezone.now())
+    concurrency_meta = getattr(model, "_concurrencymeta", None)
+    if concurrency_meta is not None:
+        # Microseconds since the epoch, like IntegerVersionField's own versions, but always above the current one
+        version_attname = concurrency_meta.field.attname
+        values[version_attname] = max(int(getattr(instance, version_attname) or 0) + 1, time.time_ns() // 1000)
+
+    num_updated = model.objects.filter(pk=instance.pk, **expected_values).update(**values)
+    if num_updated == 0:
+        raise RecordModifiedError(f"{model.__name__} {instance.pk} no longer has {expected_values}", target=instance)
+
+    for name, value in values.items():
+        setattr(instance, name, value)
+
+
 class Project(models.Model):
     name = models.CharField(max_length=255)
     organization = models.ForeignKey(Organization, on_delete=models.PROTECT, related_name="projects")
@@ -146,23 +177,28 @@ class Bot(models.Model):
     first_heartbeat_timestamp = models.IntegerField(null=True, blank=True)
     last_heartbeat_timestamp = models.IntegerField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # For going through the bots that haven't ended, which are few compared to the ones that have
+            models.Index(fields=["id"], name="bot_running_idx", condition=~Q(state__in=[BotStates.FATAL_ERROR, BotStates.ENDED])),
+        ]
+
     def set_heartbeat(self):
-        retry_count = 0
-        max_retries = 10
-        while retry_count < max_retries:
-            try:
-                self.refresh_from_db()
-                current_timestamp = int(timezone.now().timestamp())
-                if self.first_heartbeat_timestamp is None:
-                    self.first_heartbeat_timestamp = current_timestamp
-                self.last_heartbeat_timestamp = current_timestamp
-                self.save()
-                return
-            except RecordModifiedError:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    raise
-                continue
+        """
+        Records a heartbeat in Redis. The row's heartbeat timestamps are only updated when the bot changes state, see apply_heartbeat.
+        """
+        bot_heartbeat_store.record(self.id, int(timezone.now().timestamp()))
+
+    def apply_heartbeat(self, first_timestamp, last_timestamp):
+        """
+        Copies heartbeats read from Redis onto the instance, so they're written with its next state change.
+        """
+        if first_timestamp is None:
+            return
+        if self.first_heartbeat_timestamp is None or first_timestamp < self.first_heartbeat_timestamp:
+            self.first_heartbeat_timestamp = first_timestamp
+        if self.last_heartbeat_timestamp is None or last_timestamp > self.last_heartbeat_timestamp:
+            self.last_heartbeat_timestamp = last_timestamp
 
     def centicredits_consumed(self) -> int:
         if self.first_heartbeat_timestamp is None or self.last_heartbeat_timestamp is None:
@@ -201,6 +237,10 @@ class Bot(models.Model):
 
         return f"{destination_url}/{stream_key}"
 
+    def websocket_audio_url(self):
+        websocket_settings = self.settings.get("websocket_settings") or {}
+        return (websocket_settings.get("audio") or {}).get("url")
+
     def recording_format(self):
         recording_settings = self.settings.get("recording_settings", {})
         if recording_settings is None:
@@ -468,9 +508,16 @@ class BotEvent(models.Model):
         ]
 
 
+# Sent once a bot state transition has been committed, with the bot, old_state, new_state and event as arguments
+bot_state_changed = Signal()
+
+
 class BotEventManager:
     TERMINAL_STATES = [BotStates.FATAL_ERROR, BotStates.ENDED]
 
+    # State transitions that hold the bot's row lock for longer than this are logged as warnings
+    LOCK_HOLD_WARNING_SECONDS = 0.5
+
     # Define valid state transitions for each event type
     VALID_TRANSITIONS = {
         BotEventTypes.JOIN_REQUESTED: {
@@ -553,8 +600,7 @@ class BotEventManager:
         if last_bot_event.requested_bot_action_taken_at is not None:
             raise ValueError(f"Bot {bot.object_id} has already initiated this bot request")
 
-        last_bot_event.requested_bot_action_taken_at = timezone.now()
-        last_bot_event.save()
+        update_if_unchanged(last_bot_event, {"requested_bot_action_taken_at__isnull": True}, requested_bot_action_taken_at=timezone.now())
 
     @classmethod
     def is_state_that_can_play_media(cls, state: int):
@@ -601,11 +647,24 @@ class BotEventManager:
             event_metadata = {}
         retry_count = 0
 
+        # Read before taking the bot's row lock, so the lock isn't held during a round trip to Redis
+        try:
+            first_heartbeat_timestamp, last_heartbeat_timestamp = bot_heartbeat_store.get(bot.id)
+            heartbeats_read = True
+        except redis.RedisError as e:
+            # The transition still goes ahead, but anything computed from the heartbeats, like the credits charged
+            # when the bot ends, uses the timestamps from its last transition
+            logger.error(f"Failed to read heartbeats for bot {bot.id} from Redis, using the possibly stale timestamps in its row: {e}")
+            first_heartbeat_timestamp, last_heartbeat_timestamp = None, None
+            heartbeats_read = False
+
         while retry_count < max_retries:
             try:
                 with transaction.atomic():
-                    # Get fresh bot state
-                    bot.refresh_from_db()
+                    # Lock the bot's row until the transition commits, so concurrent transitions queue up behind
+                    # this one instead of failing when they try to write
+                    bot.refresh_from_db(from_queryset=Bot.objects.select_for_update())
+                    lock_acquired_at = time.monotonic()
                     old_state = bot.state
 
                     # Get valid transition for this event type
@@ -624,14 +683,17 @@ class BotEventManager:
 
                     # Update bot state based on 'to' definition
                     new_state = transition["to"]
-                    bot.state = new_state
-
-                    bot.save()  # This will raise RecordModifiedError if version mismatch
-
-                    # There's a chance that some other thread in the same process will modify the bot state to be something other than new_state. This should never happen, but we
-                    # should raise an exception if it does.
-                    if bot.state != new_state:
-                        raise ValidationError(f"Bot state was modified by another thread to be '{BotStates.state_to_api_code(bot.state)}' instead of '{BotStates.state_to_api_code(new_state)}'.")
+                    bot.apply_heartbeat(first_heartbeat_timestamp, last_heartbeat_timestamp)
+
+                    # Only writes the state and heartbeats, the rest of the row (e.g. its settings) is left alone.
+                    # Also bumps the version, so anyone holding a copy of the row from before the transition can't save over it.
+                    update_if_unchanged(
+                        bot,
+                        {"state": old_state},
+                        state=new_state,
+                        first_heartbeat_timestamp=bot.first_heartbeat_timestamp,
+                        last_heartbeat_timestamp=bot.last_heartbeat_timestamp,
+                    )
 
                     # Create event record
                     event = BotEvent.objects.create(
@@ -645,21 +707,25 @@ class BotEventManager:
 
                     # If we moved to the recording state
                     if new_state == BotStates.JOINED_RECORDING:
-                        pending_recordings = bot.recordings.filter(state=RecordingStates.NOT_STARTED)
-                        if pending_recordings.count() != 1:
-                            raise ValidationError(f"Expected exactly one pending recording for bot {bot.object_id} in state {BotStates.state_to_api_code(new_state)}, but found {pending_recordings.count()}")
-                        pending_recording = pending_recordings.first()
-                        RecordingManager.set_recording_in_progress(pending_recording)
+                        pending_recordings = list(bot.recordings.filter(state=RecordingStates.NOT_STARTED)[:2])
+                        if len(pending_recordings) != 1:
+                            raise ValidationError(f"Expected exactly one pending recording for bot {bot.object_id} in state {BotStates.state_to_api_code(new_state)}, but found {bot.recordings.filter(state=RecordingStates.NOT_STARTED).count()}")
+                        RecordingManager.set_recording_in_progress(pending_recordings[0])
 
                     # If we're in a terminal state
                     if cls.is_terminal_state(new_state):
                         # If there is an in progress recording, set it to complete
-                        in_progress_recordings = bot.recordings.filter(state=RecordingStates.IN_PROGRESS)
-                        if in_progress_recordings.count() > 1:
-                            raise ValidationError(f"Expected at most one in progress recording for bot {bot.object_id} in state {BotStates.state_to_api_code(new_state)}, but found {in_progress_recordings.count()}")
+                        in_progress_recordings = list(bot.recordings.filter(state=RecordingStates.IN_PROGRESS)[:2])
+                        if len(in_progress_recordings) > 1:
+                            raise ValidationError(f"Expected at most one in progress recording for bot {bot.object_id} in state {BotStates.state_to_api_code(new_state)}, but found {bot.recordings.filter(state=RecordingStates.IN_PROGRESS).count()}")
                         for recording in in_progress_recordings:
                             RecordingManager.set_recording_complete(recording)
 
+                        # The bot won't send any more heartbeats and its timestamps are now in its row. If they
+                        # couldn't be read, they're left in Redis and removed by terminate_bots_with_heartbeat_timeout.
+                        if heartbeats_read:
+                            transaction.on_commit(lambda: bot_heartbeat_store.remove(bot.id))
+
                         if settings.CHARGE_CREDITS_FOR_BOTS:
                             centicredits_consumed = bot.centicredits_consumed()
                             if centicredits_consumed > 0:
@@ -670,18 +736,20 @@ class BotEventManager:
                                     description=f"For bot {bot.object_id}",
                                 )
 
-                    # Trigger webhook for this event
-                    trigger_webhook(
-                        webhook_trigger_type=WebhookTriggerTypes.BOT_STATE_CHANGE,
-                        bot=bot,
-                        payload={
-                            "event_type": BotEventTypes.type_to_api_code(event_type),
-                            "event_sub_type": BotEventSubTypes.sub_type_to_api_code(event_sub_type),
-                            "old_state": BotStates.state_to_api_code(old_state),
-                            "new_state": BotStates.state_to_api_code(bot.state),
-                            "created_at": event.created_at.isoformat(),
-                        },
-                    )
+                    # Everything below runs once the transition has committed and the row lock is released
+                    transaction.on_commit(lambda: cls.log_lock_hold_time(bot, event, time.monotonic() - lock_acquired_at))
+                    transaction.on_commit(lambda: bot_state_changed.send(sender=cls, bot=bot, old_state=old_state, new_state=new_state, event=event))
+
+                    # Trigger webhook for this event. Looking up the subscriptions and enqueueing the deliveries
+                    # doesn't need the row lock, and no webhook should go out for a transition that was rolled back.
+                    webhook_payload = {
+                        "event_type": BotEventTypes.type_to_api_code(event_type),
+                        "event_sub_type": BotEventSubTypes.sub_type_to_api_code(event_sub_type),
+                        "old_state": BotStates.state_to_api_code(old_state),
+                        "new_state": BotStates.state_to_api_code(bot.state),
+                        "created_at": event.created_at.isoformat(),
+                    }
+                    transaction.on_commit(lambda: trigger_webhook(webhook_trigger_type=WebhookTriggerTypes.BOT_STATE_CHANGE, bot=bot, payload=webhook_payload))
 
                     return event
 
@@ -691,6 +759,13 @@ class BotEventManager:
                     raise
                 continue
 
+    @classmethod
+    def log_lock_hold_time(cls, bot: Bot, event: BotEvent, lock_hold_seconds: float):
+        if lock_hold_seconds > cls.LOCK_HOLD_WARNING_SECONDS:
+            logger.warning(f"Held the row lock of bot {bot.object_id} for {lock_hold_seconds:.3f}s while creating event {BotEventTypes.type_to_api_code(event.event_type)}")
+        else:
+            logger.debug(f"Held the row lock of bot {bot.object_id} for {lock_hold_seconds:.3f}s while creating event {BotEventTypes.type_to_api_code(event.event_type)}")
+
 
 class Participant(models.Model):
     bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name="participants")
@@ -709,6 +784,36 @@ class Participant(models.Model):
         return f"{display_name} in {self.bot.object_id}"
 
 
+class SpeakingTimeline(models.Model):
+    """
+    When one speaker in a bot's meeting was speaking. The totals are kept next to the segments, so they can be read
+    without going through them.
+    """
+
+    bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name="speaking_timelines")
+    # The participant's uuid for adapters that provide per-participant audio, otherwise the audio stream's id
+    speaker_id = models.CharField(max_length=255)
+    participant = models.ForeignKey(Participant, on_delete=models.SET_NULL, null=True, blank=True, related_name="speaking_timelines")
+
+    # [start_ms, duration_ms] pairs in order, with start_ms a unix timestamp in milliseconds. Capped at
+    # SpeakingTimelineManager.MAX_SEGMENTS_PER_SPEAKER by merging the closest segments, so in long meetings they can
+    # include pauses. speaking_ms is always exact.
+    segments = models.JSONField(default=list)
+    speaking_ms = models.BigIntegerField(default=0)
+    segment_count = models.IntegerField(default=0)
+    first_spoke_at_ms = models.BigIntegerField(null=True, blank=True)
+    last_spoke_at_ms = models.BigIntegerField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["bot", "speaker_id"], name="unique_speaking_timeline_per_speaker")]
+
+    def __str__(self):
+        return f"Speaking timeline of {self.speaker_id} in {self.bot.object_id}"
+
+
 class RecordingStates(models.IntegerChoices):
     NOT_STARTED = 1, "Not Started"
     IN_PROGRESS = 2, "In Progress"
@@ -759,6 +864,14 @@ class TranscriptionTypes(models.IntegerChoices):
 class TranscriptionProviders(models.IntegerChoices):
     DEEPGRAM = 1, "Deepgram"
 
+    @classmethod
+    def provider_to_api_code(cls, value):
+        """Returns the API code for a given provider value"""
+        mapping = {
+            cls.DEEPGRAM: "deepgram",
+        }
+        return mapping.get(value)
+
 
 from storages.backends.s3boto3 import S3Boto3Storage
 
@@ -793,6 +906,10 @@ class Recording(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     first_buffer_timestamp_ms = models.BigIntegerField(null=True, blank=True)
 
+    # Number of utterances in this recording that are still waiting to be transcribed.
+    # Only ever modified with atomic F() updates, see RecordingManager.
+    pending_transcription_count = models.IntegerField(default=0, null=False)
+
     file = models.FileField(storage=RecordingStorage())
 
     def __str__(self):
@@ -817,6 +934,12 @@ class Recording(models.Model):
             # Generate a random 16-character string
             random_string = "".join(random.choices(string.ascii_letters + string.digits, k=16))
             self.object_id = f"{self.OBJECT_ID_PREFIX}{random_string}"
+
+        # The pending transcription counter is updated concurrently by the transcription workers, so a full save
+        # of a stale instance must never write it back.
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != "pending_transcription_count"]
+
         super().save(*args, **kwargs)
 
 
@@ -830,9 +953,7 @@ class RecordingManager:
         if recording.state != RecordingStates.NOT_STARTED:
             raise ValueError(f"Invalid state transition. Recording {recording.id} is in state {recording.get_state_display()}")
 
-        recording.state = RecordingStates.IN_PROGRESS
-        recording.started_at = timezone.now()
-        recording.save()
+        update_if_unchanged(recording, {"state": RecordingStates.NOT_STARTED}, state=RecordingStates.IN_PROGRESS, started_at=timezone.now())
 
     @classmethod
     def set_recording_complete(cls, recording: Recording):
@@ -843,13 +964,15 @@ class RecordingManager:
         if recording.state != RecordingStates.IN_PROGRESS:
             raise ValueError(f"Invalid state transition. Recording {recording.id} is in state {recording.get_state_display()}")
 
-        recording.state = RecordingStates.COMPLETE
-        recording.completed_at = timezone.now()
-        recording.save()
+        update_if_unchanged(recording, {"state": RecordingStates.IN_PROGRESS}, state=RecordingStates.COMPLETE, completed_at=timezone.now())
+
+        # Re-read the counter now that our write holds the row lock, so that a transcription that
+        # finished while we were saving is accounted for
+        recording.refresh_from_db(fields=["transcription_state", "pending_transcription_count"])
 
         # If there is an in progress transcription recording
         # that has no utterances left to transcribe, set it to complete
-        if recording.transcription_state == RecordingTranscriptionStates.IN_PROGRESS and Utterance.objects.filter(recording=recording, transcription__isnull=True).count() == 0:
+        if recording.transcription_state == RecordingTranscriptionStates.IN_PROGRESS and recording.pending_transcription_count == 0:
             RecordingManager.set_recording_transcription_complete(recording)
 
     @classmethod
@@ -863,8 +986,7 @@ class RecordingManager:
 
         # todo: ADD REASON WHY IT FAILED STORAGE? OR MAYBE PUT IN THE EVENTs?
 
-        recording.state = RecordingStates.FAILED
-        recording.save()
+        update_if_unchanged(recording, {"state": RecordingStates.IN_PROGRESS}, state=RecordingStates.FAILED)
 
     @classmethod
     def set_recording_transcription_in_progress(cls, recording: Recording):
@@ -877,8 +999,11 @@ class RecordingManager:
         if recording.state != RecordingStates.COMPLETE and recording.state != RecordingStates.FAILED and recording.state != RecordingStates.IN_PROGRESS:
             raise ValueError(f"Invalid state transition. Recording {recording.id} is in recording state {recording.get_state_display()}")
 
-        recording.transcription_state = RecordingTranscriptionStates.IN_PROGRESS
-        recording.save()
+        update_if_unchanged(
+            recording,
+            {"transcription_state": RecordingTranscriptionStates.NOT_STARTED, "state__in": [RecordingStates.COMPLETE, RecordingStates.FAILED, RecordingStates.IN_PROGRESS]},
+            transcription_state=RecordingTranscriptionStates.IN_PROGRESS,
+        )
 
     @classmethod
     def set_recording_transcription_complete(cls, recording: Recording):
@@ -891,8 +1016,11 @@ class RecordingManager:
         if recording.state != RecordingStates.COMPLETE and recording.state != RecordingStates.FAILED:
             raise ValueError(f"Invalid state transition. Recording {recording.id} is in recording state {recording.get_state_display()}")
 
-        recording.transcription_state = RecordingTranscriptionStates.COMPLETE
-        recording.save()
+        update_if_unchanged(
+            recording,
+            {"transcription_state": RecordingTranscriptionStates.IN_PROGRESS, "state__in": [RecordingStates.COMPLETE, RecordingStates.FAILED]},
+            transcription_state=RecordingTranscriptionStates.COMPLETE,
+        )
 
     @classmethod
     def set_recording_transcription_failed(cls, recording: Recording):
@@ -906,8 +1034,45 @@ class RecordingManager:
             raise ValueError(f"Invalid state transition. Recording {recording.id} is in recording state {recording.get_state_display()}")
 
         # todo: ADD REASON WHY IT FAILED STORAGE? OR MAYBE PUT IN THE EVENTs?
-        recording.transcription_state = RecordingTranscriptionStates.FAILED
-        recording.save()
+        update_if_unchanged(
+            recording,
+            {"transcription_state": RecordingTranscriptionStates.IN_PROGRESS, "state__in": [RecordingStates.COMPLETE, RecordingStates.FAILED, RecordingStates.IN_PROGRESS]},
+            transcription_state=RecordingTranscriptionStates.FAILED,
+        )
+
+    @classmethod
+    def create_utterance_pending_transcription(cls, recording: Recording, **utterance_fields) -> "Utterance":
+        """
+        Creates an utterance that still needs to be transcribed and increments the recording's pending transcription counter.
+        """
+        with transaction.atomic():
+            utterance = Utterance.objects.create(recording=recording, transcription=None, **utterance_fields)
+            Recording.objects.filter(id=recording.id).update(pending_transcription_count=F("pending_transcription_count") + 1)
+        return utterance
+
+    @classmethod
+    def set_utterance_transcription(cls, utterance: "Utterance", transcription: dict) -> bool:
+        """
+        Stores the transcription of an utterance that was pending transcription, clears its audio and decrements the
+        recording's pending transcription counter. Afterwards utterance.recording holds the recording's current state
+        and counter.
+
+        Returns False if the utterance had already been transcribed, in which case nothing is changed.
+        """
+        recording = utterance.recording
+        with transaction.atomic():
+            num_updated = Utterance.objects.filter(id=utterance.id, transcription__isnull=True).update(transcription=transcription, audio_blob=b"", updated_at=timezone.now())
+            if num_updated:
+                Recording.objects.filter(id=recording.id).update(pending_transcription_count=F("pending_transcription_count") - 1)
+            # Read after the update, which holds the row lock, so a concurrent set_recording_complete is either already visible or will see our decrement
+            recording.refresh_from_db(fields=["state", "transcription_state", "pending_transcription_count"])
+
+        if not num_updated:
+            return False
+
+        utterance.transcription = transcription
+        utterance.audio_blob = b""
+        return True
 
     @classmethod
     def is_terminal_state(cls, state: int):
@@ -942,6 +1107,134 @@ class Utterance(models.Model):
         return f"Utterance at {self.timestamp_ms}ms ({self.duration_ms}ms long)"
 
 
+class RetranscriptionStates(models.IntegerChoices):
+    NOT_STARTED = 1, "Not Started"
+    IN_PROGRESS = 2, "In Progress"
+    COMPLETE = 3, "Complete"
+    FAILED = 4, "Failed"
+
+
+class Retranscription(models.Model):
+    """
+    A new version of a recording's transcript, produced by re-transcribing its per participant audio utterances from the recording file.
+    The new transcriptions are staged in RetranscribedUtterance and only replace the utterances' transcriptions once every chunk is done.
+    """
+
+    recording = models.ForeignKey(Recording, on_delete=models.CASCADE, related_name="retranscriptions")
+    state = models.IntegerField(choices=RetranscriptionStates.choices, default=RetranscriptionStates.NOT_STARTED, null=False)
+    # Same format as the bot's transcription_settings, e.g. {"deepgram": {"language": "es"}}
+    transcription_settings = models.JSONField(default=dict)
+    chunk_count = models.IntegerField(default=0, null=False)
+    # Indexes rather than a count, so a chunk that's retried after it completed isn't counted twice
+    completed_chunk_indexes = models.JSONField(default=list)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    OBJECT_ID_PREFIX = "rtr_"
+    object_id = models.CharField(max_length=32, unique=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if not self.object_id:
+            # Generate a random 16-character string
+            random_string = "".join(random.choices(string.ascii_letters + string.digits, k=16))
+            self.object_id = f"{self.OBJECT_ID_PREFIX}{random_string}"
+        super().save(*args, **kwargs)
+
+    def deepgram_settings(self):
+        # None means transcribe with the bot's own settings
+        return self.transcription_settings.get("deepgram")
+
+    def __str__(self):
+        return f"{self.object_id} for recording {self.recording.object_id}"
+
+
+class RetranscribedUtterance(models.Model):
+    retranscription = models.ForeignKey(Retranscription, on_delete=models.CASCADE, related_name="retranscribed_utterances")
+    utterance = models.ForeignKey(Utterance, on_delete=models.CASCADE, related_name="retranscribed_utterances")
+    transcription = models.JSONField()
+    # The utterance's transcription before this version was applied
+    previous_transcription = models.JSONField(null=True, default=None)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["retranscription", "utterance"], name="unique_retranscribed_utterance")]
+
+
+class RetranscriptionManager:
+    @classmethod
+    def create_retranscription(cls, recording: Recording, transcription_settings: dict) -> Retranscription:
+        recording.refresh_from_db()
+
+        if recording.state != RecordingStates.COMPLETE:
+            raise ValueError(f"Recording {recording.id} is in state {recording.get_state_display()}, it can only be re-transcribed once it is complete")
+        if recording.transcription_state not in (RecordingTranscriptionStates.COMPLETE, RecordingTranscriptionStates.FAILED):
+            raise ValueError(f"Recording {recording.id} is in transcription state {recording.get_transcription_state_display()}, it can only be re-transcribed once transcription is finished")
+        if not recording.file or recording.first_buffer_timestamp_ms is None:
+            raise ValueError(f"Recording {recording.id} has no recording file to re-transcribe")
+        if Retranscription.objects.filter(recording=recording, state__in=[RetranscriptionStates.NOT_STARTED, RetranscriptionStates.IN_PROGRESS]).exists():
+            raise ValueError(f"Recording {recording.id} is already being re-transcribed")
+
+        return Retranscription.objects.create(recording=recording, transcription_settings=transcription_settings)
+
+    @classmethod
+    def set_retranscription_in_progress(cls, retranscription: Retranscription, chunk_count: int):
+        retranscription.refresh_from_db()
+
+        if retranscription.state != RetranscriptionStates.NOT_STARTED:
+            raise ValueError(f"Invalid state transition. Retranscription {retranscription.id} is in state {retranscription.get_state_display()}")
+
+        update_if_unchanged(retranscription, {"state": RetranscriptionStates.NOT_STARTED}, state=RetranscriptionStates.IN_PROGRESS, chunk_count=chunk_count)
+
+    @classmethod
+    def set_chunk_complete(cls, retranscription: Retranscription, chunk_index: int) -> int:
+        """
+        Marks a chunk as complete and returns the number of completed chunks. Marking the same chunk again changes nothing.
+        """
+        with transaction.atomic():
+            completed_chunk_indexes = Retranscription.objects.select_for_update().values_list("completed_chunk_indexes", flat=True).get(id=retranscription.id)
+            if chunk_index not in completed_chunk_indexes:
+                completed_chunk_indexes = sorted(completed_chunk_indexes + [chunk_index])
+                Retranscription.objects.filter(id=retranscription.id).update(completed_chunk_indexes=completed_chunk_indexes, updated_at=timezone.now())
+        retranscription.completed_chunk_indexes = completed_chunk_indexes
+        return len(completed_chunk_indexes)
+
+    @classmethod
+    def set_retranscription_failed(cls, retranscription: Retranscription):
+        Retranscription.objects.filter(id=retranscription.id, state__in=[RetranscriptionStates.NOT_STARTED, RetranscriptionStates.IN_PROGRESS]).update(state=RetranscriptionStates.FAILED, updated_at=timezone.now())
+
+    @classmethod
+    def apply_retranscription(cls, retranscription: Retranscription):
+        """
+        Swaps the staged transcriptions in for the utterances' current transcriptions in a single transaction,
+        so readers see either the old transcript or the new one, never a mix.
+        """
+        with transaction.atomic():
+            retranscription = Retranscription.objects.select_for_update().get(id=retranscription.id)
+            if retranscription.state != RetranscriptionStates.IN_PROGRESS:
+                return
+
+            retranscribed_utterances = list(retranscription.retranscribed_utterances.select_related("utterance"))
+            utterances = []
+            newly_transcribed_count = 0
+            for retranscribed_utterance in retranscribed_utterances:
+                utterance = retranscribed_utterance.utterance
+                if utterance.transcription is None:
+                    newly_transcribed_count += 1
+                retranscribed_utterance.previous_transcription = utterance.transcription
+                utterance.transcription = retranscribed_utterance.transcription
+                utterances.append(utterance)
+
+            Utterance.objects.bulk_update(utterances, ["transcription"], batch_size=500)
+            RetranscribedUtterance.objects.bulk_update(retranscribed_utterances, ["previous_transcription"], batch_size=500)
+            if newly_transcribed_count:
+                Recording.objects.filter(id=retranscription.recording_id).update(pending_transcription_count=F("pending_transcription_count") - newly_transcribed_count)
+
+            update_if_unchanged(retranscription, {"state": RetranscriptionStates.IN_PROGRESS}, state=RetranscriptionStates.COMPLETE, completed_at=timezone.now())
+
+
 class Credentials(models.Model):
     class CredentialTypes(models.IntegerChoices):
         DEEPGRAM = 1, "Deepgram"
@@ -969,6 +1262,10 @@ class Credentials(models.Model):
         self._encrypted_data = f.encrypt(json_data.encode())
         self.save()
 
+        from bots.credentials_cache import credentials_cache
+
+        credentials_cache.invalidate(self.project_id, self.credential_type)
+
     def get_credentials(self):
         """Decrypt and return credentials"""
         if not self._encrypted_data:
@@ -1117,6 +1414,10 @@ class BotMediaRequest(models.Model):
                 name="unique_playing_media_request_per_bot_and_type",
             )
         ]
+        indexes = [
+            # For finding a bot's next media request
+            models.Index(fields=["bot", "media_type", "state", "created_at"], name="bot_media_request_queue_idx"),
+        ]
 
 
 class BotMediaRequestManager:
@@ -1127,8 +1428,7 @@ class BotMediaRequestManager:
         if media_request.state != BotMediaRequestStates.ENQUEUED:
             raise ValueError(f"Invalid state transition. Media request {media_request.id} is in state {media_request.get_state_display()}")
 
-        media_request.state = BotMediaRequestStates.PLAYING
-        media_request.save()
+        update_if_unchanged(media_request, {"state": BotMediaRequestStates.ENQUEUED}, state=BotMediaRequestStates.PLAYING)
 
     @classmethod
     def set_media_request_finished(cls, media_request: BotMediaRequest):
@@ -1137,8 +1437,7 @@ class BotMediaRequestManager:
         if media_request.state != BotMediaRequestStates.PLAYING:
             raise ValueError(f"Invalid state transition. Media request {media_request.id} is in state {media_request.get_state_display()}")
 
-        media_request.state = BotMediaRequestStates.FINISHED
-        media_request.save()
+        update_if_unchanged(media_request, {"state": BotMediaRequestStates.PLAYING}, state=BotMediaRequestStates.FINISHED)
 
     @classmethod
     def set_media_request_failed_to_play(cls, media_request: BotMediaRequest):
@@ -1147,8 +1446,7 @@ class BotMediaRequestManager:
         if media_request.state != BotMediaRequestStates.PLAYING:
             raise ValueError(f"Invalid state transition. Media request {media_request.id} is in state {media_request.get_state_display()}")
 
-        media_request.state = BotMediaRequestStates.FAILED_TO_PLAY
-        media_request.save()
+        update_if_unchanged(media_request, {"state": BotMediaRequestStates.PLAYING}, state=BotMediaRequestStates.FAILED_TO_PLAY)
 
     @classmethod
     def set_media_request_dropped(cls, media_request: BotMediaRequest):
@@ -1157,8 +1455,15 @@ class BotMediaRequestManager:
         if media_request.state != BotMediaRequestStates.PLAYING and media_request.state != BotMediaRequestStates.ENQUEUED:
             raise ValueError(f"Invalid state transition. Media request {media_request.id} is in state {media_request.get_state_display()}")
 
-        media_request.state = BotMediaRequestStates.DROPPED
-        media_request.save()
+        update_if_unchanged(media_request, {"state__in": [BotMediaRequestStates.PLAYING, BotMediaRequestStates.ENQUEUED]}, state=BotMediaRequestStates.DROPPED)
+
+    @classmethod
+    def set_media_requests_dropped(cls, media_requests: QuerySet) -> int:
+        """
+        Drops every media request in the queryset that's still enqueued or playing with a single UPDATE, instead of
+        one per request. Requests in any other state are left alone. Returns the number of requests dropped.
+        """
+        return media_requests.filter(state__in=[BotMediaRequestStates.PLAYING, BotMediaRequestStates.ENQUEUED]).update(state=BotMediaRequestStates.DROPPED, updated_at=timezone.now())
 
 
 class BotDebugScreenshotStorage(S3Boto3Storage):
@@ -0,0 +1,202 @@
+import struct
+from dataclasses import dataclass
+
+MPEG_VERSION_1 = 3
+MPEG_VERSION_2 = 2
+MPEG_VERSION_2_5 = 0
+
+LAYER_1 = 3
+LAYER_2 = 2
+LAYER_3 = 1
+
+# Kilobits per second, by version, layer and the header's bitrate index. Index 0 is "free format", which isn't supported.
+BITRATES = {
+    (MPEG_VERSION_1, LAYER_1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (MPEG_VERSION_1, LAYER_2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (MPEG_VERSION_1, LAYER_3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (MPEG_VERSION_2, LAYER_1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (MPEG_VERSION_2, LAYER_2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (MPEG_VERSION_2, LAYER_3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+SAMPLE_RATES = {
+    MPEG_VERSION_1: [44100, 48000, 32000],
+    MPEG_VERSION_2: [22050, 24000, 16000],
+    MPEG_VERSION_2_5: [11025, 12000, 8000],
+}
+
+# Encoders that store their delay and padding in the LAME extension of the Xing header. Decoders trim those samples.
+LAME_TAG_ENCODERS = (b"LAME", b"Lavc", b"Lavf", b"GOGO")
+
+# How far into the file the first frame may start, after any ID3v2 tag
+MAX_LEADING_JUNK_BYTES = 64 * 1024
+
+
+class Mp3ParseError(ValueError):
+    pass
+
+
+@dataclass
+class Mp3Metadata:
+    duration_ms: int
+    sample_rate: int
+    channels: int
+
+
+@dataclass
+class Mp3FrameHeader:
+    version: int
+    layer: int
+    sample_rate: int
+    channels: int
+    samples_per_frame: int
+    frame_length: int
+
+    @classmethod
+    def parse(cls, data, offset):
+        """
+        Returns the header of the frame at offset, or None if there isn't a valid one there.
+        """
+        if offset + 4 > len(data):
+            return None
+        (header,) = struct.unpack_from(">I", data, offset)
+        if header >> 21 != 0x7FF:
+            return None
+
+        version = (header >> 19) & 0x3
+        layer = (header >> 17) & 0x3
+        bitrate_index = (header >> 12) & 0xF
+        sample_rate_index = (header >> 10) & 0x3
+        padding = (header >> 9) & 0x1
+        channel_mode = (header >> 6) & 0x3
+        if version == 1 or layer == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+            return None
+
+        bitrate = BITRATES[(MPEG_VERSION_1 if version == MPEG_VERSION_1 else MPEG_VERSION_2, layer)][bitrate_index] * 1000
+        sample_rate = SAMPLE_RATES[version][sample_rate_index]
+        if layer == LAYER_1:
+            samples_per_frame = 384
+            frame_length = (12 * bitrate // sample_rate + padding) * 4
+        else:
+            samples_per_frame = 576 if layer == LAYER_3 and version != MPEG_VERSION_1 else 1152
+            frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+
+        return cls(
+            version=version,
+            layer=layer,
+            sample_rate=sample_rate,
+            channels=1 if channel_mode == 3 else 2,
+            samples_per_frame=samples_per_frame,
+            frame_length=frame_length,
+        )
+
+    @property
+    def side_info_length(self):
+        if self.version == MPEG_VERSION_1:
+            return 17 if self.channels == 1 else 32
+        return 9 if self.channels == 1 else 17
+
+
+def skip_id3v2_tag(data):
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    has_footer = data[5] & 0x10
+    return 10 + size + (10 if has_footer else 0)
+
+
+def find_first_frame(data, offset):
+    """
+    Finds the first frame header at or after offset that's followed by another valid frame, so that a stray sync
+    word in leading junk isn't mistaken for the start of the audio.
+    """
+    end = min(len(data), offset + MAX_LEADING_JUNK_BYTES)
+    while offset < end:
+        offset = data.find(b"\xff", offset, end)
+        if offset == -1:
+            break
+        header = Mp3FrameHeader.parse(data, offset)
+        if header:
+            next_offset = offset + header.frame_length
+            if next_offset >= len(data) or Mp3FrameHeader.parse(data, next_offset):
+                return offset, header
+        offset += 1
+    raise Mp3ParseError("No MPEG audio frames found")
+
+
+def is_trailing_tag(data, offset):
+    remaining = data[offset : offset + 8]
+    return (remaining[:3] == b"TAG" and len(data) - offset == 128) or remaining == b"APETAGEX" or remaining[:6] == b"LYRICS"
+
+
+def parse_xing_header(data, offset, header):
+    """
+    Returns the number of samples the decoder outputs according to the first frame's Xing or Info header, or None if it
+    has no such header or the header has no frame count.
+    """
+    xing_offset = offset + 4 + header.side_info_length
+    tag = data[xing_offset : xing_offset + 4]
+    if tag not in (b"Xing", b"Info") or xing_offset + 8 > len(data):
+        return None
+    (flags,) = struct.unpack_from(">I", data, xing_offset + 4)
+    if not flags & 0x1 or xing_offset + 12 > len(data):
+        return None
+    (frame_count,) = struct.unpack_from(">I", data, xing_offset + 8)
+
+    # The frame count, byte count, table of contents and quality fields are each optional
+    lame_offset = xing_offset + 12 + (4 if flags & 0x2 else 0) + (100 if flags & 0x4 else 0) + (4 if flags & 0x8 else 0)
+    delay_and_padding = 0
+    if data[lame_offset : lame_offset + 4] in LAME_TAG_ENCODERS and lame_offset + 24 <= len(data):
+        delays = int.from_bytes(data[lame_offset + 21 : lame_offset + 24], "big")
+        delay_and_padding = (delays >> 12) + (delays & 0xFFF)
+
+    return max(frame_count * header.samples_per_frame - delay_and_padding, 0)
+
+
+def parse_vbri_header(data, offset, header):
+    """
+    Returns the number of samples according to the first frame's VBRI header, or None if it has none.
+    """
+    vbri_offset = offset + 4 + 32
+    if data[vbri_offset : vbri_offset + 4] != b"VBRI" or vbri_offset + 18 > len(data):
+        return None
+    (frame_count,) = struct.unpack_from(">I", data, vbri_offset + 14)
+    return frame_count * header.samples_per_frame
+
+
+def parse_mp3_metadata(data):
+    """
+    Reads the duration, sample rate and channel count of MP3 audio without decoding it. The duration comes from the
+    Xing/Info or VBRI header if the file has one, otherwise from walking the frame headers.
+
+    Raises Mp3ParseError if the data isn't a well formed MPEG audio stream.
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    offset, first_header = find_first_frame(data, skip_id3v2_tag(data))
+
+    total_samples = parse_xing_header(data, offset, first_header)
+    if total_samples is None:
+        total_samples = parse_vbri_header(data, offset, first_header)
+
+    if total_samples is None:
+        total_samples = 0
+        while offset < len(data):
+            header = Mp3FrameHeader.parse(data, offset)
+            if header is None:
+                if is_trailing_tag(data, offset):
+                    break
+                raise Mp3ParseError(f"Invalid MPEG audio frame header at byte {offset}")
+            if header.sample_rate != first_header.sample_rate:
+                raise Mp3ParseError(f"Sample rate changes at byte {offset}")
+            if offset + header.frame_length > len(data):
+                # Truncated final frame, which decoders drop
+                break
+            total_samples += header.samples_per_frame
+            offset += header.frame_length
+
+    return Mp3Metadata(
+        duration_ms=total_samples * 1000 // first_header.sample_rate,
+        sample_rate=first_header.sample_rate,
+        channels=first_header.channels,
+    )
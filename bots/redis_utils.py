@@ -0,0 +1,29 @@
+import json
+
+import redis
+from django.conf import settings
+
+_connection_pool = None
+
+
+def get_redis_client():
+    """
+    Returns a client that draws its connections from a pool shared by everything in this process that talks to Redis,
+    so callers don't open a new connection (and TLS handshake) each time. redis-py resets the pool after a fork.
+    """
+    global _connection_pool
+    if _connection_pool is None:
+        # The same server and connection settings as the Celery broker
+        _connection_pool = redis.ConnectionPool.from_url(settings.REDIS_CELERY_URL)
+    return redis.Redis(connection_pool=_connection_pool)
+
+
+def publish_bot_commands(bot_ids, command):
+    """
+    Sends the command to each bot's channel, all in a single round trip.
+    """
+    message = json.dumps({"command": command})
+    pipeline = get_redis_client().pipeline(transaction=False)
+    for bot_id in bot_ids:
+        pipeline.publish(f"bot_{bot_id}", message)
+    pipeline.execute()
@@ -74,6 +74,28 @@ class RTMPSettingsJSONField(serializers.JSONField):
     pass
 
 
+@extend_schema_field(
+    {
+        "type": "object",
+        "properties": {
+            "audio": {
+                "type": "object",
+                "properties": {
+                    "url": {
+                        "type": "string",
+                        "description": "The websocket URL to stream the meeting's audio to, as binary messages of a 20 byte header followed by 16 bit mono PCM. The header is a version byte, 3 unused bytes, the audio stream's id as a little endian uint32, the unix time in milliseconds as a little endian uint64 and the sample rate as a little endian uint32.",
+                    },
+                },
+                "required": ["url"],
+            },
+        },
+        "required": [],
+    }
+)
+class WebsocketSettingsJSONField(serializers.JSONField):
+    pass
+
+
 @extend_schema_field(
     {
         "type": "object",
@@ -211,6 +233,43 @@ class CreateBotSerializer(serializers.Serializer):
 
         return value
 
+    websocket_settings = WebsocketSettingsJSONField(
+        help_text="Websocket to stream the meeting's audio to in real time, e.g. {'audio': {'url': 'wss://example.com/audio'}}. Can't be combined with rtmp_settings.",
+        required=False,
+        default=None,
+    )
+
+    WEBSOCKET_SETTINGS_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "audio": {
+                "type": "object",
+                "properties": {
+                    "url": {"type": "string"},
+                },
+                "required": ["url"],
+                "additionalProperties": False,
+            },
+        },
+        "required": [],
+        "additionalProperties": False,
+    }
+
+    def validate_websocket_settings(self, value):
+        if value is None:
+            return value
+
+        try:
+            jsonschema.validate(instance=value, schema=self.WEBSOCKET_SETTINGS_SCHEMA)
+        except jsonschema.exceptions.ValidationError as e:
+            raise serializers.ValidationError(e.message)
+
+        url = value.get("audio", {}).get("url", "")
+        if url and not (url.lower().startswith("ws://") or url.lower().startswith("wss://")):
+            raise serializers.ValidationError({"url": "URL must start with ws:// or wss://"})
+
+        return value
+
     recording_settings = RecordingSettingsJSONField(
         help_text="The settings for the bot's recording. Currently the only setting is 'view' which can be 'speaker_view' or 'gallery_view'.",
         required=False,
@@ -273,6 +332,11 @@ class CreateBotSerializer(serializers.Serializer):
 
         return value
 
+    def validate(self, data):
+        if data.get("rtmp_settings") and data.get("websocket_settings"):
+            raise serializers.ValidationError("rtmp_settings and websocket_settings can't be used together")
+        return data
+
 
 class BotSerializer(serializers.ModelSerializer):
     id = serializers.CharField(source="object_id")
@@ -363,6 +427,18 @@ class TranscriptUtteranceSerializer(serializers.Serializer):
     transcription = serializers.JSONField()
 
 
+class SpeakingTimelineSerializer(serializers.Serializer):
+    speaker_id = serializers.CharField()
+    speaker_type = serializers.ChoiceField(choices=["participant", "audio_stream"])
+    speaker_name = serializers.CharField(allow_null=True)
+    speaker_uuid = serializers.CharField(allow_null=True)
+    speaking_ms = serializers.IntegerField()
+    segment_count = serializers.IntegerField()
+    first_spoke_at_ms = serializers.IntegerField(allow_null=True)
+    last_spoke_at_ms = serializers.IntegerField(allow_null=True)
+    segments = serializers.ListField(child=serializers.ListField(child=serializers.IntegerField()), required=False)
+
+
 @extend_schema_serializer(
     examples=[
         OpenApiExample(
@@ -1,5 +1,6 @@
 from .deliver_webhook_task import deliver_webhook
 from .process_utterance_task import process_utterance
+from .retranscribe_recording_task import retranscribe_recording, retranscribe_recording_chunk
 from .run_bot_task import run_bot
 
 # Expose the tasks and any necessary utilities at the module level
@@ -7,4 +8,6 @@ __all__ = [
     "process_utterance",
     "run_bot",
     "deliver_webhook",
+    "retranscribe_recording",
+    "retranscribe_recording_chunk",
 ]
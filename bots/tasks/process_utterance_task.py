@@ -1,11 +1,58 @@
+import bisect
 import logging
 
 from celery import shared_task
+from django.conf import settings
 from django.db import DatabaseError
 
 logger = logging.getLogger(__name__)
 
-from bots.models import Credentials, RecordingManager, Utterance
+from bots.credentials_cache import credentials_cache
+from bots.models import Credentials, RecordingManager, TranscriptionProviders, Utterance
+from bots.transcription_limiter import TranscriptionLanes, transcription_limiter
+
+_keep_alive_transport = None
+
+
+def get_keep_alive_transport():
+    """
+    Returns an httpx transport shared by every Deepgram request in this worker process.
+
+    The Deepgram SDK wraps each request in a new `with httpx.Client(...)` block, and leaving that block
+    enters and exits the transport, which closes every connection in its pool. Passing in a transport
+    whose context manager methods and close() do nothing lets consecutive requests reuse the same
+    keep-alive connections.
+    """
+    global _keep_alive_transport
+
+    if _keep_alive_transport is None:
+        import httpx
+
+        class KeepAliveHTTPTransport(httpx.HTTPTransport):
+            def __enter__(self):
+                return self
+
+            def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+                pass
+
+            def close(self):
+                pass
+
+        _keep_alive_transport = KeepAliveHTTPTransport(limits=httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=60), retries=1)
+
+    return _keep_alive_transport
+
+
+def get_deepgram_client(project):
+    from deepgram import DeepgramClient
+
+    deepgram_credentials = credentials_cache.get_credentials(project.id, Credentials.CredentialTypes.DEEPGRAM)
+    if not deepgram_credentials:
+        raise Exception("Deepgram credentials record not found")
+    if not deepgram_credentials.data:
+        raise Exception("Deepgram credentials not found")
+
+    return credentials_cache.get_client(deepgram_credentials, "deepgram", lambda credentials_data: DeepgramClient(credentials_data["api_key"]))
 
 
 @shared_task(
@@ -16,57 +63,202 @@ from bots.models import Credentials, RecordingManager, Utterance
     max_retries=5,
 )
 def process_utterance(self, utterance_id):
+    utterance = Utterance.objects.get(id=utterance_id)
+    logger.info(f"Processing utterance {utterance_id}")
+
+    recording = utterance.recording
+    RecordingManager.set_recording_transcription_in_progress(recording)
+
+    if utterance.transcription is None:
+        # Utterances from meetings that are still going on take priority over ones from recordings that have already ended
+        lane = TranscriptionLanes.BACKLOG if RecordingManager.is_terminal_state(recording.state) else TranscriptionLanes.LIVE
+        if not transcribe_with_concurrency_limit(utterance, lane):
+            # Re-enqueue instead of retrying so the wait doesn't count against max_retries
+            process_utterance.apply_async(args=[utterance_id], countdown=transcription_limiter.retry_delay_seconds(lane))
+            return
+    else:
+        recording.refresh_from_db(fields=["state", "transcription_state", "pending_transcription_count"])
+
+    # If the recording is in a terminal state and there are no more utterances to transcribe, set the recording's transcription state to complete
+    if RecordingManager.is_terminal_state(recording.state) and recording.pending_transcription_count == 0:
+        RecordingManager.set_recording_transcription_complete(recording)
+
+
+def transcribe_with_concurrency_limit(utterance, lane):
+    """
+    Transcribes the utterance, along with other pending utterances from its recording if batching is enabled.
+    Returns False if it couldn't be done yet because the project is at its concurrency limit or another
+    batch for the recording is in flight.
+    """
+    batch_lock = None
+    if settings.TRANSCRIPTION_BATCH_WINDOW_SECONDS > 0:
+        # Only one batch per recording at a time, otherwise the tasks for utterances from the same window would all pick up the same batch
+        batch_lock = transcription_limiter.redis_client.lock(f"transcription_batch:{utterance.recording_id}", timeout=transcription_limiter.LEASE_SECONDS)
+        if not batch_lock.acquire(blocking=False):
+            return False
+
+    try:
+        lease = transcription_limiter.acquire(utterance.recording.bot.project_id, TranscriptionProviders.DEEPGRAM, lane, waiter_id=f"utterance_{utterance.id}")
+        if lease is None:
+            return False
+
+        try:
+            if batch_lock:
+                utterance.refresh_from_db(fields=["transcription"])
+                if utterance.transcription is None:
+                    transcribe_utterance_batch(utterance)
+            else:
+                transcribe_utterance(utterance)
+        finally:
+            transcription_limiter.release(lease)
+    finally:
+        if batch_lock:
+            batch_lock.release()
+
+    return True
+
+
+def transcribe_audio(recording, audio, sample_rate, deepgram_settings=None):
+    """
+    Transcribes 16-bit mono PCM audio with Deepgram using the recording's bot settings, or deepgram_settings if given.
+    Returns the first alternative of the first channel as a dict.
+    """
     import json
 
     from deepgram import (
-        DeepgramClient,
         FileSource,
         PrerecordedOptions,
     )
 
-    utterance = Utterance.objects.get(id=utterance_id)
-    logger.info(f"Processing utterance {utterance_id}")
+    payload: FileSource = {
+        "buffer": audio,
+    }
 
-    recording = utterance.recording
-    RecordingManager.set_recording_transcription_in_progress(recording)
+    if deepgram_settings is None:
+        deepgram_language = recording.bot.deepgram_language()
+        deepgram_detect_language = recording.bot.deepgram_detect_language()
+    else:
+        deepgram_language = deepgram_settings.get("language")
+        deepgram_detect_language = deepgram_settings.get("detect_language")
+
+    # nova-3 does not have multilingual support yet, so we need to use nova-2 if we're transcribing with a non-default language
+    if (deepgram_language != "en" and deepgram_language) or deepgram_detect_language:
+        deepgram_model = "nova-2"
+    else:
+        deepgram_model = "nova-3"
+
+    options = PrerecordedOptions(
+        model=deepgram_model,
+        smart_format=True,
+        language=deepgram_language,
+        detect_language=deepgram_detect_language,
+        encoding="linear16",  # for 16-bit PCM
+        sample_rate=sample_rate,
+    )
+
+    deepgram = get_deepgram_client(recording.bot.project)
+
+    response = deepgram.listen.rest.v("1").transcribe_file(payload, options, transport=get_keep_alive_transport())
+    logger.info(f"Transcribed {len(audio)} bytes of audio for recording {recording.id} with model {deepgram_model}")
+    return json.loads(response.results.channels[0].alternatives[0].to_json())
 
-    if utterance.transcription is None:
-        payload: FileSource = {
-            "buffer": utterance.audio_blob.tobytes(),
-        }
 
-        # nova-3 does not have multilingual support yet, so we need to use nova-2 if we're transcribing with a non-default language
-        if (recording.bot.deepgram_language() != "en" and recording.bot.deepgram_language()) or recording.bot.deepgram_detect_language():
-            deepgram_model = "nova-2"
-        else:
-            deepgram_model = "nova-3"
-
-        options = PrerecordedOptions(
-            model=deepgram_model,
-            smart_format=True,
-            language=recording.bot.deepgram_language(),
-            detect_language=recording.bot.deepgram_detect_language(),
-            encoding="linear16",  # for 16-bit PCM
+def transcribe_utterance(utterance):
+    transcription = transcribe_audio(utterance.recording, bytes(utterance.audio_blob), utterance.sample_rate)
+    # Stores the transcription, clears the audio blob and decrements the recording's pending transcription count
+    RecordingManager.set_utterance_transcription(utterance, transcription)
+
+    logger.info(f"Transcription complete for utterance {utterance.id}")
+
+
+# Silence between utterances in a batch, long enough that the provider doesn't run words from neighbouring utterances together
+BATCH_SILENCE_GAP_SECONDS = 1.0
+BATCH_MAX_UTTERANCES = 50
+BATCH_MAX_AUDIO_SECONDS = 300
+
+
+def get_utterance_batch(utterance):
+    """
+    Returns the utterance plus other pending per participant audio utterances from the same recording with the same sample rate,
+    oldest first, limited to BATCH_MAX_UTTERANCES and BATCH_MAX_AUDIO_SECONDS of audio.
+    """
+    candidates = (
+        Utterance.objects.filter(
+            recording_id=utterance.recording_id,
+            source=Utterance.Sources.PER_PARTICIPANT_AUDIO,
             sample_rate=utterance.sample_rate,
+            transcription__isnull=True,
         )
+        .exclude(id=utterance.id)
+        .order_by("timestamp_ms", "id")[: BATCH_MAX_UTTERANCES - 1]
+    )
 
-        deepgram_credentials_record = recording.bot.project.credentials.filter(credential_type=Credentials.CredentialTypes.DEEPGRAM).first()
-        if not deepgram_credentials_record:
-            raise Exception("Deepgram credentials record not found")
+    batch = [utterance]
+    audio_seconds = len(utterance.audio_blob) / (2 * utterance.sample_rate)
+    for candidate in candidates:
+        candidate_audio_seconds = len(candidate.audio_blob) / (2 * candidate.sample_rate) + BATCH_SILENCE_GAP_SECONDS
+        if audio_seconds + candidate_audio_seconds > BATCH_MAX_AUDIO_SECONDS:
+            break
+        batch.append(candidate)
+        audio_seconds += candidate_audio_seconds
+    return batch
 
-        deepgram_credentials = deepgram_credentials_record.get_credentials()
-        if not deepgram_credentials:
-            raise Exception("Deepgram credentials not found")
 
-        deepgram = DeepgramClient(deepgram_credentials["api_key"])
+def split_batch_transcription(transcription, utterance_start_offsets):
+    """
+    Splits the transcription of a batch back into one transcription per utterance. Each word goes to the utterance
+    whose audio contains the middle of the word, with its times made relative to the start of that utterance.
+    """
+    words_per_utterance = [[] for _ in utterance_start_offsets]
+    for word in transcription.get("words", []):
+        word_middle = (word["start"] + word["end"]) / 2
+        index = max(bisect.bisect_right(utterance_start_offsets, word_middle) - 1, 0)
+        offset = utterance_start_offsets[index]
+        words_per_utterance[index].append({**word, "start": max(word["start"] - offset, 0), "end": max(word["end"] - offset, 0)})
 
-        response = deepgram.listen.rest.v("1").transcribe_file(payload, options)
-        utterance.transcription = json.loads(response.results.channels[0].alternatives[0].to_json())
-        utterance.audio_blob = b""  # set the binary field to empty byte string
-        utterance.save()
+    return [
+        {
+            "transcript": " ".join(word.get("punctuated_word") or word["word"] for word in words),
+            "confidence": sum(word.get("confidence", 0) for word in words) / len(words) if words else 0,
+            "words": words,
+        }
+        for words in words_per_utterance
+    ]
 
-        logger.info(f"Transcription complete for utterance {utterance_id} with model {deepgram_model}")
 
-    # If the recording is in a terminal state and there are no more utterances to transcribe, set the recording's transcription state to complete
-    if RecordingManager.is_terminal_state(utterance.recording.state) and Utterance.objects.filter(recording=utterance.recording, transcription__isnull=True).count() == 0:
-        RecordingManager.set_recording_transcription_complete(utterance.recording)
+def transcribe_utterance_batch(utterance):
+    """
+    Transcribes the utterance and other pending utterances from its recording in a single provider request.
+    The utterances' audio is concatenated with silence in between and the returned words are split back
+    to the utterances by their time offsets.
+    """
+    batch = get_utterance_batch(utterance)
+    if len(batch) == 1:
+        transcribe_utterance(utterance)
+        return
+
+    # Sort by time so the concatenated audio plays in meeting order
+    batch.sort(key=lambda batch_utterance: (batch_utterance.timestamp_ms, batch_utterance.id))
+
+    sample_rate = utterance.sample_rate
+    silence_gap = b"\x00" * (int(sample_rate * BATCH_SILENCE_GAP_SECONDS) * 2)
+    audio_chunks = []
+    utterance_start_offsets = []
+    audio_length = 0
+    for batch_utterance in batch:
+        if audio_chunks:
+            audio_chunks.append(silence_gap)
+            audio_length += len(silence_gap)
+        utterance_start_offsets.append(audio_length / (2 * sample_rate))
+        utterance_audio = bytes(batch_utterance.audio_blob)
+        audio_chunks.append(utterance_audio)
+        audio_length += len(utterance_audio)
+
+    transcription = transcribe_audio(utterance.recording, b"".join(audio_chunks), sample_rate)
+
+    for batch_utterance, utterance_transcription in zip(batch, split_batch_transcription(transcription, utterance_start_offsets)):
+        # Each utterance shares the in-memory recording so the caller sees the latest pending transcription count
+        batch_utterance.recording = utterance.recording
+        RecordingManager.set_utterance_transcription(batch_utterance, utterance_transcription)
+
+    logger.info(f"Transcription complete for batch of {len(batch)} utterances from recording {utterance.recording_id}")
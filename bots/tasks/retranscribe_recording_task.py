@@ -0,0 +1,129 @@
+import logging
+import math
+
+from celery import shared_task
+from django.db import DatabaseError
+
+from bots.models import (
+    RetranscribedUtterance,
+    Retranscription,
+    RetranscriptionManager,
+    RetranscriptionStates,
+    TranscriptionProviders,
+    Utterance,
+)
+from bots.tasks.process_utterance_task import transcribe_audio
+from bots.transcription_limiter import TranscriptionLanes, transcription_limiter
+from bots.utils import extract_pcm_from_media
+
+logger = logging.getLogger(__name__)
+
+CHUNK_UTTERANCES = 25
+# At most this many chunks of a recording are transcribed at the same time
+MAX_PARALLEL_CHUNKS = 4
+SAMPLE_RATE = 16000
+
+
+def get_retranscription_utterances(retranscription):
+    return Utterance.objects.filter(recording_id=retranscription.recording_id, source=Utterance.Sources.PER_PARTICIPANT_AUDIO).order_by("timestamp_ms", "id")
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(DatabaseError,),
+    retry_backoff=True,  # Enable exponential backoff
+    max_retries=5,
+)
+def retranscribe_recording(self, retranscription_id):
+    """
+    Splits the recording's utterances into chunks and starts transcribing the first MAX_PARALLEL_CHUNKS of them.
+    Every chunk that finishes starts the next one, so no more than MAX_PARALLEL_CHUNKS run at once.
+    """
+    retranscription = Retranscription.objects.get(id=retranscription_id)
+    chunk_count = math.ceil(get_retranscription_utterances(retranscription).count() / CHUNK_UTTERANCES)
+    RetranscriptionManager.set_retranscription_in_progress(retranscription, chunk_count)
+    logger.info(f"Re-transcribing recording {retranscription.recording_id} in {chunk_count} chunks for retranscription {retranscription_id}")
+
+    if chunk_count == 0:
+        RetranscriptionManager.apply_retranscription(retranscription)
+        return
+
+    for chunk_index in range(min(chunk_count, MAX_PARALLEL_CHUNKS)):
+        retranscribe_recording_chunk.delay(retranscription_id, chunk_index)
+
+
+@shared_task(
+    bind=True,
+    soft_time_limit=3600,
+    autoretry_for=(DatabaseError,),
+    retry_backoff=True,  # Enable exponential backoff
+    max_retries=5,
+)
+def retranscribe_recording_chunk(self, retranscription_id, chunk_index):
+    retranscription = Retranscription.objects.select_related("recording__bot").get(id=retranscription_id)
+    if retranscription.state != RetranscriptionStates.IN_PROGRESS:
+        logger.info(f"Retranscription {retranscription_id} is in state {retranscription.get_state_display()}, skipping chunk {chunk_index}")
+        return
+
+    try:
+        chunk_complete = transcribe_chunk(retranscription, chunk_index)
+    except Exception as e:
+        if not isinstance(e, DatabaseError) or self.request.retries >= self.max_retries:
+            logger.error(f"Chunk {chunk_index} of retranscription {retranscription_id} failed: {e}")
+            RetranscriptionManager.set_retranscription_failed(retranscription)
+        raise
+
+    if not chunk_complete:
+        # The project is at its transcription concurrency limit, pick up where we left off later
+        retranscribe_recording_chunk.apply_async(args=[retranscription_id, chunk_index], countdown=transcription_limiter.retry_delay_seconds(TranscriptionLanes.BACKLOG))
+        return
+
+    # Retrying the task after this point, e.g. because starting the next chunk failed, doesn't count the chunk twice
+    completed_chunk_count = RetranscriptionManager.set_chunk_complete(retranscription, chunk_index)
+    if chunk_index + MAX_PARALLEL_CHUNKS < retranscription.chunk_count:
+        retranscribe_recording_chunk.delay(retranscription_id, chunk_index + MAX_PARALLEL_CHUNKS)
+    if completed_chunk_count == retranscription.chunk_count:
+        RetranscriptionManager.apply_retranscription(retranscription)
+        logger.info(f"Retranscription {retranscription_id} complete")
+
+
+def transcribe_chunk(retranscription, chunk_index):
+    """
+    Transcribes the chunk's utterances from the recording file and stages the results. Utterances staged by an
+    earlier attempt are skipped. Returns False if it had to stop because no transcription slot was free.
+
+    The recording file has the meeting's mixed audio, and the utterances' own per participant audio is cleared
+    once they're first transcribed. So each utterance is re-transcribed from everything that was audible while
+    its participant spoke, and words from anyone talking over them can end up in its new transcription.
+    """
+    recording = retranscription.recording
+    utterances = list(get_retranscription_utterances(retranscription)[chunk_index * CHUNK_UTTERANCES : (chunk_index + 1) * CHUNK_UTTERANCES])
+    staged_utterance_ids = set(RetranscribedUtterance.objects.filter(retranscription=retranscription, utterance__in=utterances).values_list("utterance_id", flat=True))
+    utterances = [utterance for utterance in utterances if utterance.id not in staged_utterance_ids]
+    if not utterances:
+        return True
+
+    # Decode the part of the recording file that the chunk covers in one go, rather than once per utterance
+    chunk_start_ms = utterances[0].timestamp_ms - recording.first_buffer_timestamp_ms
+    chunk_end_ms = max(utterance.timestamp_ms + utterance.duration_ms for utterance in utterances) - recording.first_buffer_timestamp_ms
+    chunk_audio = extract_pcm_from_media(recording.file.url, max(chunk_start_ms, 0) / 1000, (chunk_end_ms - max(chunk_start_ms, 0)) / 1000, SAMPLE_RATE)
+
+    for utterance in utterances:
+        start_byte = int((utterance.timestamp_ms - recording.first_buffer_timestamp_ms - max(chunk_start_ms, 0)) * SAMPLE_RATE / 1000) * 2
+        end_byte = start_byte + int(utterance.duration_ms * SAMPLE_RATE / 1000) * 2
+        utterance_audio = chunk_audio[max(start_byte, 0) : end_byte]
+        if not utterance_audio:
+            logger.warning(f"No audio in the recording file for utterance {utterance.id}, keeping an empty transcription")
+            transcription = {"transcript": "", "confidence": 0, "words": []}
+        else:
+            lease = transcription_limiter.acquire(recording.bot.project_id, TranscriptionProviders.DEEPGRAM, TranscriptionLanes.BACKLOG, waiter_id=f"retranscription_{retranscription.id}_{chunk_index}")
+            if lease is None:
+                return False
+            try:
+                transcription = transcribe_audio(recording, utterance_audio, SAMPLE_RATE, deepgram_settings=retranscription.deepgram_settings())
+            finally:
+                transcription_limiter.release(lease)
+
+        RetranscribedUtterance.objects.update_or_create(retranscription=retranscription, utterance=utterance, defaults={"transcription": transcription})
+
+    return True
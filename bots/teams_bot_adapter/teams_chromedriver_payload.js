@@ -714,8 +714,8 @@ class WebSocketClient {
             // Set timestamp as BigInt64
             dataView.setBigInt64(4, BigInt(timestamp), true);
   
-            // Set streamId length and bytes
-            dataView.setInt32(12, streamId, true);
+            // Set the audio stream's number
+            dataView.setUint32(12, streamId, true);
   
             // Copy audio data after type and timestamp
             message.set(new Uint8Array(audioData.buffer), 16);
@@ -1293,7 +1293,7 @@ const handleAudioTrack = async (event) => {
                       return;
                   }
   
-                  // Send audio data through websocket
+                  // Send audio data through websocket. Teams mixes the meeting's audio into one stream, so it's always stream 0.
                   const currentTimeMicros = BigInt(Math.floor(performance.now() * 1000));
                   ws.sendAudio(currentTimeMicros, 0, audioData);
   
@@ -0,0 +1,185 @@
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from bots.bot_controller.audio_output_manager import AudioOutputManager, PreparedAudio
+
+# 44.1kHz 16 bit mono
+ONE_SECOND_OF_AUDIO = b"\x00\x00" * 44100
+
+
+def media_request(id, created_at=None):
+    return MagicMock(id=id, created_at=created_at or timezone.now())
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeStopEvent(threading.Event):
+    """Waiting moves the fake clock forward instead of sleeping."""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def wait(self, timeout=None):
+        if not self.is_set():
+            self.clock.now += timeout
+        return self.is_set()
+
+
+class TestAudioOutputManager(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch("bots.bot_controller.audio_output_manager.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.finished_callback = MagicMock()
+        self.play_raw_audio_callback = MagicMock()
+        self.manager = AudioOutputManager(
+            currently_playing_audio_media_request_finished_callback=self.finished_callback,
+            play_raw_audio_callback=self.play_raw_audio_callback,
+        )
+        self.manager.stop_event = FakeStopEvent(self.clock)
+        self.prepared_ids = []
+
+        def prepare_audio(audio_media_request):
+            self.prepared_ids.append(audio_media_request.id)
+            return PreparedAudio(audio_media_request, ONE_SECOND_OF_AUDIO)
+
+        self.manager.prepare_audio = prepare_audio
+
+    def play_to_the_end(self, audio_media_request):
+        self.manager.start_playing_audio_media_request(audio_media_request)
+        self.manager.audio_thread.join()
+
+    def test_audio_is_sent_in_small_frames_ahead_of_their_deadlines(self):
+        send_times = []
+        self.play_raw_audio_callback.side_effect = lambda bytes, sample_rate: send_times.append(self.clock.now)
+
+        self.play_to_the_end(media_request(1))
+
+        # 20ms frames, each sent 60ms before it plays, and the first one right away
+        self.assertEqual(self.play_raw_audio_callback.call_count, 50)
+        self.assertEqual(len(self.play_raw_audio_callback.call_args.kwargs["bytes"]), 1764)
+        self.assertAlmostEqual(send_times[10] - send_times[0], 0.14)
+        (prepared_audio,) = self.manager.playout
+        self.assertAlmostEqual(prepared_audio.finishes_at - prepared_audio.started_at, 1.0)
+        self.assertEqual(prepared_audio.underrun_count, 0)
+
+    def test_request_finishes_when_its_audio_has_played(self):
+        audio_media_request = media_request(1)
+        self.play_to_the_end(audio_media_request)
+
+        self.clock.now = 1000.99
+        self.assertAlmostEqual(self.manager.playout_position_ms(), 990)
+        self.manager.monitor_currently_playing_audio_media_request()
+        self.finished_callback.assert_not_called()
+
+        self.clock.now = 1001.01
+        with self.assertLogs("bots.bot_controller.audio_output_manager", level="INFO") as logs:
+            self.manager.monitor_currently_playing_audio_media_request()
+        self.finished_callback.assert_called_once_with(audio_media_request)
+        self.assertIn("1000ms of audio with 0 underruns", logs.output[0])
+
+    def test_start_latency_is_reported(self):
+        audio_media_request = media_request(1, created_at=timezone.now() - timedelta(milliseconds=250))
+
+        with self.assertLogs("bots.bot_controller.audio_output_manager", level="INFO") as logs:
+            self.play_to_the_end(audio_media_request)
+
+        (prepared_audio,) = self.manager.playout
+        self.assertGreaterEqual(prepared_audio.start_latency_ms, 250)
+        self.assertLess(prepared_audio.start_latency_ms, 1000)
+        self.assertIn("Audio media request 1 started playing", logs.output[0])
+
+    def test_late_frames_are_reported_as_underruns(self):
+        def slow_output(bytes, sample_rate):
+            if self.play_raw_audio_callback.call_count == 10:
+                self.clock.now += 0.1
+
+        self.play_raw_audio_callback.side_effect = slow_output
+
+        self.play_to_the_end(media_request(1))
+
+        (prepared_audio,) = self.manager.playout
+        self.assertEqual(prepared_audio.underrun_count, 1)
+        # Playback was delayed by how late the frame was
+        self.assertAlmostEqual(prepared_audio.finishes_at - prepared_audio.started_at, 1.02)
+
+    def test_prefetched_request_plays_right_after_the_current_one(self):
+        first_request, second_request = media_request(1), media_request(2)
+
+        self.manager.prefetch_audio_media_requests([second_request])
+        self.manager.prefetched_audio[2].result()
+        self.play_to_the_end(first_request)
+
+        # Both requests were sent by the same audio thread, the second scheduled for when the first ends
+        self.assertEqual(self.play_raw_audio_callback.call_count, 100)
+        first_audio, second_audio = self.manager.playout
+        self.assertAlmostEqual(second_audio.started_at, first_audio.finishes_at)
+        self.assertAlmostEqual(second_audio.started_at, 1001.0)
+
+        self.clock.now = 1001.5
+        self.manager.monitor_currently_playing_audio_media_request()
+        self.finished_callback.assert_called_once_with(first_request)
+
+        # The bot controller starts the next request once the first one finishes, which is already playing
+        second_request_from_db = media_request(2)
+        self.manager.start_playing_audio_media_request(second_request_from_db)
+        self.assertEqual(self.play_raw_audio_callback.call_count, 100)
+        self.assertEqual(self.prepared_ids, [2, 1])
+
+        self.clock.now = 1002.5
+        self.manager.monitor_currently_playing_audio_media_request()
+        self.finished_callback.assert_called_with(second_request_from_db)
+        self.assertEqual(self.manager.playout, [])
+
+    def test_only_the_next_requests_are_prefetched(self):
+        requests = [media_request(index) for index in range(5)]
+
+        self.manager.prefetch_audio_media_requests(requests)
+        self.manager.prefetch_audio_media_requests(requests[1:])
+        for future in self.manager.prefetched_audio.values():
+            future.result()
+
+        self.assertEqual(list(self.manager.prefetched_audio), [1, 2])
+        self.assertNotIn(3, self.prepared_ids)
+
+    def test_failed_prefetch_is_raised_when_the_request_is_played(self):
+        self.manager.prepare_audio = MagicMock(side_effect=ValueError("Could not find Google Text-to-Speech credentials."))
+        audio_media_request = media_request(1)
+
+        self.manager.prefetch_audio_media_requests([audio_media_request])
+
+        with self.assertRaises(ValueError):
+            self.manager.start_playing_audio_media_request(audio_media_request)
+        self.play_raw_audio_callback.assert_not_called()
+
+
+class TestAudioOutputManagerStop(SimpleTestCase):
+    def test_stop_is_immediate(self):
+        play_raw_audio_callback = MagicMock()
+        manager = AudioOutputManager(currently_playing_audio_media_request_finished_callback=MagicMock(), play_raw_audio_callback=play_raw_audio_callback)
+        manager.prepare_audio = lambda audio_media_request: PreparedAudio(audio_media_request, ONE_SECOND_OF_AUDIO * 10)
+
+        manager.start_playing_audio_media_request(media_request(1))
+        time.sleep(0.1)
+        stop_started_at = time.monotonic()
+        manager.clear_currently_playing_audio_media_request()
+        stop_seconds = time.monotonic() - stop_started_at
+
+        self.assertFalse(manager.audio_thread.is_alive())
+        self.assertLess(stop_seconds, 0.05)
+        # About 100ms of audio plus the look-ahead was sent, not whole seconds of it
+        self.assertLess(play_raw_audio_callback.call_count, 15)
@@ -0,0 +1,169 @@
+import socket
+import threading
+import time
+
+import numpy as np
+from django.test import SimpleTestCase
+from websockets.sync.server import serve
+
+from bots.bot_controller.audio_websocket_streamer import AudioWebsocketStreamer, decode_audio_frame
+from bots.bot_controller.pipeline_configuration import PipelineConfiguration
+from bots.serializers import CreateBotSerializer
+
+# 10ms of 48kHz float32 audio, as the browser sends it
+CHUNK = np.full(480, 0.5, dtype=np.float32).tobytes()
+ONE_HUNDRED_MS_CHUNK = CHUNK * 10
+
+
+class AudioWebsocketServer:
+    """A local websocket server that records the messages it receives, optionally taking a while over each one."""
+
+    def __init__(self, seconds_per_message=0):
+        self.seconds_per_message = seconds_per_message
+        self.messages = []
+        self.received_at = []
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.bind(("localhost", 0))
+        sock.listen()
+        self.server = serve(self.handle, sock=sock, max_queue=1)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"ws://localhost:{self.server.socket.getsockname()[1]}"
+
+    def handle(self, websocket):
+        for message in websocket:
+            self.messages.append(message)
+            self.received_at.append(int(time.time() * 1000))
+            time.sleep(self.seconds_per_message)
+
+    def wait_for_messages(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.messages) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.thread.join()
+
+
+class TestAudioWebsocketStreamer(SimpleTestCase):
+    def start_server(self, **kwargs):
+        server = AudioWebsocketServer(**kwargs)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def start_streamer(self, url):
+        streamer = AudioWebsocketStreamer(url=url)
+        streamer.start()
+        self.addCleanup(streamer.stop)
+        return streamer
+
+    def test_frames_arrive_with_their_stream_and_timestamp(self):
+        server = self.start_server()
+        streamer = self.start_streamer(server.url)
+
+        for stream_id in (7, 8):
+            streamer.add_audio_chunk(CHUNK, stream_id, 48000)
+            time.sleep(0.01)
+        server.wait_for_messages(2)
+
+        self.assertEqual(len(server.messages), 2)
+        for message, expected_stream_id, received_at in zip(server.messages, (7, 8), server.received_at):
+            stream_id, timestamp_ms, sample_rate, pcm_bytes = decode_audio_frame(message)
+            self.assertEqual(stream_id, expected_stream_id)
+            self.assertEqual(sample_rate, 48000)
+            self.assertEqual(pcm_bytes, np.full(480, 16383, dtype="<i2").tobytes())
+            self.assertLess(received_at - timestamp_ms, AudioWebsocketStreamer.MAX_LATENCY_MS)
+        self.assertEqual(streamer.dropped_frame_count, 0)
+
+    def test_stream_ids_are_unsigned(self):
+        server = self.start_server()
+        streamer = self.start_streamer(server.url)
+
+        streamer.add_audio_chunk(CHUNK, 2**32 - 1, 48000)
+        server.wait_for_messages(1)
+
+        self.assertEqual(decode_audio_frame(server.messages[0])[0], 2**32 - 1)
+
+    def test_frames_that_cant_be_encoded_are_skipped(self):
+        server = self.start_server()
+        streamer = self.start_streamer(server.url)
+
+        with self.assertLogs("bots.bot_controller.audio_websocket_streamer", level="WARNING"):
+            streamer.add_audio_chunk(CHUNK, 2**32, 48000)
+            streamer.add_audio_chunk(CHUNK[:-1], 1, 48000)
+            streamer.add_audio_chunk(CHUNK, 2, 0)
+            streamer.add_audio_chunk(CHUNK, 3, 48000)
+            server.wait_for_messages(1)
+
+        # The sender carries on after the frames it couldn't encode
+        self.assertEqual([decode_audio_frame(message)[0] for message in server.messages], [3])
+        self.assertEqual(streamer.invalid_frame_count, 3)
+        self.assertEqual(streamer.dropped_frame_count, 0)
+
+    def test_slow_consumer_gets_the_newest_audio(self):
+        # Stops reading for a second, with little buffering of its own
+        server = self.start_server(seconds_per_message=1)
+        streamer = self.start_streamer(server.url)
+
+        for _ in range(50):
+            streamer.add_audio_chunk(ONE_HUNDRED_MS_CHUNK, 1, 48000)
+            time.sleep(0.01)
+        # Once the consumer reads again, the audio that queued up in the meantime is too old to send
+        deadline = time.monotonic() + 5
+        while streamer.frames and time.monotonic() < deadline:
+            time.sleep(0.05)
+        streamer.stop()
+
+        # Only what could leave within the latency limit was sent, counting the audio waiting in the send buffer,
+        # and the rest was dropped rather than sent late
+        self.assertGreater(streamer.dropped_frame_count, 30)
+        self.assertEqual(streamer.sent_frame_count + streamer.dropped_frame_count, 50)
+        self.assertLessEqual(streamer.max_latency_ms, AudioWebsocketStreamer.MAX_LATENCY_MS)
+
+    def test_oldest_frames_are_dropped_when_the_queue_is_full(self):
+        streamer = AudioWebsocketStreamer(url="ws://localhost:1")
+
+        for stream_id in range(AudioWebsocketStreamer.MAX_QUEUED_FRAMES + 10):
+            streamer.add_audio_chunk(CHUNK, stream_id, 48000)
+
+        self.assertEqual(streamer.dropped_frame_count, 10)
+        self.assertEqual(streamer.frames[0][3], 10)
+
+    def test_audio_is_queued_while_the_endpoint_is_unreachable(self):
+        with self.assertLogs("bots.bot_controller.audio_websocket_streamer", level="WARNING"):
+            streamer = self.start_streamer("ws://localhost:1")
+            streamer.add_audio_chunk(CHUNK, 1, 48000)
+            time.sleep(0.1)
+
+        stop_started_at = time.monotonic()
+        streamer.stop()
+        self.assertLess(time.monotonic() - stop_started_at, 1)
+        self.assertEqual(streamer.sent_frame_count, 0)
+
+
+class TestWebsocketSettings(SimpleTestCase):
+    def test_websocket_settings_are_validated(self):
+        serializer = CreateBotSerializer(data={"meeting_url": "https://meet.google.com/abc-defg-hij", "bot_name": "Agent", "websocket_settings": {"audio": {"url": "wss://example.com/audio"}}})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        serializer = CreateBotSerializer(data={"meeting_url": "https://meet.google.com/abc-defg-hij", "bot_name": "Agent", "websocket_settings": {"audio": {"url": "https://example.com/audio"}}})
+        self.assertFalse(serializer.is_valid())
+
+        serializer = CreateBotSerializer(
+            data={
+                "meeting_url": "https://meet.google.com/abc-defg-hij",
+                "bot_name": "Agent",
+                "websocket_settings": {"audio": {"url": "wss://example.com/audio"}},
+                "rtmp_settings": {"destination_url": "rtmp://example.com/app", "stream_key": "key"},
+            }
+        )
+        self.assertFalse(serializer.is_valid())
+
+    def test_voice_agent_configuration_streams_audio(self):
+        self.assertTrue(PipelineConfiguration.voice_agent().websocket_stream_audio)
+        self.assertFalse(PipelineConfiguration.recorder_bot().websocket_stream_audio)
@@ -0,0 +1,145 @@
+from unittest.mock import MagicMock, patch
+
+import redis
+from django.test import TestCase
+from django.utils import timezone
+
+from bots.heartbeat_store import BotHeartbeatStore
+from bots.management.commands.terminate_bots_with_heartbeat_timeout import Command
+from bots.models import Bot, BotEventManager, BotEventTypes, BotStates, Organization, Project
+
+
+class TestBotHeartbeatStore(TestCase):
+    def test_first_heartbeat_is_only_recorded_once(self):
+        redis_client = MagicMock()
+        BotHeartbeatStore(redis_client=redis_client).record(1, 1000)
+
+        pipeline = redis_client.pipeline.return_value
+        pipeline.zadd.assert_any_call(BotHeartbeatStore.FIRST_HEARTBEATS_KEY, {1: 1000}, nx=True)
+        pipeline.zadd.assert_any_call(BotHeartbeatStore.LAST_HEARTBEATS_KEY, {1: 1000})
+        pipeline.execute.assert_called_once()
+
+    def test_timeout_sweep_reads_scores_from_redis(self):
+        redis_client = MagicMock()
+        redis_client.zrangebyscore.return_value = [b"1", b"2"]
+
+        self.assertEqual(BotHeartbeatStore(redis_client=redis_client).get_bot_ids_with_last_heartbeat_before(1000), [1, 2])
+        redis_client.zrangebyscore.assert_called_once_with(BotHeartbeatStore.LAST_HEARTBEATS_KEY, "-inf", "(1000")
+
+
+@patch("bots.models.trigger_webhook")
+class TestBotHeartbeats(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://test.com")
+
+        patcher = patch("bots.models.bot_heartbeat_store")
+        self.mock_store = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_store.get.return_value = (None, None)
+
+    def test_heartbeat_does_not_write_bot_row(self, mock_trigger_webhook):
+        version = self.bot.version
+
+        with self.assertNumQueries(0):
+            self.bot.set_heartbeat()
+
+        self.mock_store.record.assert_called_once_with(self.bot.id, int(timezone.now().timestamp()))
+        self.bot.refresh_from_db()
+        self.assertEqual(self.bot.version, version)
+        self.assertIsNone(self.bot.last_heartbeat_timestamp)
+
+    def test_heartbeats_are_flushed_at_state_transitions(self, mock_trigger_webhook):
+        self.mock_store.get.return_value = (1000, 1060)
+        BotEventManager.create_event(self.bot, BotEventTypes.JOIN_REQUESTED)
+
+        self.bot.refresh_from_db()
+        self.assertEqual(self.bot.first_heartbeat_timestamp, 1000)
+        self.assertEqual(self.bot.last_heartbeat_timestamp, 1060)
+        self.mock_store.remove.assert_not_called()
+
+    def test_heartbeats_are_removed_from_redis_once_bot_ends(self, mock_trigger_webhook):
+        self.mock_store.get.return_value = (1000, 1060)
+        BotEventManager.create_event(self.bot, BotEventTypes.JOIN_REQUESTED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BotEventManager.create_event(self.bot, BotEventTypes.COULD_NOT_JOIN)
+
+        self.mock_store.remove.assert_called_once_with(self.bot.id)
+
+    def test_redis_errors_are_logged_and_keep_heartbeats_in_redis(self, mock_trigger_webhook):
+        self.bot.last_heartbeat_timestamp = 1060
+        self.bot.save()
+        self.mock_store.get.side_effect = redis.ConnectionError("Connection refused")
+        BotEventManager.create_event(self.bot, BotEventTypes.JOIN_REQUESTED)
+
+        with self.assertLogs("bots.models", level="ERROR"), self.captureOnCommitCallbacks(execute=True):
+            BotEventManager.create_event(self.bot, BotEventTypes.COULD_NOT_JOIN)
+
+        self.bot.refresh_from_db()
+        self.assertEqual(self.bot.state, BotStates.FATAL_ERROR)
+        self.assertEqual(self.bot.last_heartbeat_timestamp, 1060)
+        self.mock_store.remove.assert_not_called()
+
+    def test_missing_heartbeats_keep_row_timestamps(self, mock_trigger_webhook):
+        self.bot.first_heartbeat_timestamp = 1000
+        self.bot.last_heartbeat_timestamp = 1060
+        self.bot.save()
+
+        BotEventManager.create_event(self.bot, BotEventTypes.JOIN_REQUESTED)
+
+        self.bot.refresh_from_db()
+        self.assertEqual(self.bot.first_heartbeat_timestamp, 1000)
+        self.assertEqual(self.bot.last_heartbeat_timestamp, 1060)
+
+
+@patch("bots.models.trigger_webhook")
+@patch("bots.models.bot_heartbeat_store")
+@patch("bots.management.commands.terminate_bots_with_heartbeat_timeout.bot_heartbeat_store")
+class TestTerminateBotsWithHeartbeatTimeout(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+
+    def create_bot(self, state, last_heartbeat_timestamp=None):
+        return Bot.objects.create(project=self.project, meeting_url="https://test.com", state=state, last_heartbeat_timestamp=last_heartbeat_timestamp)
+
+    def test_stale_bots_are_found_in_redis(self, mock_command_store, mock_models_store, mock_trigger_webhook):
+        mock_models_store.get.return_value = (None, None)
+        eleven_minutes_ago = int(timezone.now().timestamp()) - 660
+        stale_bot = self.create_bot(BotStates.JOINED_RECORDING)
+        # The row's heartbeat is stale, but the bot isn't stale in Redis
+        recent_bot = self.create_bot(BotStates.JOINED_RECORDING, last_heartbeat_timestamp=eleven_minutes_ago)
+        # Redis has no heartbeats for this one, so its row's are used
+        bot_without_heartbeats = self.create_bot(BotStates.JOINED_RECORDING, last_heartbeat_timestamp=eleven_minutes_ago)
+        ended_bot = self.create_bot(BotStates.ENDED, last_heartbeat_timestamp=eleven_minutes_ago)
+        mock_command_store.get_bot_ids_with_last_heartbeat_before.return_value = [stale_bot.id, ended_bot.id]
+        mock_command_store.get_row_fallback_cursor.return_value = 0
+        mock_command_store.get_bot_ids_without_heartbeats.side_effect = lambda bot_ids: [bot_id for bot_id in bot_ids if bot_id == bot_without_heartbeats.id]
+
+        Command().handle()
+
+        mock_command_store.get_bot_ids_without_heartbeats.assert_called_once_with([recent_bot.id, bot_without_heartbeats.id])
+        for bot, expected_state in ((stale_bot, BotStates.FATAL_ERROR), (recent_bot, BotStates.JOINED_RECORDING), (bot_without_heartbeats, BotStates.FATAL_ERROR)):
+            bot.refresh_from_db()
+            self.assertEqual(bot.state, expected_state)
+        mock_command_store.remove.assert_called_once_with(ended_bot.id)
+
+    def test_bots_without_heartbeats_are_checked_in_batches(self, mock_command_store, mock_models_store, mock_trigger_webhook):
+        eleven_minutes_ago = int(timezone.now().timestamp()) - 660
+        bots = [self.create_bot(BotStates.JOINED_RECORDING, last_heartbeat_timestamp=eleven_minutes_ago) for _ in range(3)]
+        mock_command_store.get_bot_ids_without_heartbeats.return_value = []
+        command = Command()
+        command.ROW_FALLBACK_BATCH_SIZE = 2
+
+        mock_command_store.get_row_fallback_cursor.return_value = 0
+        command.get_stale_bot_ids_without_heartbeats_in_redis(int(timezone.now().timestamp()) - 600)
+        mock_command_store.get_bot_ids_without_heartbeats.assert_called_with([bots[0].id, bots[1].id])
+        mock_command_store.set_row_fallback_cursor.assert_called_with(bots[1].id)
+
+        # The next pass picks up after the last bot checked, then starts over
+        mock_command_store.get_row_fallback_cursor.return_value = bots[1].id
+        command.get_stale_bot_ids_without_heartbeats_in_redis(int(timezone.now().timestamp()) - 600)
+        mock_command_store.get_bot_ids_without_heartbeats.assert_called_with([bots[2].id])
+        mock_command_store.set_row_fallback_cursor.assert_called_with(0)
@@ -0,0 +1,193 @@
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from bots.bot_controller import BotController
+from bots.bot_controller.closed_caption_manager import ClosedCaptionManager
+from bots.models import (
+    Bot,
+    BotEventManager,
+    BotEventTypes,
+    Organization,
+    Project,
+    Recording,
+    RecordingStates,
+    RecordingTranscriptionStates,
+    RecordingTypes,
+    TranscriptionTypes,
+    Utterance,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return 1_700_000_000.0 + self.now
+
+
+class TestClosedCaptionManager(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch("bots.bot_controller.closed_caption_manager.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.save_utterances_callback = MagicMock()
+        self.get_participant_callback = MagicMock(return_value={"participant_uuid": "device_1"})
+        self.manager = ClosedCaptionManager(save_utterances_callback=self.save_utterances_callback, get_participant_callback=self.get_participant_callback)
+
+    def upsert_caption(self, text, caption_id=1):
+        self.manager.upsert_caption({"captionId": caption_id, "deviceId": "device_1", "text": text})
+
+    def test_caption_is_saved_fifteen_seconds_after_creation(self):
+        self.upsert_caption("Hello")
+        self.clock.now += 5
+        self.upsert_caption("Hello there")
+
+        self.clock.now += 9
+        self.manager.process_captions()
+        self.save_utterances_callback.assert_not_called()
+
+        self.clock.now += 1
+        self.manager.process_captions()
+        self.save_utterances_callback.assert_called_once()
+        (utterance,) = self.save_utterances_callback.call_args.args[0]
+        self.assertEqual(utterance["text"], "Hello there")
+        self.assertEqual(utterance["duration_ms"], 5000)
+        self.assertEqual(utterance["source_uuid_suffix"], "device_1-1")
+
+    def test_changes_after_saving_are_saved_once_they_settle(self):
+        self.upsert_caption("Hello")
+        self.clock.now += 15
+        self.manager.process_captions()
+
+        self.clock.now += 1
+        self.upsert_caption("Hello again")
+        self.clock.now += 14
+        self.manager.process_captions()
+        self.assertEqual(self.save_utterances_callback.call_count, 1)
+
+        self.clock.now += 1
+        self.manager.process_captions()
+        self.assertEqual(self.save_utterances_callback.call_count, 2)
+        self.assertEqual(self.save_utterances_callback.call_args.args[0][0]["text"], "Hello again")
+
+    def test_settled_caption_is_evicted(self):
+        self.upsert_caption("Hello")
+        self.clock.now += 15
+        self.manager.process_captions()
+
+        self.clock.now += 45
+        self.manager.process_captions()
+        self.assertEqual(len(self.manager.captions), 0)
+        self.assertEqual(len(self.manager.deadlines), 0)
+        self.save_utterances_callback.assert_called_once()
+
+    def test_ticks_only_touch_due_captions(self):
+        for caption_id in range(100):
+            self.upsert_caption("Hello", caption_id=caption_id)
+
+        self.clock.now += 1
+        self.manager.process_captions()
+        self.assertEqual(len(self.manager.deadlines), 100)
+        self.get_participant_callback.assert_not_called()
+
+    def test_caption_without_participant_is_retried(self):
+        self.get_participant_callback.return_value = None
+        self.upsert_caption("Hello")
+        self.clock.now += 15
+        self.manager.process_captions()
+        self.save_utterances_callback.assert_not_called()
+
+        self.get_participant_callback.return_value = {"participant_uuid": "device_1"}
+        self.clock.now += 1
+        self.manager.process_captions()
+        self.save_utterances_callback.assert_called_once()
+
+    def test_flush_saves_unsaved_captions(self):
+        self.upsert_caption("Hello")
+        self.manager.flush_captions()
+
+        self.save_utterances_callback.assert_called_once()
+
+    def test_due_captions_are_saved_together(self):
+        for caption_id in range(3):
+            self.upsert_caption("Hello", caption_id=caption_id)
+
+        self.clock.now += 15
+        self.manager.process_captions()
+        self.save_utterances_callback.assert_called_once()
+        self.assertEqual(len(self.save_utterances_callback.call_args.args[0]), 3)
+
+
+class TestSaveClosedCaptionUtterances(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://meet.google.com/abc-defg-hij")
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.NON_REALTIME,
+            state=RecordingStates.IN_PROGRESS,
+            is_default_recording=True,
+        )
+        self.controller = BotController(self.bot.id)
+
+    def caption_message(self, caption_id, text, participant_uuid="device_1"):
+        return {
+            "participant_uuid": participant_uuid,
+            "participant_user_uuid": None,
+            "participant_full_name": "Test User",
+            "timestamp_ms": 1000,
+            "duration_ms": 500,
+            "text": text,
+            "source_uuid_suffix": f"{participant_uuid}-{caption_id}",
+            "sample_rate": None,
+        }
+
+    def test_captions_are_upserted_by_source_uuid(self):
+        self.controller.save_closed_caption_utterances([self.caption_message(1, "Hello"), self.caption_message(2, "Hi", participant_uuid="device_2")])
+        self.controller.save_closed_caption_utterances([self.caption_message(1, "Hello there")])
+
+        utterances = Utterance.objects.filter(recording=self.recording).order_by("source_uuid")
+        self.assertEqual([utterance.transcription["transcript"] for utterance in utterances], ["Hello there", "Hi"])
+        self.assertEqual(utterances[0].source_uuid, f"{self.recording.object_id}-device_1-1")
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.transcription_state, RecordingTranscriptionStates.IN_PROGRESS)
+
+    def test_later_batches_only_write_utterances(self):
+        self.controller.save_closed_caption_utterances([self.caption_message(1, "Hello"), self.caption_message(2, "Hi")])
+
+        with self.assertNumQueries(1):
+            self.controller.save_closed_caption_utterances([self.caption_message(1, "Hello there"), self.caption_message(2, "Hi there")])
+
+    @patch("bots.tasks.process_utterance_task.process_utterance.delay")
+    def test_individual_audio_utterances_do_not_look_up_participant_or_recording(self, mock_process_utterance_delay):
+        message = {**self.caption_message(1, ""), "audio_data": b"\x00" * 640, "sample_rate": 32000}
+        self.controller.save_individual_audio_utterance(message)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.controller.save_individual_audio_utterance(message)
+
+        self.assertFalse([query["sql"] for query in queries if query["sql"].startswith("SELECT")])
+        self.assertEqual(Utterance.objects.filter(recording=self.recording, source=Utterance.Sources.PER_PARTICIPANT_AUDIO).count(), 2)
+
+    @patch("bots.models.trigger_webhook")
+    def test_cache_is_cleared_when_bot_changes_state(self, mock_trigger_webhook):
+        self.controller.save_closed_caption_utterances([self.caption_message(1, "Hello")])
+        self.assertIsNotNone(self.controller.recording_in_progress)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BotEventManager.create_event(self.bot, BotEventTypes.JOIN_REQUESTED)
+
+        self.assertIsNone(self.controller.recording_in_progress)
+        self.assertEqual(self.controller.participant_ids_by_uuid, {})
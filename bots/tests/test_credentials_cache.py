@@ -0,0 +1,101 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+import httpx
+from django.test import SimpleTestCase, TestCase
+
+from bots.credentials_cache import CredentialsCache
+from bots.models import Credentials, Organization, Project
+from bots.tasks import process_utterance_task
+
+
+class TestCredentialsCache(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.credentials = Credentials.objects.create(project=self.project, credential_type=Credentials.CredentialTypes.DEEPGRAM)
+        self.credentials.set_credentials({"api_key": "first_key"})
+        self.cache = CredentialsCache()
+
+    def test_returns_decrypted_credentials(self):
+        cached = self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.DEEPGRAM)
+        self.assertEqual(cached.data, {"api_key": "first_key"})
+
+    def test_returns_none_when_project_has_no_credentials(self):
+        self.assertIsNone(self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.GOOGLE_TTS))
+
+    def test_reuses_client_while_credentials_unchanged(self):
+        factory = MagicMock(side_effect=lambda data: object())
+
+        first_client = self.cache.get_client(self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.DEEPGRAM), "deepgram", factory)
+        second_client = self.cache.get_client(self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.DEEPGRAM), "deepgram", factory)
+
+        self.assertIs(first_client, second_client)
+        factory.assert_called_once_with({"api_key": "first_key"})
+
+    def test_credential_change_invalidates_cached_values(self):
+        factory = MagicMock(side_effect=lambda data: object())
+        first_client = self.cache.get_client(self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.DEEPGRAM), "deepgram", factory)
+
+        # Simulate another process updating the credentials, which changes updated_at
+        Credentials.objects.get(id=self.credentials.id).set_credentials({"api_key": "second_key"})
+
+        cached = self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.DEEPGRAM)
+        second_client = self.cache.get_client(cached, "deepgram", factory)
+
+        self.assertEqual(cached.data, {"api_key": "second_key"})
+        self.assertIsNot(first_client, second_client)
+        self.assertEqual(factory.call_count, 2)
+
+    def test_expired_entries_are_reloaded(self):
+        self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.DEEPGRAM)
+        self.cache.TTL_SECONDS = 0
+
+        with self.assertNumQueries(2):
+            self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.DEEPGRAM)
+
+    def test_cached_lookup_does_not_refetch_credentials(self):
+        self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.DEEPGRAM)
+
+        with self.assertNumQueries(1):
+            self.cache.get_credentials(self.project.id, Credentials.CredentialTypes.DEEPGRAM)
+
+
+class ConnectionCountingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connection_count += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestKeepAliveTransport(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("localhost", 0), ConnectionCountingHandler)
+        self.server.connection_count = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    @patch.object(process_utterance_task, "_keep_alive_transport", None)
+    def test_sequential_requests_reuse_one_connection(self):
+        url = f"http://localhost:{self.server.server_address[1]}/v1/listen"
+
+        for _ in range(5):
+            # The same way the Deepgram SDK makes each request
+            with httpx.Client(transport=process_utterance_task.get_keep_alive_transport()) as client:
+                self.assertEqual(client.post(url, content=b"audio").status_code, 200)
+
+        self.assertEqual(self.server.connection_count, 1)
@@ -0,0 +1,71 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from bots.bot_controller.individual_audio_input_manager import IndividualAudioInputManager
+from bots.bot_controller.main_loop_timers import MainLoopTimer, MainLoopTimers
+
+
+class TestMainLoopTimers(SimpleTestCase):
+    def setUp(self):
+        self.on_error_callback = MagicMock()
+        self.after_callback = MagicMock()
+        self.timers = MainLoopTimers(on_error_callback=self.on_error_callback, after_callback=self.after_callback)
+
+    @patch("bots.bot_controller.main_loop_timers.GLib")
+    def add_timer(self, name, interval_ms, callback, mock_glib):
+        self.timers.add_timer(name, interval_ms, callback)
+        mock_glib.timeout_add.assert_called_once()
+        return mock_glib.timeout_add.call_args.args[1]
+
+    def test_lag_is_how_late_the_timer_fired(self):
+        timer = MainLoopTimer("captions", 1000)
+        timer.record_fire(10.0)
+        timer.record_fire(11.0)
+        timer.record_fire(12.5)
+
+        self.assertEqual(timer.fire_count, 2)
+        self.assertEqual(timer.max_lag_seconds, 0.5)
+        self.assertEqual(timer.total_lag_seconds, 0.5)
+
+    def test_timer_runs_callback_and_keeps_running(self):
+        callback = MagicMock()
+        on_timeout = self.add_timer("captions", 1000, callback)
+
+        self.assertTrue(on_timeout())
+        self.assertTrue(on_timeout())
+        self.assertEqual(callback.call_count, 2)
+        self.assertEqual(self.after_callback.call_count, 2)
+
+    def test_failing_timer_stops_and_reports_error(self):
+        on_timeout = self.add_timer("captions", 1000, MagicMock(side_effect=Exception("database is down")))
+
+        self.assertFalse(on_timeout())
+        self.on_error_callback.assert_called_once()
+
+    def test_late_timers_are_reported_as_warnings(self):
+        with patch("bots.bot_controller.main_loop_timers.time.monotonic", side_effect=[10.0, 11.1, 12.9]):
+            on_timeout = self.add_timer("captions", 1000, MagicMock())
+            for _ in range(3):
+                on_timeout()
+
+        with self.assertLogs("bots.bot_controller.main_loop_timers", level="WARNING") as logs:
+            self.timers.report_lag()
+        self.assertIn("at most 800.0ms late", logs.output[0])
+        self.assertEqual(self.timers.timers["captions"].fire_count, 0)
+
+
+class TestIndividualAudioInputManagerScheduling(SimpleTestCase):
+    def test_processing_is_scheduled_once_per_batch_of_chunks(self):
+        chunks_added_callback = MagicMock()
+        manager = IndividualAudioInputManager(save_utterance_callback=MagicMock(), get_participant_callback=MagicMock(), chunks_added_callback=chunks_added_callback)
+
+        manager.add_chunk("speaker_1", None, b"\x00" * 640)
+        manager.add_chunk("speaker_1", None, b"\x00" * 640)
+        self.assertEqual(chunks_added_callback.call_count, 1)
+
+        manager.process_chunks()
+        self.assertTrue(manager.queue.empty())
+
+        manager.add_chunk("speaker_1", None, b"\x00" * 640)
+        self.assertEqual(chunks_added_callback.call_count, 2)
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import time
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from bots.media_cache import MediaCache, get_pcm_for_media_blob
+
+
+class TestMediaCache(SimpleTestCase):
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = temporary_directory.name
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = MediaCache(self.directory, max_bytes=250)
+        cache.put("a", b"a" * 100)
+        cache.put("b", b"b" * 100)
+        # Make "a" the most recently used entry
+        os.utime(cache.path_for_key("b"), (time.time() - 60, time.time() - 60))
+        self.assertEqual(cache.get("a"), b"a" * 100)
+
+        cache.put("c", b"c" * 100)
+
+        self.assertEqual(cache.get("a"), b"a" * 100)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), b"c" * 100)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["a", "c"])
+
+    def test_pcm_is_decoded_once_per_blob_and_sample_rate(self):
+        media_blob = MagicMock(checksum="abc123", blob=b"mp3 data")
+
+        with patch("bots.media_cache.media_cache", MediaCache(self.directory, max_bytes=1024)):
+            with patch("bots.media_cache.mp3_to_pcm", return_value=b"\x01\x00" * 10) as mock_mp3_to_pcm:
+                for _ in range(3):
+                    self.assertEqual(get_pcm_for_media_blob(media_blob, sample_rate=44100), b"\x01\x00" * 10)
+                get_pcm_for_media_blob(media_blob, sample_rate=16000)
+
+        self.assertEqual(mock_mp3_to_pcm.call_count, 2)
+        mock_mp3_to_pcm.assert_any_call(b"mp3 data", sample_rate=44100)
+        mock_mp3_to_pcm.assert_any_call(b"mp3 data", sample_rate=16000)
@@ -0,0 +1,69 @@
+import base64
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from bots.mp3_metadata import Mp3ParseError, parse_mp3_metadata
+from bots.utils import calculate_audio_duration_ms
+
+# Encoded by ffmpeg, with an Info header and the encoder delay in its LAME extension (same as in test_zoom_bot.py)
+FFMPEG_MP3 = base64.b64decode("SUQzBAAAAAAAI1RTU0UAAAAPAAADTGF2ZjU2LjM2LjEwMAAAAAAAAAAAAAAA//OEAAAAAAAAAAAAAAAAAAAAAAAASW5mbwAAAA8AAAAEAAABIADAwMDAwMDAwMDAwMDAwMDAwMDAwMDAwMDV1dXV1dXV1dXV1dXV1dXV1dXV1dXV1dXV6urq6urq6urq6urq6urq6urq6urq6urq6v////////////////////////////////8AAAAATGF2YzU2LjQxAAAAAAAAAAAAAAAAJAAAAAAAAAAAASDs90hvAAAAAAAAAAAAAAAAAAAA//MUZAAAAAGkAAAAAAAAA0gAAAAATEFN//MUZAMAAAGkAAAAAAAAA0gAAAAARTMu//MUZAYAAAGkAAAAAAAAA0gAAAAAOTku//MUZAkAAAGkAAAAAAAAA0gAAAAANVVV")
+
+# MPEG-1 Layer III, 128kbps, 44.1kHz, mono: 417 byte frames of 1152 samples
+FRAME_HEADER = b"\xff\xfb\x90\xc0"
+FRAME_LENGTH = 417
+
+
+def mp3_frames(count, first_frame_payload=b""):
+    frames = FRAME_HEADER + first_frame_payload.ljust(FRAME_LENGTH - 4, b"\x00")
+    return frames + (FRAME_HEADER + b"\x00" * (FRAME_LENGTH - 4)) * (count - 1)
+
+
+class TestMp3Metadata(SimpleTestCase):
+    def test_reads_info_header_and_encoder_delay(self):
+        metadata = parse_mp3_metadata(FFMPEG_MP3)
+
+        # 4 frames of 576 samples at 24kHz, less the 576 samples of encoder delay
+        self.assertEqual(metadata.duration_ms, 72)
+        self.assertEqual(metadata.sample_rate, 24000)
+        self.assertEqual(metadata.channels, 2)
+
+    def test_walks_frame_headers_without_vbr_header(self):
+        id3v2_tag = b"ID3\x04\x00\x00\x00\x00\x00\x0a" + b"\x00" * 10
+        id3v1_tag = b"TAG" + b"\x00" * 125
+
+        metadata = parse_mp3_metadata(id3v2_tag + mp3_frames(100) + id3v1_tag)
+
+        self.assertEqual(metadata.duration_ms, 100 * 1152 * 1000 // 44100)
+        self.assertEqual(metadata.sample_rate, 44100)
+        self.assertEqual(metadata.channels, 1)
+
+    def test_reads_xing_header(self):
+        # The Xing header comes after the side information, which is 17 bytes for MPEG-1 mono
+        xing_header = b"\x00" * 17 + b"Xing" + (0x1).to_bytes(4, "big") + (1000).to_bytes(4, "big")
+
+        self.assertEqual(parse_mp3_metadata(mp3_frames(2, xing_header)).duration_ms, 1000 * 1152 * 1000 // 44100)
+
+    def test_reads_vbri_header(self):
+        vbri_header = b"\x00" * 32 + b"VBRI" + b"\x00" * 10 + (500).to_bytes(4, "big")
+
+        self.assertEqual(parse_mp3_metadata(mp3_frames(2, vbri_header)).duration_ms, 500 * 1152 * 1000 // 44100)
+
+    def test_malformed_data_is_rejected(self):
+        with self.assertRaises(Mp3ParseError):
+            parse_mp3_metadata(b"not an mp3 file" * 100)
+        with self.assertRaises(Mp3ParseError):
+            parse_mp3_metadata(mp3_frames(10) + b"\x00" * 100 + mp3_frames(10))
+
+    @patch("bots.utils.AudioSegment")
+    def test_duration_is_read_without_decoding(self, MockAudioSegment):
+        self.assertEqual(calculate_audio_duration_ms(mp3_frames(100), "audio/mp3"), 2612)
+        MockAudioSegment.from_mp3.assert_not_called()
+
+    @patch("bots.utils.AudioSegment")
+    def test_malformed_files_are_decoded(self, MockAudioSegment):
+        MockAudioSegment.from_mp3.return_value = MagicMock(__len__=MagicMock(return_value=1234))
+
+        with self.assertLogs("bots.utils", level="WARNING"):
+            self.assertEqual(calculate_audio_duration_ms(b"not an mp3 file", "audio/mp3"), 1234)
+        MockAudioSegment.from_mp3.assert_called_once()
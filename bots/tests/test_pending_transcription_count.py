@@ -0,0 +1,95 @@
+from django.test import TestCase
+
+from bots.models import (
+    Bot,
+    Organization,
+    Participant,
+    Project,
+    Recording,
+    RecordingManager,
+    RecordingStates,
+    RecordingTranscriptionStates,
+    RecordingTypes,
+    TranscriptionTypes,
+    Utterance,
+)
+
+
+class TestPendingTranscriptionCount(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://test.com")
+        self.participant = Participant.objects.create(bot=self.bot, uuid="participant_1")
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.NON_REALTIME,
+            state=RecordingStates.IN_PROGRESS,
+            transcription_state=RecordingTranscriptionStates.IN_PROGRESS,
+        )
+
+    def create_utterance(self, timestamp_ms):
+        return RecordingManager.create_utterance_pending_transcription(
+            self.recording,
+            source=Utterance.Sources.PER_PARTICIPANT_AUDIO,
+            participant=self.participant,
+            audio_blob=b"\x00" * 64,
+            audio_format=Utterance.AudioFormat.PCM,
+            timestamp_ms=timestamp_ms,
+            duration_ms=1,
+            sample_rate=32000,
+        )
+
+    def test_counter_tracks_created_and_transcribed_utterances(self):
+        first_utterance = self.create_utterance(0)
+        self.create_utterance(100)
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.pending_transcription_count, 2)
+
+        self.assertTrue(RecordingManager.set_utterance_transcription(first_utterance, {"transcript": "hello"}))
+        self.assertEqual(first_utterance.recording.pending_transcription_count, 1)
+
+        first_utterance.refresh_from_db()
+        self.assertEqual(first_utterance.transcription, {"transcript": "hello"})
+        self.assertEqual(bytes(first_utterance.audio_blob), b"")
+
+    def test_transcribing_twice_only_decrements_once(self):
+        utterance = self.create_utterance(0)
+        RecordingManager.set_utterance_transcription(utterance, {"transcript": "hello"})
+
+        stale_utterance = Utterance.objects.get(id=utterance.id)
+        stale_utterance.transcription = None
+        self.assertFalse(RecordingManager.set_utterance_transcription(stale_utterance, {"transcript": "hello again"}))
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.pending_transcription_count, 0)
+
+    def test_full_save_of_stale_recording_does_not_overwrite_counter(self):
+        stale_recording = Recording.objects.get(id=self.recording.id)
+        self.create_utterance(0)
+
+        stale_recording.first_buffer_timestamp_ms = 123
+        stale_recording.save()
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.pending_transcription_count, 1)
+        self.assertEqual(self.recording.first_buffer_timestamp_ms, 123)
+
+    def test_recording_complete_completes_transcription_only_when_nothing_is_pending(self):
+        utterance = self.create_utterance(0)
+
+        RecordingManager.set_recording_complete(self.recording)
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.transcription_state, RecordingTranscriptionStates.IN_PROGRESS)
+
+        RecordingManager.set_utterance_transcription(utterance, {"transcript": "hello"})
+        self.assertEqual(utterance.recording.pending_transcription_count, 0)
+        self.assertTrue(RecordingManager.is_terminal_state(utterance.recording.state))
+
+    def test_recording_complete_without_pending_utterances_completes_transcription(self):
+        RecordingManager.set_recording_complete(self.recording)
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.transcription_state, RecordingTranscriptionStates.COMPLETE)
@@ -0,0 +1,34 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from bots.bot_controller.redis_command_coalescer import RedisCommandCoalescer
+
+
+@patch("bots.bot_controller.redis_command_coalescer.GLib")
+class TestRedisCommandCoalescer(SimpleTestCase):
+    def setUp(self):
+        self.dispatch_command_callback = MagicMock()
+        self.coalescer = RedisCommandCoalescer(dispatch_command_callback=self.dispatch_command_callback)
+
+    def test_burst_of_commands_is_dispatched_once_per_command(self, mock_glib):
+        for _ in range(10):
+            self.coalescer.add_command("sync_media_requests")
+        self.coalescer.add_command("sync")
+        self.coalescer.add_command("sync_media_requests")
+
+        mock_glib.timeout_add.assert_called_once_with(RedisCommandCoalescer.COALESCE_WINDOW_MS, self.coalescer.dispatch_pending_commands)
+        self.dispatch_command_callback.assert_not_called()
+
+        self.assertFalse(self.coalescer.dispatch_pending_commands())
+        self.assertEqual([call.args[0] for call in self.dispatch_command_callback.call_args_list], ["sync_media_requests", "sync"])
+        self.assertEqual(self.coalescer.received_count, 12)
+        self.assertEqual(self.coalescer.coalesced_count, 10)
+
+    def test_commands_after_dispatch_are_scheduled_again(self, mock_glib):
+        self.coalescer.add_command("sync")
+        self.coalescer.dispatch_pending_commands()
+        self.coalescer.add_command("sync")
+
+        self.assertEqual(mock_glib.timeout_add.call_count, 2)
+        self.assertEqual(self.coalescer.coalesced_count, 0)
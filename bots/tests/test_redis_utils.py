@@ -0,0 +1,21 @@
+import json
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from bots import redis_utils
+from bots.redis_utils import get_redis_client, publish_bot_commands
+
+
+class TestRedisUtils(SimpleTestCase):
+    def test_clients_share_a_connection_pool(self):
+        with patch.object(redis_utils, "_connection_pool", None):
+            self.assertIs(get_redis_client().connection_pool, get_redis_client().connection_pool)
+
+    @patch("bots.redis_utils.get_redis_client")
+    def test_commands_to_many_bots_are_published_in_one_round_trip(self, mock_get_redis_client):
+        publish_bot_commands([1, 2, 3], "sync_media_requests")
+
+        pipeline = mock_get_redis_client.return_value.pipeline.return_value
+        self.assertEqual([call.args for call in pipeline.publish.call_args_list], [(f"bot_{bot_id}", json.dumps({"command": "sync_media_requests"})) for bot_id in [1, 2, 3]])
+        pipeline.execute.assert_called_once()
@@ -0,0 +1,146 @@
+from unittest.mock import patch
+
+from django.db import DatabaseError
+from django.test import TestCase
+
+from bots.models import (
+    Bot,
+    Organization,
+    Participant,
+    Project,
+    Recording,
+    RecordingStates,
+    RecordingTranscriptionStates,
+    RecordingTypes,
+    RetranscribedUtterance,
+    RetranscriptionManager,
+    RetranscriptionStates,
+    TranscriptionTypes,
+    Utterance,
+)
+from bots.tasks.retranscribe_recording_task import CHUNK_UTTERANCES, MAX_PARALLEL_CHUNKS, SAMPLE_RATE, retranscribe_recording, retranscribe_recording_chunk
+
+FIRST_BUFFER_TIMESTAMP_MS = 1_700_000_000_000
+
+
+class TestRetranscription(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://test.com")
+        self.participant = Participant.objects.create(bot=self.bot, uuid="participant_1")
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.NON_REALTIME,
+            state=RecordingStates.COMPLETE,
+            transcription_state=RecordingTranscriptionStates.COMPLETE,
+            first_buffer_timestamp_ms=FIRST_BUFFER_TIMESTAMP_MS,
+            file="recording.mp4",
+        )
+
+    def create_utterances(self, count):
+        return [
+            Utterance.objects.create(
+                recording=self.recording,
+                participant=self.participant,
+                audio_blob=b"",
+                timestamp_ms=FIRST_BUFFER_TIMESTAMP_MS + index * 2000,
+                duration_ms=1000,
+                sample_rate=32000,
+                transcription={"transcript": f"old {index}"},
+            )
+            for index in range(count)
+        ]
+
+    def test_recording_must_be_finished(self):
+        self.recording.state = RecordingStates.IN_PROGRESS
+        self.recording.save()
+
+        with self.assertRaises(ValueError):
+            RetranscriptionManager.create_retranscription(self.recording, {})
+
+    def test_only_one_retranscription_at_a_time(self):
+        RetranscriptionManager.create_retranscription(self.recording, {})
+
+        with self.assertRaises(ValueError):
+            RetranscriptionManager.create_retranscription(self.recording, {})
+
+    @patch("bots.tasks.retranscribe_recording_task.transcription_limiter")
+    @patch("bots.tasks.retranscribe_recording_task.transcribe_audio")
+    @patch("bots.tasks.retranscribe_recording_task.extract_pcm_from_media")
+    @patch("bots.tasks.retranscribe_recording_task.retranscribe_recording_chunk.delay")
+    def test_transcript_is_swapped_in_once_every_chunk_is_done(self, mock_chunk_delay, mock_extract_pcm_from_media, mock_transcribe_audio, mock_limiter):
+        chunk_count = MAX_PARALLEL_CHUNKS + 1
+        utterances = self.create_utterances(CHUNK_UTTERANCES * chunk_count)
+        mock_extract_pcm_from_media.side_effect = lambda source, start_seconds, duration_seconds, sample_rate: b"\x01\x00" * int(duration_seconds * sample_rate)
+        mock_transcribe_audio.side_effect = lambda recording, audio, sample_rate, deepgram_settings: {"transcript": f"new {deepgram_settings['language']}"}
+
+        retranscription = RetranscriptionManager.create_retranscription(self.recording, {"deepgram": {"language": "es"}})
+        with patch.object(Recording.file.field.storage, "url", return_value="https://example.com/recording.mp4"):
+            retranscribe_recording.run(retranscription.id)
+
+            # Only MAX_PARALLEL_CHUNKS chunks are started up front
+            self.assertEqual([call.args[1] for call in mock_chunk_delay.call_args_list], list(range(MAX_PARALLEL_CHUNKS)))
+
+            for chunk_index in range(chunk_count - 1):
+                retranscribe_recording_chunk.run(retranscription.id, chunk_index)
+
+            # The last chunk was started by the first one to finish
+            self.assertEqual(mock_chunk_delay.call_args_list[-1].args[1], MAX_PARALLEL_CHUNKS)
+            # Nothing has been overwritten while chunks are outstanding
+            self.assertEqual(Utterance.objects.filter(recording=self.recording, transcription__transcript__startswith="new").count(), 0)
+
+            retranscribe_recording_chunk.run(retranscription.id, chunk_count - 1)
+
+        retranscription.refresh_from_db()
+        self.assertEqual(retranscription.state, RetranscriptionStates.COMPLETE)
+        self.assertEqual(Utterance.objects.filter(recording=self.recording, transcription={"transcript": "new es"}).count(), len(utterances))
+        self.assertEqual(RetranscribedUtterance.objects.get(utterance=utterances[0]).previous_transcription, {"transcript": "old 0"})
+
+        # Each utterance gets its own slice of the chunk's audio
+        self.assertEqual(len(mock_transcribe_audio.call_args_list[0].args[1]), SAMPLE_RATE * 2)
+        self.assertEqual(mock_extract_pcm_from_media.call_count, chunk_count)
+
+    @patch("bots.tasks.retranscribe_recording_task.transcription_limiter")
+    @patch("bots.tasks.retranscribe_recording_task.transcribe_audio")
+    @patch("bots.tasks.retranscribe_recording_task.extract_pcm_from_media")
+    @patch("bots.tasks.retranscribe_recording_task.retranscribe_recording_chunk.delay")
+    def test_failed_chunk_fails_retranscription_and_keeps_transcript(self, mock_chunk_delay, mock_extract_pcm_from_media, mock_transcribe_audio, mock_limiter):
+        self.create_utterances(1)
+        mock_extract_pcm_from_media.return_value = b"\x01\x00" * SAMPLE_RATE
+        mock_transcribe_audio.side_effect = Exception("provider error")
+
+        retranscription = RetranscriptionManager.create_retranscription(self.recording, {})
+        with patch.object(Recording.file.field.storage, "url", return_value="https://example.com/recording.mp4"):
+            retranscribe_recording.run(retranscription.id)
+            with self.assertRaises(Exception):
+                retranscribe_recording_chunk.run(retranscription.id, 0)
+
+        retranscription.refresh_from_db()
+        self.assertEqual(retranscription.state, RetranscriptionStates.FAILED)
+        self.assertEqual(Utterance.objects.get(recording=self.recording).transcription, {"transcript": "old 0"})
+
+    @patch("bots.tasks.retranscribe_recording_task.transcription_limiter")
+    @patch("bots.tasks.retranscribe_recording_task.transcribe_audio")
+    @patch("bots.tasks.retranscribe_recording_task.extract_pcm_from_media")
+    @patch("bots.tasks.retranscribe_recording_task.retranscribe_recording_chunk.delay")
+    def test_retried_chunk_is_only_counted_once(self, mock_chunk_delay, mock_extract_pcm_from_media, mock_transcribe_audio, mock_limiter):
+        self.create_utterances(CHUNK_UTTERANCES * (MAX_PARALLEL_CHUNKS + 1))
+        mock_extract_pcm_from_media.side_effect = lambda source, start_seconds, duration_seconds, sample_rate: b"\x01\x00" * int(duration_seconds * sample_rate)
+        mock_transcribe_audio.return_value = {"transcript": "new"}
+
+        retranscription = RetranscriptionManager.create_retranscription(self.recording, {})
+        with patch.object(Recording.file.field.storage, "url", return_value="https://example.com/recording.mp4"):
+            retranscribe_recording.run(retranscription.id)
+            # Starting the next chunk fails after the chunk was marked complete, so the whole task is retried
+            mock_chunk_delay.side_effect = [DatabaseError("connection lost"), None]
+            with self.assertRaises(DatabaseError):
+                retranscribe_recording_chunk.run(retranscription.id, 0)
+            retranscribe_recording_chunk.run(retranscription.id, 0)
+
+        retranscription.refresh_from_db()
+        self.assertEqual(retranscription.completed_chunk_indexes, [0])
+        self.assertEqual(retranscription.state, RetranscriptionStates.IN_PROGRESS)
+        # Already staged utterances weren't transcribed again
+        self.assertEqual(mock_transcribe_audio.call_count, CHUNK_UTTERANCES)
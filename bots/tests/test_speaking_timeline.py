@@ -0,0 +1,198 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import numpy as np
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from bots.bot_controller.bot_controller import BotController
+from bots.bot_controller.individual_audio_input_manager import IndividualAudioInputManager
+from bots.bot_controller.speaking_timeline_manager import SpeakingTimelineManager, float32_audio_is_speaking
+from bots.models import ApiKey, Bot, Organization, Participant, Project, SpeakingTimeline
+from bots.web_bot_adapter.web_bot_adapter import WebBotAdapter
+
+
+class TestSpeakingTimelineManager(SimpleTestCase):
+    def setUp(self):
+        self.save_timelines_callback = MagicMock()
+        self.manager = SpeakingTimelineManager(save_timelines_callback=self.save_timelines_callback)
+
+    def add_speech(self, speaker_id, start_ms, end_ms, frame_ms=20):
+        for timestamp_ms in range(start_ms, end_ms, frame_ms):
+            self.manager.add_audio_activity(speaker_id, timestamp_ms, frame_ms, True)
+            self.manager.add_audio_activity("silent_speaker", timestamp_ms, frame_ms, False)
+
+    def test_frames_are_run_length_encoded(self):
+        self.add_speech("alice", 1000, 2000)
+        # Too short a pause to end alice's turn
+        self.add_speech("alice", 2200, 3000)
+        self.add_speech("alice", 5000, 5500)
+        self.add_speech("bob", 3000, 4000)
+
+        self.manager.save_changed_timelines()
+
+        timelines = dict(self.save_timelines_callback.call_args.args[0])
+        self.assertEqual(
+            timelines["alice"],
+            {
+                "segments": [[1000, 2000], [5000, 500]],
+                "speaking_ms": 2500,
+                "segment_count": 2,
+                "first_spoke_at_ms": 1000,
+                "last_spoke_at_ms": 5500,
+            },
+        )
+        self.assertEqual(timelines["bob"]["segments"], [[3000, 1000]])
+        self.assertNotIn("silent_speaker", timelines)
+
+    def test_only_changed_timelines_are_saved(self):
+        self.add_speech("alice", 1000, 2000)
+        self.add_speech("bob", 1000, 2000)
+        self.manager.save_changed_timelines()
+
+        self.add_speech("bob", 2000, 2500)
+        self.manager.save_changed_timelines()
+        self.manager.save_changed_timelines()
+
+        self.assertEqual(self.save_timelines_callback.call_count, 2)
+        ((speaker_id, timeline),) = self.save_timelines_callback.call_args.args[0]
+        self.assertEqual(speaker_id, "bob")
+        self.assertEqual(timeline["segments"], [[1000, 1500]])
+
+    def test_segments_are_capped_by_merging_the_closest(self):
+        self.manager.MAX_SEGMENTS_PER_SPEAKER = 3
+        for start_ms in (0, 1500, 2600, 5100):
+            self.add_speech("alice", start_ms, start_ms + 500)
+
+        self.manager.save_changed_timelines()
+
+        ((_, timeline),) = self.save_timelines_callback.call_args.args[0]
+        # The 600ms pause between the second and third segment was the shortest
+        self.assertEqual(timeline["segments"], [[0, 500], [1500, 1600], [5100, 500]])
+        self.assertEqual(timeline["speaking_ms"], 2000)
+        self.assertEqual(timeline["last_spoke_at_ms"], 5600)
+
+    def test_web_adapter_times_speech_by_the_frames_capture_time(self):
+        adapter = WebBotAdapter.__new__(WebBotAdapter)
+        adapter.add_speaking_activity_callback = self.manager.add_audio_activity
+        adapter.add_audio_stream_chunk_callback = None
+        adapter.add_mixed_audio_chunk_callback = None
+        adapter.audio_sample_rate = 48000
+        adapter.first_buffer_timestamp_ms_offset = 1000000
+        audio = np.full(480, 0.1, dtype=np.float32).tobytes()
+
+        # Ten 10ms frames captured a second apart, arriving together
+        for index in range(10):
+            timestamp_us = index * 1000000
+            adapter.process_audio_frame(b"\x02\x00\x00\x00" + timestamp_us.to_bytes(8, "little") + (5).to_bytes(4, "little") + audio)
+        self.manager.save_changed_timelines()
+
+        ((speaker_id, timeline),) = self.save_timelines_callback.call_args.args[0]
+        self.assertEqual(speaker_id, 5)
+        self.assertEqual(timeline["segments"], [[1000000 + index * 1000, 10] for index in range(10)])
+        self.assertEqual(timeline["speaking_ms"], 100)
+
+    def test_quiet_audio_is_not_speech(self):
+        self.assertFalse(float32_audio_is_speaking(np.full(480, 0.001, dtype=np.float32)))
+        self.assertTrue(float32_audio_is_speaking(np.full(480, 0.1, dtype=np.float32)))
+
+    def test_per_participant_audio_is_added_to_the_timeline(self):
+        speaking_activity_callback = MagicMock()
+        individual_audio_input_manager = IndividualAudioInputManager(
+            save_utterance_callback=MagicMock(),
+            get_participant_callback=MagicMock(),
+            speaking_activity_callback=speaking_activity_callback,
+        )
+        chunk_time = datetime(2025, 1, 1, 12, 0, 0)
+
+        # 10ms of silence at 32kHz
+        individual_audio_input_manager.process_chunk("alice", chunk_time, b"\x00\x00" * 320)
+        # Called by process_chunks to catch speakers that went silent, without audio
+        individual_audio_input_manager.process_chunk("alice", chunk_time, None)
+
+        speaking_activity_callback.assert_called_once_with("alice", chunk_time.timestamp() * 1000, 10, False)
+
+
+class TestSpeakingTimelineStorage(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://meet.google.com/abc-defg-hij")
+        _, self.api_key = ApiKey.create(project=self.project, name="Test Key")
+
+        self.controller = BotController.__new__(BotController)
+        self.controller.bot_in_db = self.bot
+        self.controller.participant_ids_by_uuid = {}
+        self.controller.adapter = MagicMock()
+        self.controller.adapter.get_participant.side_effect = lambda speaker_id: ({"participant_uuid": speaker_id, "participant_full_name": "Alice", "participant_user_uuid": None} if speaker_id == "alice" else None)
+        self.manager = SpeakingTimelineManager(save_timelines_callback=self.controller.save_speaking_timelines)
+        self.controller.speaking_timeline_manager = self.manager
+
+    def get_speaking_timeline(self, **params):
+        return self.client.get(
+            reverse("bot-speaking-timeline", kwargs={"object_id": self.bot.object_id}),
+            params,
+            HTTP_AUTHORIZATION=f"Token {self.api_key}",
+        )
+
+    def test_timelines_are_saved_and_served(self):
+        for timestamp_ms in range(1000, 3000, 20):
+            self.manager.add_audio_activity("alice", timestamp_ms, 20, True)
+        self.manager.add_audio_activity(7, 1000, 500, True)
+        self.manager.save_changed_timelines()
+        # The next save updates the same rows
+        self.manager.add_audio_activity("alice", 5000, 1000, True)
+        self.manager.save_changed_timelines()
+
+        self.assertEqual(SpeakingTimeline.objects.filter(bot=self.bot).count(), 2)
+        alice_timeline = SpeakingTimeline.objects.get(bot=self.bot, speaker_id="alice")
+        self.assertEqual(alice_timeline.participant, Participant.objects.get(bot=self.bot, uuid="alice"))
+
+        response = self.get_speaking_timeline()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "speaker_id": "alice",
+                    "speaker_type": "participant",
+                    "speaker_name": "Alice",
+                    "speaker_uuid": "alice",
+                    "speaking_ms": 3000,
+                    "segment_count": 2,
+                    "first_spoke_at_ms": 1000,
+                    "last_spoke_at_ms": 6000,
+                },
+                {
+                    "speaker_id": "7",
+                    "speaker_type": "audio_stream",
+                    "speaker_name": None,
+                    "speaker_uuid": None,
+                    "speaking_ms": 500,
+                    "segment_count": 1,
+                    "first_spoke_at_ms": 1000,
+                    "last_spoke_at_ms": 1500,
+                },
+            ],
+        )
+
+        response = self.get_speaking_timeline(include_segments="true")
+        self.assertEqual(response.json()[0]["segments"], [[1000, 2000], [5000, 1000]])
+
+    def test_summary_does_not_load_segments(self):
+        SpeakingTimeline.objects.create(bot=self.bot, speaker_id="alice", segments=[[index * 1000, 500] for index in range(10000)], speaking_ms=5000000, segment_count=10000)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_speaking_timeline()
+
+        self.assertEqual(response.json()[0]["speaking_ms"], 5000000)
+        timeline_query = next(query["sql"] for query in queries.captured_queries if "bots_speakingtimeline" in query["sql"])
+        self.assertNotIn("segments", timeline_query)
+
+    def test_other_projects_bots_are_not_found(self):
+        other_project = Project.objects.create(name="Other Project", organization=self.organization)
+        _, self.api_key = ApiKey.create(project=other_project, name="Other Key")
+
+        self.assertEqual(self.get_speaking_timeline().status_code, 404)
@@ -0,0 +1,205 @@
+import time
+from unittest.mock import MagicMock, patch
+
+from concurrency.exceptions import RecordModifiedError
+from django.db import connection
+from django.db.models import BinaryField
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from bots.bot_controller.bot_controller import BotController
+from bots.models import (
+    Bot,
+    BotEventManager,
+    BotEventTypes,
+    BotMediaRequest,
+    BotMediaRequestManager,
+    BotMediaRequestMediaTypes,
+    BotMediaRequestStates,
+    BotStates,
+    MediaBlob,
+    Organization,
+    Project,
+    Recording,
+    RecordingManager,
+    RecordingStates,
+    RecordingTranscriptionStates,
+    RecordingTypes,
+    TranscriptionTypes,
+)
+
+# Bots carry their full settings in their row, so rewriting the row on every state change is expensive
+LARGE_BOT_SETTINGS = {"transcription_settings": {"deepgram": {"language": "en", "keyterms": [f"term {index}" for index in range(500)]}}}
+
+
+@patch("bots.models.bot_heartbeat_store")
+@patch("bots.models.trigger_webhook")
+class TestStateManagerWrites(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://test.com", settings=LARGE_BOT_SETTINGS)
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.NON_REALTIME,
+            is_default_recording=True,
+        )
+        self.media_request = BotMediaRequest.objects.create(bot=self.bot, text_to_speak="Hello", media_type=BotMediaRequestMediaTypes.AUDIO)
+
+    def run_bot_lifecycle(self):
+        BotEventManager.create_event(self.bot, BotEventTypes.JOIN_REQUESTED)
+        BotEventManager.set_requested_bot_action_taken_at(self.bot)
+        BotEventManager.create_event(self.bot, BotEventTypes.BOT_JOINED_MEETING)
+        BotEventManager.create_event(self.bot, BotEventTypes.BOT_RECORDING_PERMISSION_GRANTED)
+        RecordingManager.set_recording_transcription_in_progress(self.recording)
+        BotMediaRequestManager.set_media_request_playing(self.media_request)
+        BotMediaRequestManager.set_media_request_finished(self.media_request)
+        BotEventManager.create_event(self.bot, BotEventTypes.LEAVE_REQUESTED)
+        BotEventManager.set_requested_bot_action_taken_at(self.bot)
+        BotEventManager.create_event(self.bot, BotEventTypes.BOT_LEFT_MEETING)
+        BotEventManager.create_event(self.bot, BotEventTypes.POST_PROCESSING_COMPLETED)
+
+    def test_bot_lifecycle_writes(self, mock_trigger_webhook, mock_heartbeat_store):
+        mock_heartbeat_store.get.return_value = (1000, 1060)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.run_bot_lifecycle()
+
+        updates = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+        bytes_written = sum(len(sql) for sql in updates)
+
+        # Before field scoped writes: 61 queries, 14 updates, 42,010 bytes of UPDATE statements
+        self.assertLessEqual(len(queries), 47)
+        self.assertLessEqual(bytes_written, 5000)
+
+        self.bot.refresh_from_db()
+        self.recording.refresh_from_db()
+        self.media_request.refresh_from_db()
+        self.assertEqual(self.bot.state, BotStates.ENDED)
+        self.assertEqual(self.bot.settings, LARGE_BOT_SETTINGS)
+        self.assertEqual((self.bot.first_heartbeat_timestamp, self.bot.last_heartbeat_timestamp), (1000, 1060))
+        self.assertEqual(self.recording.state, RecordingStates.COMPLETE)
+        self.assertIsNotNone(self.recording.completed_at)
+        self.assertEqual(self.recording.transcription_state, RecordingTranscriptionStates.COMPLETE)
+        self.assertEqual(self.media_request.state, BotMediaRequestStates.FINISHED)
+
+    def test_state_change_bumps_version(self, mock_trigger_webhook, mock_heartbeat_store):
+        mock_heartbeat_store.get.return_value = (None, None)
+        stale_bot = Bot.objects.get(id=self.bot.id)
+
+        BotEventManager.create_event(self.bot, BotEventTypes.JOIN_REQUESTED)
+
+        # The bot that made the change holds the row's new version and can still save
+        self.assertGreater(self.bot.version, stale_bot.version)
+        self.assertEqual(self.bot.version, Bot.objects.get(id=self.bot.id).version)
+        self.bot.name = "Renamed"
+        self.bot.save()
+
+        # Anyone still holding the old row can't overwrite the state change
+        stale_bot.name = "Renamed"
+        with self.assertRaises(RecordModifiedError):
+            stale_bot.save()
+
+    def test_concurrent_recording_state_change_is_detected(self, mock_trigger_webhook, mock_heartbeat_store):
+        self.recording.state = RecordingStates.IN_PROGRESS
+        self.recording.save()
+
+        # Another process completes the recording between our read and our write
+        original_refresh_from_db = Recording.refresh_from_db
+
+        def refresh_then_complete(recording, *args, **kwargs):
+            original_refresh_from_db(recording, *args, **kwargs)
+            Recording.objects.filter(id=recording.id).update(state=RecordingStates.COMPLETE)
+
+        with patch.object(Recording, "refresh_from_db", refresh_then_complete):
+            with self.assertRaises(RecordModifiedError):
+                RecordingManager.set_recording_failed(self.recording)
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.state, RecordingStates.COMPLETE)
+
+    def test_media_request_state_change_only_applies_to_expected_state(self, mock_trigger_webhook, mock_heartbeat_store):
+        BotMediaRequest.objects.filter(id=self.media_request.id).update(state=BotMediaRequestStates.DROPPED)
+
+        with self.assertRaises(RecordModifiedError):
+            BotMediaRequestManager.set_media_request_playing(self.media_request)
+
+        self.media_request.refresh_from_db()
+        self.assertEqual(self.media_request.state, BotMediaRequestStates.DROPPED)
+
+    def test_webhooks_are_triggered_after_commit(self, mock_trigger_webhook, mock_heartbeat_store):
+        mock_heartbeat_store.get.return_value = (None, None)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            BotEventManager.create_event(self.bot, BotEventTypes.JOIN_REQUESTED)
+        mock_trigger_webhook.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        mock_trigger_webhook.assert_called_once()
+        self.assertEqual(mock_trigger_webhook.call_args.kwargs["payload"]["new_state"], "joining")
+
+    def test_row_lock_is_not_held_during_webhook_fan_out(self, mock_trigger_webhook, mock_heartbeat_store):
+        mock_heartbeat_store.get.return_value = (None, None)
+        # Stands in for the subscription query, delivery attempt inserts and Celery publishes
+        mock_trigger_webhook.side_effect = lambda **kwargs: time.sleep(0.2)
+
+        # create_event's transaction, and so the row lock, ends before its on commit callbacks run
+        with self.captureOnCommitCallbacks() as callbacks:
+            transition_started_at = time.monotonic()
+            BotEventManager.create_event(self.bot, BotEventTypes.JOIN_REQUESTED)
+            lock_hold_seconds = time.monotonic() - transition_started_at
+        for callback in callbacks:
+            callback()
+
+        mock_trigger_webhook.assert_called_once()
+        # Before webhooks were deferred, the lock was held for the whole fan out, over 200ms here
+        self.assertLess(lock_hold_seconds, 0.2)
+
+
+class TestSupersededMediaRequests(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://test.com", state=BotStates.JOINED_RECORDING)
+        self.image_blob = MediaBlob.get_or_create_from_blob(project=self.project, blob=b"png data", content_type="image/png")
+
+        self.controller = BotController.__new__(BotController)
+        self.controller.bot_in_db = self.bot
+        self.controller.adapter = MagicMock()
+
+    def enqueue_images(self, count):
+        BotMediaRequest.objects.bulk_create([BotMediaRequest(bot=self.bot, media_blob=self.image_blob, media_type=BotMediaRequestMediaTypes.IMAGE) for _ in range(count)])
+        return list(BotMediaRequest.objects.filter(bot=self.bot).order_by("created_at", "id"))
+
+    def test_superseded_image_requests_are_dropped_in_one_update(self):
+        # A bot receiving a few hundred image requests between syncs
+        requests = self.enqueue_images(300)
+
+        # Postgres returns BinaryField values as memoryviews, unlike SQLite
+        with CaptureQueriesContext(connection) as queries, patch.object(BinaryField, "from_db_value", lambda field, value, expression, connection: None if value is None else memoryview(value), create=True):
+            self.controller.take_action_based_on_image_media_requests_in_db()
+
+        updates = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+        # Before set based transitions: 305 queries, 301 updates
+        self.assertLessEqual(len(queries), 5)
+        self.assertEqual(len(updates), 3)
+
+        newest_request = max(requests, key=lambda request: (request.created_at, request.id))
+        self.controller.adapter.send_raw_image.assert_called_once()
+        (image_bytes,) = self.controller.adapter.send_raw_image.call_args.args
+        # A memoryview compares equal to the same bytes, so check the type too
+        self.assertIsInstance(image_bytes, bytes)
+        self.assertEqual(image_bytes, b"png data")
+        self.assertEqual(BotMediaRequest.objects.get(id=newest_request.id).state, BotMediaRequestStates.FINISHED)
+        self.assertEqual(BotMediaRequest.objects.filter(state=BotMediaRequestStates.DROPPED).count(), 299)
+
+    def test_only_enqueued_or_playing_requests_are_dropped(self):
+        finished_request, enqueued_request = self.enqueue_images(2)
+        BotMediaRequest.objects.filter(id=finished_request.id).update(state=BotMediaRequestStates.FINISHED)
+
+        self.assertEqual(BotMediaRequestManager.set_media_requests_dropped(BotMediaRequest.objects.filter(bot=self.bot)), 1)
+
+        self.assertEqual(BotMediaRequest.objects.get(id=finished_request.id).state, BotMediaRequestStates.FINISHED)
+        self.assertEqual(BotMediaRequest.objects.get(id=enqueued_request.id).state, BotMediaRequestStates.DROPPED)
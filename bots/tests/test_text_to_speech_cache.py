@@ -0,0 +1,90 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+
+from bots.bot_controller.text_to_speech import generate_audio_from_text
+from bots.credentials_cache import CredentialsCache
+from bots.models import Bot, Credentials, Organization, Project
+from bots.text_to_speech_cache import TextToSpeechCache, TextToSpeechCacheResults
+
+TEXT_TO_SPEECH_SETTINGS = {"google": {"voice_language_code": "en-US", "voice_name": "en-US-Casual-K"}}
+
+
+class TestTextToSpeechCache(TestCase):
+    def setUp(self):
+        self.storage = MagicMock()
+        self.storage.open.side_effect = FileNotFoundError
+        self.redis_client = MagicMock()
+        self.cache = TextToSpeechCache(memory_max_bytes=100, storage_enabled=True, storage=self.storage, redis_client=self.redis_client)
+
+    def recorded_results(self):
+        return [call.args[1] for call in self.redis_client.hincrby.call_args_list]
+
+    def test_key_depends_on_text_voice_and_sample_rate(self):
+        key = TextToSpeechCache.key("google", "Hello", {"voice_name": "a"}, 44100)
+
+        self.assertEqual(key, TextToSpeechCache.key("google", "Hello", {"voice_name": "a"}, 44100))
+        self.assertNotEqual(key, TextToSpeechCache.key("google", "Hello!", {"voice_name": "a"}, 44100))
+        self.assertNotEqual(key, TextToSpeechCache.key("google", "Hello", {"voice_name": "b"}, 44100))
+        self.assertNotEqual(key, TextToSpeechCache.key("google", "Hello", {"voice_name": "a"}, 16000))
+
+    def test_miss_synthesizes_and_fills_both_tiers(self):
+        synthesize = MagicMock(return_value=b"audio")
+
+        self.assertEqual(self.cache.get_or_synthesize("key", synthesize), b"audio")
+        self.assertEqual(self.cache.get_or_synthesize("key", synthesize), b"audio")
+
+        synthesize.assert_called_once()
+        self.assertEqual(self.storage.save.call_args.args[0], "key.pcm")
+        self.assertEqual(self.recorded_results(), [TextToSpeechCacheResults.MISS, TextToSpeechCacheResults.MEMORY_HIT])
+
+    def test_storage_hit_skips_synthesis(self):
+        self.storage.open.side_effect = None
+        self.storage.open.return_value.__enter__.return_value.read.return_value = b"stored audio"
+        synthesize = MagicMock()
+
+        self.assertEqual(self.cache.get_or_synthesize("key", synthesize), b"stored audio")
+
+        synthesize.assert_not_called()
+        self.assertEqual(self.cache.get_from_memory("key"), b"stored audio")
+        self.assertEqual(self.recorded_results(), [TextToSpeechCacheResults.STORAGE_HIT])
+
+    def test_memory_tier_evicts_least_recently_used(self):
+        self.cache.put_in_memory("a", b"a" * 40)
+        self.cache.put_in_memory("b", b"b" * 40)
+        self.cache.get_from_memory("a")
+        self.cache.put_in_memory("c", b"c" * 40)
+
+        self.assertEqual(list(self.cache.memory), ["a", "c"])
+        self.assertEqual(self.cache.memory_bytes, 80)
+
+    def test_metrics(self):
+        self.redis_client.hgetall.return_value = {b"memory_hits": b"6", b"storage_hits": b"2", b"misses": b"2"}
+
+        self.assertEqual(self.cache.get_metrics(), {"memory_hits": 6, "storage_hits": 2, "misses": 2, "hit_rate": 0.8})
+
+
+class TestGenerateAudioFromText(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://test.com")
+        credentials = Credentials.objects.create(project=self.project, credential_type=Credentials.CredentialTypes.GOOGLE_TTS)
+        credentials.set_credentials({"service_account_json": json.dumps({"type": "service_account"})})
+
+    @patch("bots.bot_controller.text_to_speech.texttospeech.TextToSpeechClient")
+    def test_repeated_text_reuses_client_and_audio(self, MockTextToSpeechClient):
+        client = MockTextToSpeechClient.from_service_account_info.return_value
+        client.synthesize_speech.return_value.audio_content = b"\x00" * 44 + b"\x01\x00" * 44100
+
+        with patch("bots.bot_controller.text_to_speech.credentials_cache", CredentialsCache()):
+            with patch("bots.bot_controller.text_to_speech.text_to_speech_cache", TextToSpeechCache(storage_enabled=False, redis_client=MagicMock())):
+                for _ in range(3):
+                    audio, duration_ms = generate_audio_from_text(self.bot, "Hello", TEXT_TO_SPEECH_SETTINGS, 44100)
+                    self.assertEqual(audio, b"\x01\x00" * 44100)
+                    self.assertEqual(duration_ms, 1000)
+                generate_audio_from_text(self.bot, "Goodbye", TEXT_TO_SPEECH_SETTINGS, 44100)
+
+        MockTextToSpeechClient.from_service_account_info.assert_called_once_with({"type": "service_account"})
+        self.assertEqual(client.synthesize_speech.call_count, 2)
@@ -0,0 +1,131 @@
+import json
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from bots.models import (
+    Bot,
+    Organization,
+    Participant,
+    Project,
+    Recording,
+    RecordingManager,
+    RecordingStates,
+    RecordingTranscriptionStates,
+    RecordingTypes,
+    TranscriptionProviders,
+    TranscriptionTypes,
+    Utterance,
+)
+from bots.tasks.process_utterance_task import process_utterance
+from bots.transcription_limiter import TranscriptionConcurrencyLimiter, TranscriptionLanes
+
+
+class TestTranscriptionConcurrencyLimiter(TestCase):
+    def test_backlog_leaves_reserved_slots_for_live_utterances(self):
+        limiter = TranscriptionConcurrencyLimiter(max_concurrency=10, reserved_live_slots=2, redis_client=MagicMock())
+
+        self.assertEqual(limiter.lane_limit(TranscriptionLanes.LIVE), 10)
+        self.assertEqual(limiter.lane_limit(TranscriptionLanes.BACKLOG), 8)
+
+    def test_backlog_always_gets_a_slot(self):
+        limiter = TranscriptionConcurrencyLimiter(max_concurrency=2, reserved_live_slots=5, redis_client=MagicMock())
+
+        self.assertEqual(limiter.lane_limit(TranscriptionLanes.BACKLOG), 1)
+
+    def test_disabled_limiter_does_not_touch_redis(self):
+        redis_client = MagicMock()
+        limiter = TranscriptionConcurrencyLimiter(max_concurrency=0, reserved_live_slots=0, redis_client=redis_client)
+
+        lease = limiter.acquire(1, TranscriptionProviders.DEEPGRAM, TranscriptionLanes.LIVE, waiter_id="utterance_1")
+        limiter.release(lease)
+
+        self.assertIsNotNone(lease)
+        redis_client.assert_not_called()
+        redis_client.register_script.assert_not_called()
+        redis_client.zrem.assert_not_called()
+
+    def test_acquire_passes_lane_limit_to_script(self):
+        redis_client = MagicMock()
+        script = MagicMock(return_value=b"1.5")
+        redis_client.register_script.return_value = script
+        limiter = TranscriptionConcurrencyLimiter(max_concurrency=10, reserved_live_slots=2, redis_client=redis_client)
+
+        lease = limiter.acquire(1, TranscriptionProviders.DEEPGRAM, TranscriptionLanes.BACKLOG, waiter_id="utterance_1")
+
+        self.assertEqual(lease.wait_seconds, 1.5)
+        self.assertEqual(script.call_args.kwargs["args"][0], 8)
+        self.assertEqual(script.call_args.kwargs["keys"][1], "transcription_limiter:deepgram:1:backlog:waiting")
+
+        limiter.release(lease)
+        redis_client.zrem.assert_called_once_with("transcription_limiter:deepgram:1:leases", lease.token)
+
+    def test_acquire_returns_none_when_no_slot_is_free(self):
+        redis_client = MagicMock()
+        redis_client.register_script.return_value = MagicMock(return_value=None)
+        limiter = TranscriptionConcurrencyLimiter(max_concurrency=1, reserved_live_slots=0, redis_client=redis_client)
+
+        self.assertIsNone(limiter.acquire(1, TranscriptionProviders.DEEPGRAM, TranscriptionLanes.LIVE, waiter_id="utterance_1"))
+
+    @patch("bots.management.commands.transcription_limiter_metrics.transcription_limiter")
+    def test_metrics_command_reports_providers_by_name(self, mock_limiter):
+        mock_limiter.redis_client.scan_iter.return_value = [b"transcription_limiter:deepgram:1:live:stats"]
+        mock_limiter.get_metrics.return_value = {"in_flight": 0, "lanes": {}}
+        stdout = StringIO()
+
+        call_command("transcription_limiter_metrics", stdout=stdout)
+
+        mock_limiter.redis_client.scan_iter.assert_called_once_with(match="transcription_limiter:deepgram:*:stats")
+        mock_limiter.get_metrics.assert_called_once_with("1", TranscriptionProviders.DEEPGRAM)
+        self.assertEqual(json.loads(stdout.getvalue()), {"project_id": "1", "provider": "deepgram", "in_flight": 0, "lanes": {}})
+
+
+class TestProcessUtteranceConcurrencyLimit(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://test.com")
+        self.participant = Participant.objects.create(bot=self.bot, uuid="participant_1")
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.NON_REALTIME,
+            state=RecordingStates.IN_PROGRESS,
+            transcription_state=RecordingTranscriptionStates.NOT_STARTED,
+        )
+        self.utterance = RecordingManager.create_utterance_pending_transcription(
+            self.recording,
+            source=Utterance.Sources.PER_PARTICIPANT_AUDIO,
+            participant=self.participant,
+            audio_blob=b"\x00" * 64,
+            audio_format=Utterance.AudioFormat.PCM,
+            timestamp_ms=0,
+            duration_ms=1,
+            sample_rate=32000,
+        )
+
+    @patch("bots.tasks.process_utterance_task.transcribe_utterance")
+    @patch("bots.tasks.process_utterance_task.process_utterance.apply_async")
+    @patch("bots.tasks.process_utterance_task.transcription_limiter")
+    def test_utterance_is_requeued_when_project_is_at_its_limit(self, mock_limiter, mock_apply_async, mock_transcribe_utterance):
+        mock_limiter.acquire.return_value = None
+        mock_limiter.retry_delay_seconds.return_value = 1
+
+        process_utterance.run(self.utterance.id)
+
+        self.assertEqual(mock_limiter.acquire.call_args.args[2], TranscriptionLanes.LIVE)
+        mock_apply_async.assert_called_once_with(args=[self.utterance.id], countdown=1)
+        mock_transcribe_utterance.assert_not_called()
+
+    @patch("bots.tasks.process_utterance_task.transcribe_utterance")
+    @patch("bots.tasks.process_utterance_task.transcription_limiter")
+    def test_utterances_of_ended_recordings_use_backlog_lane_and_release_their_slot(self, mock_limiter, mock_transcribe_utterance):
+        RecordingManager.set_recording_complete(self.recording)
+
+        process_utterance.run(self.utterance.id)
+
+        self.assertEqual(mock_limiter.acquire.call_args.args[2], TranscriptionLanes.BACKLOG)
+        mock_transcribe_utterance.assert_called_once()
+        mock_limiter.release.assert_called_once_with(mock_limiter.acquire.return_value)
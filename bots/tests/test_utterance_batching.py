@@ -0,0 +1,102 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from bots.models import (
+    Bot,
+    Organization,
+    Participant,
+    Project,
+    Recording,
+    RecordingManager,
+    RecordingStates,
+    RecordingTranscriptionStates,
+    RecordingTypes,
+    TranscriptionTypes,
+    Utterance,
+)
+from bots.tasks.process_utterance_task import BATCH_SILENCE_GAP_SECONDS, split_batch_transcription, transcribe_utterance_batch
+
+SAMPLE_RATE = 16000
+
+
+def word(text, start, end):
+    return {"word": text.lower(), "punctuated_word": text, "start": start, "end": end, "confidence": 0.5}
+
+
+class TestSplitBatchTranscription(TestCase):
+    def test_words_are_assigned_by_offset_and_made_relative(self):
+        transcription = {"transcript": "Hello there. Hi.", "words": [word("Hello", 0.1, 0.4), word("there.", 0.5, 0.9), word("Hi.", 3.2, 3.5)]}
+
+        first, second = split_batch_transcription(transcription, [0.0, 3.0])
+
+        self.assertEqual(first["transcript"], "Hello there.")
+        self.assertEqual(second["transcript"], "Hi.")
+        self.assertAlmostEqual(second["words"][0]["start"], 0.2)
+        self.assertAlmostEqual(second["words"][0]["end"], 0.5)
+
+    def test_utterance_without_words_gets_empty_transcription(self):
+        first, second = split_batch_transcription({"transcript": "Hello", "words": [word("Hello", 0.1, 0.4)]}, [0.0, 3.0])
+
+        self.assertEqual(second, {"transcript": "", "confidence": 0, "words": []})
+
+
+class TestTranscribeUtteranceBatch(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://test.com")
+        self.participant = Participant.objects.create(bot=self.bot, uuid="participant_1")
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.NON_REALTIME,
+            state=RecordingStates.IN_PROGRESS,
+            transcription_state=RecordingTranscriptionStates.IN_PROGRESS,
+        )
+
+    def create_utterance(self, timestamp_ms, audio_seconds):
+        return RecordingManager.create_utterance_pending_transcription(
+            self.recording,
+            source=Utterance.Sources.PER_PARTICIPANT_AUDIO,
+            participant=self.participant,
+            audio_blob=b"\x01\x00" * int(SAMPLE_RATE * audio_seconds),
+            audio_format=Utterance.AudioFormat.PCM,
+            timestamp_ms=timestamp_ms,
+            duration_ms=int(audio_seconds * 1000),
+            sample_rate=SAMPLE_RATE,
+        )
+
+    @patch("bots.tasks.process_utterance_task.transcribe_audio")
+    def test_pending_utterances_are_transcribed_in_one_request(self, mock_transcribe_audio):
+        first_utterance = self.create_utterance(0, 2)
+        second_utterance = self.create_utterance(5000, 1)
+        second_utterance_offset = 2 + BATCH_SILENCE_GAP_SECONDS
+        mock_transcribe_audio.return_value = {"transcript": "One two", "words": [word("One", 0.5, 1.0), word("two", second_utterance_offset + 0.25, second_utterance_offset + 0.5)]}
+
+        transcribe_utterance_batch(second_utterance)
+
+        mock_transcribe_audio.assert_called_once()
+        audio = mock_transcribe_audio.call_args.args[1]
+        self.assertEqual(len(audio), int(SAMPLE_RATE * (3 + BATCH_SILENCE_GAP_SECONDS)) * 2)
+        # The earlier utterance comes first in the audio, followed by the silence gap
+        self.assertEqual(audio[int(SAMPLE_RATE * 2) * 2 : int(SAMPLE_RATE * 2) * 2 + 2], b"\x00\x00")
+
+        first_utterance.refresh_from_db()
+        second_utterance.refresh_from_db()
+        self.assertEqual(first_utterance.transcription["transcript"], "One")
+        self.assertEqual(second_utterance.transcription["transcript"], "two")
+        self.assertAlmostEqual(second_utterance.transcription["words"][0]["start"], 0.25)
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.pending_transcription_count, 0)
+
+    @patch("bots.tasks.process_utterance_task.transcribe_audio")
+    def test_single_pending_utterance_keeps_provider_transcription(self, mock_transcribe_audio):
+        utterance = self.create_utterance(0, 1)
+        mock_transcribe_audio.return_value = {"transcript": "One", "confidence": 0.9, "words": [word("One", 0.5, 1.0)]}
+
+        transcribe_utterance_batch(utterance)
+
+        utterance.refresh_from_db()
+        self.assertEqual(utterance.transcription, mock_transcribe_audio.return_value)
@@ -0,0 +1,100 @@
+import os
+import select
+import tempfile
+from unittest.mock import MagicMock, call, patch
+
+from django.test import SimpleTestCase
+
+from bots.web_bot_adapter.virtual_microphone import VirtualMicrophone
+
+# 20ms of 44.1kHz 16 bit mono, the frame size AudioOutputManager sends
+FRAME = b"\x01\x00" * 882
+
+
+class TestVirtualMicrophone(SimpleTestCase):
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.fifo_path = os.path.join(temporary_directory.name, "bot_microphone.fifo")
+        self.microphone = VirtualMicrophone("bot_microphone", fifo_path=self.fifo_path)
+        self.addCleanup(self.microphone.destroy)
+
+    def open_reader(self):
+        # Stands in for PulseAudio's module-pipe-source
+        os.mkfifo(self.fifo_path)
+        reader_fd = os.open(self.fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+        self.addCleanup(os.close, reader_fd)
+        return reader_fd
+
+    @patch("bots.web_bot_adapter.virtual_microphone.subprocess.run")
+    def test_source_is_loaded_and_unloaded(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0, stdout="42\n")
+
+        self.microphone.create()
+        self.microphone.destroy()
+
+        self.assertIn(f"file={self.fifo_path}", mock_run.call_args_list[0].args[0])
+        self.assertIn("source_name=bot_microphone", mock_run.call_args_list[0].args[0])
+        self.assertEqual(mock_run.call_args_list[1], call(["pactl", "unload-module", "42"], capture_output=True))
+
+    def test_audio_is_written_to_the_pipe(self):
+        reader_fd = self.open_reader()
+
+        self.microphone.write(FRAME, sample_rate=44100)
+        self.microphone.write(FRAME, sample_rate=44100)
+
+        self.assertEqual(os.read(reader_fd, 10 * len(FRAME)), FRAME * 2)
+        self.assertEqual(self.microphone.dropped_frame_count, 0)
+
+    def test_audio_is_dropped_until_the_pipe_has_a_reader(self):
+        os.mkfifo(self.fifo_path)
+
+        self.microphone.write(FRAME, sample_rate=44100)
+
+        self.assertEqual(self.microphone.dropped_frame_count, 1)
+        self.assertIsNone(self.microphone.fifo_fd)
+
+    def test_pipe_is_reopened_after_its_reader_goes_away(self):
+        os.mkfifo(self.fifo_path)
+        reader_fd = os.open(self.fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+        self.microphone.write(FRAME, sample_rate=44100)
+        os.close(reader_fd)
+
+        with self.assertLogs("bots.web_bot_adapter.virtual_microphone", level="WARNING"):
+            self.microphone.write(FRAME, sample_rate=44100)
+        self.assertIsNone(self.microphone.fifo_fd)
+        self.assertEqual(self.microphone.dropped_frame_count, 1)
+
+        reader_fd = os.open(self.fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+        self.addCleanup(os.close, reader_fd)
+        self.microphone.write(FRAME, sample_rate=44100)
+
+        self.assertEqual(os.read(reader_fd, 10 * len(FRAME)), FRAME)
+        self.assertEqual(self.microphone.dropped_frame_count, 1)
+
+    def test_writes_never_block_when_the_pipe_is_full(self):
+        reader_fd = self.open_reader()
+
+        with self.assertLogs("bots.web_bot_adapter.virtual_microphone", level="WARNING"):
+            for _ in range(1000):
+                self.microphone.write(FRAME, sample_rate=44100)
+
+        self.assertGreater(self.microphone.dropped_frame_count, 0)
+        # Only whole samples made it into the pipe
+        buffered_bytes = b""
+        while select.select([reader_fd], [], [], 0)[0]:
+            chunk = os.read(reader_fd, 65536)
+            if not chunk:
+                break
+            buffered_bytes += chunk
+        self.assertEqual(len(buffered_bytes) % 2, 0)
+        self.assertEqual(set(buffered_bytes), {0, 1})
+
+    def test_audio_at_other_sample_rates_is_dropped(self):
+        reader_fd = self.open_reader()
+
+        with self.assertLogs("bots.web_bot_adapter.virtual_microphone", level="WARNING"):
+            self.microphone.write(FRAME, sample_rate=16000)
+
+        self.assertIsNone(self.microphone.fifo_fd)
+        self.assertFalse(select.select([reader_fd], [], [], 0)[0])
@@ -0,0 +1,110 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+
+from bots.models import (
+    Bot,
+    Organization,
+    Participant,
+    Project,
+    Recording,
+    RecordingStates,
+    RecordingTranscriptionStates,
+    RecordingTypes,
+    TranscriptionTypes,
+    Utterance,
+)
+from bots.write_behind import WriteBehindIngester, WriteBehindQueue, WriteBehindRecordTypes
+
+
+class TestWriteBehind(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://test.com")
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.NON_REALTIME,
+            state=RecordingStates.IN_PROGRESS,
+        )
+
+        # Stand in for the Redis streams
+        self.stream = []
+        self.dead_letters = []
+        self.redis_client = MagicMock()
+        pipeline = self.redis_client.pipeline.return_value
+
+        def xadd(stream, fields):
+            if stream == "bot_write_behind_dead_letter":
+                self.dead_letters.append(fields)
+            else:
+                self.stream.append((f"{len(self.stream)}-0".encode(), {key.encode(): value.encode() for key, value in fields.items()}))
+
+        pipeline.xadd.side_effect = xadd
+        self.redis_client.xautoclaim.return_value = [b"0-0", [], []]
+        self.redis_client.xreadgroup.side_effect = lambda *args, **kwargs: [[b"bot_write_behind", list(self.stream)]]
+        self.redis_client.xpending_range.side_effect = lambda *args, min, **kwargs: [{"message_id": min, "consumer": b"test", "time_since_delivered": 0, "times_delivered": 1}]
+
+        self.queue = WriteBehindQueue(self.redis_client)
+        self.ingester = WriteBehindIngester(self.redis_client, consumer_name="test")
+
+    def message(self, participant_uuid="participant_1", **fields):
+        return {"participant_uuid": participant_uuid, "participant_user_uuid": None, "participant_full_name": "Test User", "timestamp_ms": 1000, **fields}
+
+    def test_closed_captions_are_written_by_ingester(self):
+        self.queue.append(
+            WriteBehindRecordTypes.CLOSED_CAPTION_UTTERANCE,
+            self.bot.id,
+            self.recording,
+            [self.message(duration_ms=500, text="Hello", source_uuid_suffix="participant_1-1"), self.message(participant_uuid="participant_2", duration_ms=500, text="Hi", source_uuid_suffix="participant_2-1")],
+        )
+        self.assertEqual(Utterance.objects.count(), 0)
+
+        self.assertEqual(self.ingester.ingest_batch(), 2)
+
+        self.assertEqual(sorted(Utterance.objects.values_list("transcription__transcript", flat=True)), ["Hello", "Hi"])
+        self.assertEqual(Participant.objects.filter(bot=self.bot).count(), 2)
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.transcription_state, RecordingTranscriptionStates.IN_PROGRESS)
+        self.redis_client.pipeline.return_value.xack.assert_called_once_with("bot_write_behind", "ingest_workers", b"0-0", b"1-0")
+
+    @patch("bots.tasks.process_utterance_task.process_utterance.delay")
+    def test_redelivered_audio_utterance_is_only_created_once(self, mock_process_utterance_delay):
+        self.queue.append(WriteBehindRecordTypes.INDIVIDUAL_AUDIO_UTTERANCE, self.bot.id, self.recording, [self.message(audio_data=b"\x01\x00" * 320, sample_rate=32000)])
+        # The record is redelivered, as if the first ingester died before acknowledging it
+        self.assertTrue(json.loads(self.stream[0][1][b"record"])["message"]["source_uuid"].startswith(self.recording.object_id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingester.ingest_batch()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingester.ingest_batch()
+
+        utterance = Utterance.objects.get(recording=self.recording)
+        self.assertEqual(bytes(utterance.audio_blob), b"\x01\x00" * 320)
+        self.assertEqual(utterance.duration_ms, 10)
+        mock_process_utterance_delay.assert_called_once_with(utterance.id)
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.pending_transcription_count, 1)
+
+    def test_failing_record_is_left_pending(self):
+        self.queue.append(WriteBehindRecordTypes.CLOSED_CAPTION_UTTERANCE, self.bot.id, self.recording, [self.message(duration_ms=500, text="Hello", source_uuid_suffix="participant_1-1")])
+        self.queue.append(WriteBehindRecordTypes.CLOSED_CAPTION_UTTERANCE, self.bot.id, self.recording, [self.message(text="Missing duration", source_uuid_suffix="participant_1-2")])
+
+        self.assertEqual(self.ingester.ingest_batch(), 1)
+        self.assertEqual(Utterance.objects.count(), 1)
+        self.redis_client.pipeline.return_value.xack.assert_called_once_with("bot_write_behind", "ingest_workers", b"0-0")
+
+    def test_record_that_keeps_failing_is_dead_lettered(self):
+        self.queue.append(WriteBehindRecordTypes.CLOSED_CAPTION_UTTERANCE, self.bot.id, self.recording, [self.message(duration_ms=500, text="Hello", source_uuid_suffix="participant_1-1")])
+        self.queue.append(WriteBehindRecordTypes.CLOSED_CAPTION_UTTERANCE, self.bot.id, self.recording, [self.message(text="Missing duration", source_uuid_suffix="participant_1-2")])
+        self.redis_client.xpending_range.side_effect = lambda *args, min, **kwargs: [{"message_id": min, "consumer": b"test", "time_since_delivered": 0, "times_delivered": WriteBehindIngester.MAX_DELIVERIES}]
+
+        self.assertEqual(self.ingester.ingest_batch(), 1)
+
+        self.assertEqual(self.dead_letters, [{"record": self.stream[1][1][b"record"], "entry_id": b"1-0", "error": "KeyError('duration_ms')"}])
+        pipeline = self.redis_client.pipeline.return_value
+        pipeline.xack.assert_called_once_with("bot_write_behind", "ingest_workers", b"0-0", b"1-0")
+        pipeline.xdel.assert_called_once_with("bot_write_behind", b"0-0", b"1-0")
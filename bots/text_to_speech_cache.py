@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+from django.core.files.base import ContentFile
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from bots.redis_utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class TextToSpeechCacheStorage(S3Boto3Storage):
+    bucket_name = settings.AWS_RECORDING_STORAGE_BUCKET_NAME
+    location = "text_to_speech_cache"
+    file_overwrite = True
+
+
+class TextToSpeechCacheResults:
+    MEMORY_HIT = "memory_hits"
+    STORAGE_HIT = "storage_hits"
+    MISS = "misses"
+
+    ALL = [MEMORY_HIT, STORAGE_HIT, MISS]
+
+
+class TextToSpeechCache:
+    """
+    Caches synthesized speech by a hash of the text, the voice settings and the sample rate, so repeated phrases
+    (greetings, fillers) are only synthesized once. Lookups go to an in-process LRU bounded by memory_max_bytes,
+    then to object storage, which every bot shares.
+
+    Hits and misses are counted in a Redis hash, see the text_to_speech_cache_metrics command.
+    """
+
+    STATS_KEY = "text_to_speech_cache:stats"
+
+    def __init__(self, memory_max_bytes=None, storage_enabled=None, storage=None, redis_client=None):
+        self.memory_max_bytes = settings.TEXT_TO_SPEECH_CACHE_MEMORY_MAX_BYTES if memory_max_bytes is None else memory_max_bytes
+        self.storage_enabled = settings.TEXT_TO_SPEECH_CACHE_STORAGE_ENABLED if storage_enabled is None else storage_enabled
+        self._storage = storage
+        self._redis_client = redis_client
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = TextToSpeechCacheStorage()
+        return self._storage
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = get_redis_client()
+        return self._redis_client
+
+    @staticmethod
+    def key(provider, text, voice_settings, sample_rate):
+        payload = json.dumps({"provider": provider, "text": text, "voice_settings": voice_settings, "sample_rate": sample_rate}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_or_synthesize(self, key, synthesize):
+        """
+        Returns the cached audio for the key, calling synthesize() to produce and cache it on a miss.
+        """
+        audio = self.get_from_memory(key)
+        if audio is not None:
+            self.record_result(TextToSpeechCacheResults.MEMORY_HIT)
+            return audio
+
+        audio = self.get_from_storage(key)
+        if audio is not None:
+            self.record_result(TextToSpeechCacheResults.STORAGE_HIT)
+            self.put_in_memory(key, audio)
+            return audio
+
+        self.record_result(TextToSpeechCacheResults.MISS)
+        audio = synthesize()
+        self.put_in_memory(key, audio)
+        self.put_in_storage(key, audio)
+        return audio
+
+    def get_from_memory(self, key):
+        with self.lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+            return audio
+
+    def put_in_memory(self, key, audio):
+        if len(audio) > self.memory_max_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return
+            self.memory[key] = audio
+            self.memory_bytes += len(audio)
+            while self.memory_bytes > self.memory_max_bytes:
+                _, evicted_audio = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted_audio)
+
+    def get_from_storage(self, key):
+        if not self.storage_enabled:
+            return None
+        try:
+            with self.storage.open(f"{key}.pcm", "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read text to speech cache entry {key} from storage: {e}")
+            return None
+
+    def put_in_storage(self, key, audio):
+        if not self.storage_enabled:
+            return
+        try:
+            self.storage.save(f"{key}.pcm", ContentFile(audio))
+        except Exception as e:
+            logger.warning(f"Failed to write text to speech cache entry {key} to storage: {e}")
+
+    def record_result(self, result):
+        try:
+            self.redis_client.hincrby(self.STATS_KEY, result, 1)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to record text to speech cache {result} in Redis: {e}")
+
+    def get_metrics(self):
+        stats = self.redis_client.hgetall(self.STATS_KEY)
+        metrics = {result: int(stats.get(result.encode(), 0)) for result in TextToSpeechCacheResults.ALL}
+        lookups = sum(metrics.values())
+        metrics["hit_rate"] = (lookups - metrics[TextToSpeechCacheResults.MISS]) / lookups if lookups else 0
+        return metrics
+
+
+text_to_speech_cache = TextToSpeechCache()
@@ -0,0 +1,181 @@
+import logging
+import random
+import uuid
+
+from django.conf import settings
+
+from bots.models import TranscriptionProviders
+from bots.redis_utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionLanes:
+    # Utterances from meetings that are still in progress, someone may be waiting on these
+    LIVE = "live"
+    # Utterances from recordings that have already ended and re-transcription work
+    BACKLOG = "backlog"
+
+    ALL = [LIVE, BACKLOG]
+
+
+# Acquires a lease if the lane has a free slot, otherwise registers the caller as waiting.
+# Returns the number of seconds the caller waited for the lease, or false if no slot was free.
+# Uses the Redis server clock so that workers with skewed clocks agree on lease expiry.
+ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local limit = tonumber(ARGV[1])
+local lease_seconds = tonumber(ARGV[2])
+local waiter_ttl_seconds = tonumber(ARGV[5])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= limit then
+    redis.call('ZADD', KEYS[2], 'NX', now, ARGV[4])
+    redis.call('EXPIRE', KEYS[2], waiter_ttl_seconds)
+    return false
+end
+
+redis.call('ZADD', KEYS[1], now + lease_seconds, ARGV[3])
+redis.call('EXPIRE', KEYS[1], lease_seconds)
+
+local wait_seconds = 0
+local waiting_since = redis.call('ZSCORE', KEYS[2], ARGV[4])
+if waiting_since then
+    wait_seconds = now - tonumber(waiting_since)
+    redis.call('ZREM', KEYS[2], ARGV[4])
+end
+
+redis.call('HINCRBY', KEYS[3], 'acquired', 1)
+redis.call('HINCRBYFLOAT', KEYS[3], 'total_wait_seconds', wait_seconds)
+if wait_seconds > tonumber(redis.call('HGET', KEYS[3], 'max_wait_seconds') or '0') then
+    redis.call('HSET', KEYS[3], 'max_wait_seconds', wait_seconds)
+end
+redis.call('EXPIRE', KEYS[3], waiter_ttl_seconds)
+
+return tostring(wait_seconds)
+"""
+
+
+class TranscriptionLease:
+    def __init__(self, project_id, provider, lane, token, wait_seconds):
+        self.project_id = project_id
+        self.provider = provider
+        self.lane = lane
+        self.token = token
+        self.wait_seconds = wait_seconds
+
+
+class TranscriptionConcurrencyLimiter:
+    """
+    Limits the number of concurrent transcription requests per project and provider, so that one project's
+    meetings can't starve everyone else's transcripts or push the provider into rate limiting.
+
+    Each in-flight request holds a lease in a Redis sorted set scored by its expiry, so leases held by a worker
+    that died are reclaimed after LEASE_SECONDS. The LIVE lane can use every slot, while the BACKLOG lane leaves
+    reserved_live_slots free for utterances from meetings in progress.
+
+    Callers that can't get a slot are recorded as waiting, which is where the queue depth and wait time metrics
+    come from.
+    """
+
+    LEASE_SECONDS = 120
+    WAITER_TTL_SECONDS = 3600
+    RETRY_DELAY_SECONDS = {TranscriptionLanes.LIVE: 1, TranscriptionLanes.BACKLOG: 5}
+
+    def __init__(self, max_concurrency=None, reserved_live_slots=None, redis_client=None):
+        self.max_concurrency = settings.TRANSCRIPTION_MAX_CONCURRENCY_PER_PROJECT if max_concurrency is None else max_concurrency
+        self.reserved_live_slots = settings.TRANSCRIPTION_RESERVED_LIVE_SLOTS if reserved_live_slots is None else reserved_live_slots
+        self._redis_client = redis_client
+        self._acquire_script = None
+
+    @property
+    def enabled(self):
+        return self.max_concurrency > 0
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = get_redis_client()
+        return self._redis_client
+
+    def key_prefix(self, project_id, provider):
+        return f"transcription_limiter:{TranscriptionProviders.provider_to_api_code(provider)}:{project_id}"
+
+    def lane_limit(self, lane):
+        if lane == TranscriptionLanes.LIVE:
+            return self.max_concurrency
+        # The backlog always gets at least one slot, so it can't be starved entirely
+        return max(self.max_concurrency - self.reserved_live_slots, 1)
+
+    def retry_delay_seconds(self, lane):
+        # Jitter so that tasks that were turned away together don't all come back at the same moment
+        return self.RETRY_DELAY_SECONDS[lane] * random.uniform(1.0, 1.5)
+
+    def acquire(self, project_id, provider, lane, waiter_id):
+        """
+        Tries to take a transcription slot for the project and provider. waiter_id identifies the unit of work,
+        so that repeated attempts for the same work are counted once in the queue depth and its wait time is
+        measured from the first attempt.
+
+        Returns a TranscriptionLease, or None if no slot is free and the caller should try again later.
+        """
+        if not self.enabled:
+            return TranscriptionLease(project_id=project_id, provider=provider, lane=lane, token=None, wait_seconds=0)
+
+        if self._acquire_script is None:
+            self._acquire_script = self.redis_client.register_script(ACQUIRE_SCRIPT)
+
+        key_prefix = self.key_prefix(project_id, provider)
+        token = uuid.uuid4().hex
+        wait_seconds = self._acquire_script(
+            keys=[f"{key_prefix}:leases", f"{key_prefix}:{lane}:waiting", f"{key_prefix}:{lane}:stats"],
+            args=[self.lane_limit(lane), self.LEASE_SECONDS, token, waiter_id, self.WAITER_TTL_SECONDS],
+        )
+        if wait_seconds is None:
+            return None
+
+        wait_seconds = float(wait_seconds)
+        if wait_seconds > 0:
+            logger.info(f"Acquired {lane} transcription slot for project {project_id} provider {TranscriptionProviders.provider_to_api_code(provider)} after waiting {wait_seconds:.2f}s")
+        return TranscriptionLease(project_id=project_id, provider=provider, lane=lane, token=token, wait_seconds=wait_seconds)
+
+    def release(self, lease):
+        if lease.token is None:
+            return
+        self.redis_client.zrem(f"{self.key_prefix(lease.project_id, lease.provider)}:leases", lease.token)
+
+    def get_metrics(self, project_id, provider):
+        """
+        Returns the number of in-flight requests and, per lane, the queue depth and wait times for the project and provider.
+        """
+        key_prefix = self.key_prefix(project_id, provider)
+        now = self.redis_client.time()
+        now = now[0] + now[1] / 1000000
+
+        pipeline = self.redis_client.pipeline()
+        pipeline.zcount(f"{key_prefix}:leases", now, "+inf")
+        for lane in TranscriptionLanes.ALL:
+            # Ignore waiters that never came back, e.g. because their task was revoked
+            pipeline.zremrangebyscore(f"{key_prefix}:{lane}:waiting", "-inf", now - self.WAITER_TTL_SECONDS)
+            pipeline.zcard(f"{key_prefix}:{lane}:waiting")
+            pipeline.zrange(f"{key_prefix}:{lane}:waiting", 0, 0, withscores=True)
+            pipeline.hgetall(f"{key_prefix}:{lane}:stats")
+        results = pipeline.execute()
+
+        metrics = {"in_flight": results[0], "lanes": {}}
+        for index, lane in enumerate(TranscriptionLanes.ALL):
+            _, queue_depth, oldest_waiter, stats = results[1 + index * 4 : 5 + index * 4]
+            acquired = int(stats.get(b"acquired", 0))
+            total_wait_seconds = float(stats.get(b"total_wait_seconds", 0))
+            metrics["lanes"][lane] = {
+                "queue_depth": queue_depth,
+                "oldest_wait_seconds": now - oldest_waiter[0][1] if oldest_waiter else 0,
+                "acquired": acquired,
+                "average_wait_seconds": total_wait_seconds / acquired if acquired else 0,
+                "max_wait_seconds": float(stats.get(b"max_wait_seconds", 0)),
+            }
+        return metrics
+
+
+transcription_limiter = TranscriptionConcurrencyLimiter()
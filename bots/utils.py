@@ -1,4 +1,6 @@
 import io
+import logging
+import subprocess
 
 import cv2
 import numpy as np
@@ -8,6 +10,9 @@ from .models import (
     MeetingTypes,
     RecordingStates,
 )
+from .mp3_metadata import Mp3ParseError, parse_mp3_metadata
+
+logger = logging.getLogger(__name__)
 
 
 def pcm_to_mp3(
@@ -82,6 +87,28 @@ def mp3_to_pcm(mp3_data: bytes, sample_rate: int = 32000, channels: int = 1, sam
     return pcm_data
 
 
+def extract_pcm_from_media(source: str, start_seconds: float, duration_seconds: float, sample_rate: int = 16000) -> bytes:
+    """
+    Decode a time range of the audio in a media file to mono 16-bit PCM. ffmpeg seeks
+    to the start of the range, so only the requested part of the file is downloaded and decoded.
+
+    Args:
+        source (str): Path or URL of the media file
+        start_seconds (float): Start of the range in seconds
+        duration_seconds (float): Length of the range in seconds
+        sample_rate (int): Desired sample rate in Hz (default: 16000)
+
+    Returns:
+        bytes: Raw PCM audio data
+    """
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-ss", f"{start_seconds:.3f}", "-t", f"{duration_seconds:.3f}", "-i", source, "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "pipe:1"],
+        capture_output=True,
+        check=True,
+    )
+    return result.stdout
+
+
 def calculate_audio_duration_ms(audio_data: bytes, content_type: str) -> int:
     """
     Calculate the duration of audio data in milliseconds.
@@ -93,13 +120,18 @@ def calculate_audio_duration_ms(audio_data: bytes, content_type: str) -> int:
     Returns:
         int: Duration in milliseconds
     """
-    buffer = io.BytesIO(audio_data)
-
-    if content_type == "audio/mp3":
-        audio = AudioSegment.from_mp3(buffer)
-    else:
+    if content_type != "audio/mp3":
         raise ValueError(f"Unsupported content type for duration calculation: {content_type}")
 
+    # Reading the frame headers is much cheaper than decoding the whole file
+    try:
+        return parse_mp3_metadata(audio_data).duration_ms
+    except Mp3ParseError as e:
+        logger.warning(f"Could not read MP3 duration from frame headers, decoding it instead: {e}")
+
+    buffer = io.BytesIO(audio_data)
+    audio = AudioSegment.from_mp3(buffer)
+
     buffer.close()
     # len(audio) returns duration in milliseconds for pydub AudioSegment objects
     duration_ms = len(audio)
@@ -0,0 +1,92 @@
+import errno
+import logging
+import os
+import select
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+
+class VirtualMicrophone:
+    """
+    A PulseAudio source fed from a named pipe, which Chrome uses as its microphone. PCM written to the pipe is
+    heard in the meeting after at most the pipe's contents, so writers should send small frames shortly before
+    they're due (see AudioOutputManager) rather than large chunks.
+
+    Writes never block. If PulseAudio falls behind and the pipe fills up, the frame is dropped and counted. If
+    PulseAudio closes the pipe, frames are dropped until it opens it again.
+    """
+
+    SAMPLE_RATE = 44100
+    CHANNELS = 1
+
+    def __init__(self, source_name, fifo_path=None):
+        self.source_name = source_name
+        self.fifo_path = fifo_path or f"/tmp/{source_name}.fifo"
+        self.module_index = None
+        self.fifo_fd = None
+        self.dropped_frame_count = 0
+
+    def create(self):
+        # module-pipe-source creates the pipe and keeps it open for reading
+        result = subprocess.run(
+            [
+                "pactl",
+                "load-module",
+                "module-pipe-source",
+                f"source_name={self.source_name}",
+                f"file={self.fifo_path}",
+                "format=s16le",
+                f"rate={self.SAMPLE_RATE}",
+                f"channels={self.CHANNELS}",
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise Exception(f"Failed to create virtual microphone {self.source_name}: {result.stderr.strip()}")
+        self.module_index = result.stdout.strip()
+        logger.info(f"Created virtual microphone {self.source_name} reading from {self.fifo_path}")
+
+    def open_fifo(self):
+        try:
+            self.fifo_fd = os.open(self.fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            # ENXIO means PulseAudio doesn't have the pipe open for reading yet
+            if e.errno not in (errno.ENXIO, errno.ENOENT):
+                raise
+            return False
+        return True
+
+    def write(self, pcm_bytes, sample_rate):
+        if sample_rate != self.SAMPLE_RATE:
+            logger.warning(f"Virtual microphone {self.source_name} expects {self.SAMPLE_RATE}Hz audio, dropping {sample_rate}Hz audio")
+            return
+        if self.fifo_fd is None and not self.open_fifo():
+            self.dropped_frame_count += 1
+            return
+
+        # Writes of up to PIPE_BUF bytes are all or nothing, so a full pipe can't leave half a sample behind
+        for offset in range(0, len(pcm_bytes), select.PIPE_BUF):
+            try:
+                os.write(self.fifo_fd, pcm_bytes[offset : offset + select.PIPE_BUF])
+            except BlockingIOError:
+                self.dropped_frame_count += 1
+                if self.dropped_frame_count % 100 == 1:
+                    logger.warning(f"Virtual microphone {self.source_name} pipe is full, dropped {self.dropped_frame_count} frames so far")
+                return
+            except BrokenPipeError:
+                # PulseAudio stopped reading, e.g. because the source was unloaded. The next write reopens the pipe.
+                logger.warning(f"Virtual microphone {self.source_name} pipe has no reader, dropping audio until it is reopened")
+                os.close(self.fifo_fd)
+                self.fifo_fd = None
+                self.dropped_frame_count += 1
+                return
+
+    def destroy(self):
+        if self.fifo_fd is not None:
+            os.close(self.fifo_fd)
+            self.fifo_fd = None
+        if self.module_index:
+            subprocess.run(["pactl", "unload-module", self.module_index], capture_output=True)
+            self.module_index = None
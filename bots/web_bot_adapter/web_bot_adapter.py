@@ -17,11 +17,13 @@ from websockets.sync.server import serve
 
 from bots.bot_adapter import BotAdapter
 from bots.bot_controller.automatic_leave_configuration import AutomaticLeaveConfiguration
+from bots.bot_controller.speaking_timeline_manager import float32_audio_is_speaking
 from bots.models import RecordingViews
 from bots.utils import half_ceil, scale_i420
 
 from .debug_screen_recorder import DebugScreenRecorder
 from .ui_methods import UiMeetingNotFoundException, UiRequestToJoinDeniedException, UiRetryableException, UiRetryableExpectedException
+from .virtual_microphone import VirtualMicrophone
 
 logger = logging.getLogger(__name__)
 
@@ -43,7 +45,9 @@ class WebBotAdapter(BotAdapter):
         recording_view=None,
         should_create_debug_recording=False,
         start_recording_screen_callback=None,
-        stop_recording_screen_callback=None
+        stop_recording_screen_callback=None,
+        add_audio_stream_chunk_callback=None,
+        add_speaking_activity_callback=None
     ):
         # Initialize common parameters
         self.display_name = display_name
@@ -60,6 +64,12 @@ class WebBotAdapter(BotAdapter):
         self.should_create_debug_recording = should_create_debug_recording
         self.start_recording_screen_callback = start_recording_screen_callback
         self.stop_recording_screen_callback = stop_recording_screen_callback
+        # Receives every incoming audio frame as it arrives, for streaming it out in real time
+        self.add_audio_stream_chunk_callback = add_audio_stream_chunk_callback
+        # Told whether there was speech in each incoming audio frame, per audio stream
+        self.add_speaking_activity_callback = add_speaking_activity_callback
+        # From the browser's most recent AudioFormatUpdate message
+        self.audio_sample_rate = None
         self.recording_view = recording_view
 
         self.meeting_url = meeting_url
@@ -67,6 +77,7 @@ class WebBotAdapter(BotAdapter):
         self.video_frame_size = (1920, 1080)
 
         self.driver = None
+        self.virtual_microphone = None
 
         self.send_frames = True
 
@@ -158,7 +169,14 @@ class WebBotAdapter(BotAdapter):
             if np.any(audio_data):
                 self.last_audio_message_processed_time = time.time()
 
-            if self.wants_any_video_frames_callback() and self.send_frames:
+            if self.add_speaking_activity_callback and self.audio_sample_rate:
+                # The timestamp is in microseconds since the page's time origin, from when the browser captured the frame, so frames that arrive in a burst keep their spacing
+                self.add_speaking_activity_callback(stream_id, self.first_buffer_timestamp_ms_offset + timestamp / 1000, len(audio_data) * 1000 / self.audio_sample_rate, float32_audio_is_speaking(audio_data))
+
+            if self.add_audio_stream_chunk_callback and self.audio_sample_rate:
+                self.add_audio_stream_chunk_callback(audio_data.tobytes(), stream_id, self.audio_sample_rate)
+
+            if self.add_mixed_audio_chunk_callback and self.wants_any_video_frames_callback() and self.send_frames:
                 self.add_mixed_audio_chunk_callback(audio_data.tobytes(), timestamp * 1000, stream_id % 3)
 
     def handle_websocket(self, websocket):
@@ -181,6 +199,7 @@ class WebBotAdapter(BotAdapter):
                     if isinstance(json_data, dict):
                         if json_data.get("type") == "AudioFormatUpdate":
                             audio_format = json_data["format"]
+                            self.audio_sample_rate = audio_format.get("sampleRate")
                             logger.info(f"audio format {audio_format}")
 
                         elif json_data.get("type") == "CaptionUpdate":
@@ -341,6 +360,13 @@ class WebBotAdapter(BotAdapter):
             "pactl", "load-module", "module-null-sink", f"sink_name={virt_cable_token}"
         ])
 
+        # Chrome's microphone, which send_raw_audio writes to
+        if not self.virtual_microphone:
+            virtual_microphone = VirtualMicrophone(f"{virt_cable_token}_microphone")
+            virtual_microphone.create()
+            self.virtual_microphone = virtual_microphone
+        os.environ['PULSE_SOURCE'] = self.virtual_microphone.source_name
+
         self.driver = webdriver.Chrome(options=options)
         logger.info(f"web driver server initialized at port {self.driver.service.port}")
 
@@ -521,6 +547,9 @@ class WebBotAdapter(BotAdapter):
         if self.debug_screen_recorder:
             self.debug_screen_recorder.stop()
 
+        if self.virtual_microphone:
+            self.virtual_microphone.destroy()
+
         # Properly shutdown the websocket server
         if self.websocket_server:
             try:
@@ -552,7 +581,10 @@ class WebBotAdapter(BotAdapter):
                 return
 
     def send_raw_audio(self, bytes, sample_rate):
-        logger.info("send_raw_audio not supported in google meet bots")
+        if not self.virtual_microphone:
+            logger.info("send_raw_audio called before the virtual microphone was created")
+            return
+        self.virtual_microphone.write(bytes, sample_rate)
 
     def send_raw_image(self, image_bytes):
         logger.info("send_raw_image not supported in google meet bots")
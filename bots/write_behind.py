@@ -0,0 +1,232 @@
+import base64
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from bots.models import Participant, Recording, RecordingManager, Utterance
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_STREAM = "bot_write_behind"
+WRITE_BEHIND_CONSUMER_GROUP = "ingest_workers"
+# Records that couldn't be written after WriteBehindIngester.MAX_DELIVERIES attempts are moved here for inspection
+WRITE_BEHIND_DEAD_LETTER_STREAM = "bot_write_behind_dead_letter"
+
+
+class WriteBehindRecordTypes:
+    INDIVIDUAL_AUDIO_UTTERANCE = "individual_audio_utterance"
+    CLOSED_CAPTION_UTTERANCE = "closed_caption_utterance"
+
+
+def get_or_create_participant(bot_id, message):
+    participant, _ = Participant.objects.get_or_create(
+        bot_id=bot_id,
+        uuid=message["participant_uuid"],
+        defaults={
+            "user_uuid": message["participant_user_uuid"],
+            "full_name": message["participant_full_name"],
+        },
+    )
+    return participant
+
+
+def upsert_closed_caption_utterances(recording, messages_with_participant_ids):
+    """
+    Writes closed caption utterances with a single upsert on source_uuid. Takes (message, participant_id) pairs.
+    """
+    # Keyed by source uuid, a row can only be upserted once per statement
+    utterances_by_source_uuid = {}
+    for message, participant_id in messages_with_participant_ids:
+        source_uuid = f"{recording.object_id}-{message['source_uuid_suffix']}"
+        utterances_by_source_uuid[source_uuid] = Utterance(
+            recording=recording,
+            source_uuid=source_uuid,
+            source=Utterance.Sources.CLOSED_CAPTION_FROM_PLATFORM,
+            participant_id=participant_id,
+            transcription={"transcript": message["text"]},
+            timestamp_ms=message["timestamp_ms"],
+            duration_ms=message["duration_ms"],
+            sample_rate=None,
+        )
+
+    Utterance.objects.bulk_create(
+        utterances_by_source_uuid.values(),
+        update_conflicts=True,
+        unique_fields=["source_uuid"],
+        update_fields=["source", "participant", "transcription", "timestamp_ms", "duration_ms", "sample_rate", "updated_at"],
+    )
+
+
+def create_individual_audio_utterance(recording, participant_id, message, source_uuid=None):
+    """
+    Creates an utterance from per participant audio and queues it for transcription.
+    """
+    from bots.tasks.process_utterance_task import process_utterance
+
+    utterance = RecordingManager.create_utterance_pending_transcription(
+        recording,
+        source=Utterance.Sources.PER_PARTICIPANT_AUDIO,
+        participant_id=participant_id,
+        audio_blob=message["audio_data"],
+        audio_format=Utterance.AudioFormat.PCM,
+        timestamp_ms=message["timestamp_ms"],
+        duration_ms=len(message["audio_data"]) / 64,
+        sample_rate=message["sample_rate"],
+        source_uuid=source_uuid,
+    )
+
+    def enqueue_transcription():
+        if settings.TRANSCRIPTION_BATCH_WINDOW_SECONDS > 0:
+            # Give the utterances that follow shortly after a chance to be transcribed in the same request
+            process_utterance.apply_async(args=[utterance.id], countdown=settings.TRANSCRIPTION_BATCH_WINDOW_SECONDS)
+        else:
+            # Process the utterance immediately
+            process_utterance.delay(utterance.id)
+
+    # The task must not run before the utterance is visible to it
+    transaction.on_commit(enqueue_transcription)
+    return utterance
+
+
+class WriteBehindQueue:
+    """
+    Used by bot processes in write-behind mode. Appends records to a Redis stream instead of writing them to the database,
+    a WriteBehindIngester writes them later.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+
+    def append(self, record_type, bot_id, recording, messages):
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for message in messages:
+            if record_type == WriteBehindRecordTypes.INDIVIDUAL_AUDIO_UTTERANCE:
+                # Gives the utterance an identity, so it isn't created twice if the record is delivered twice
+                message = {**message, "audio_data": base64.b64encode(message["audio_data"]).decode("ascii"), "source_uuid": f"{recording.object_id}-{uuid.uuid4().hex}"}
+
+            record = {"type": record_type, "bot_id": bot_id, "recording_id": recording.id, "message": message}
+            pipeline.xadd(WRITE_BEHIND_STREAM, {"record": json.dumps(record)})
+        pipeline.execute()
+
+
+class WriteBehindIngester:
+    """
+    Drains the write-behind stream into the database in batches. Any number of ingesters can run side by side,
+    they share the stream through a consumer group.
+
+    Records are acknowledged and deleted only after they've been written. Records that a dead ingester had read
+    but not written are claimed by another one after CLAIM_IDLE_MS. A record that still fails to be written after
+    MAX_DELIVERIES deliveries, e.g. because its recording was deleted, is moved to the dead letter stream.
+    """
+
+    BATCH_SIZE = 500
+    CLAIM_IDLE_MS = 60000
+    MAX_DELIVERIES = 5
+
+    def __init__(self, redis_client, consumer_name):
+        self.redis_client = redis_client
+        self.consumer_name = consumer_name
+
+    def ensure_consumer_group(self):
+        try:
+            self.redis_client.xgroup_create(WRITE_BEHIND_STREAM, WRITE_BEHIND_CONSUMER_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            # The group already exists
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read_batch(self, block_ms):
+        _, entries, _ = self.redis_client.xautoclaim(WRITE_BEHIND_STREAM, WRITE_BEHIND_CONSUMER_GROUP, self.consumer_name, min_idle_time=self.CLAIM_IDLE_MS, start_id="0-0", count=self.BATCH_SIZE)
+        if entries:
+            logger.info(f"Claimed {len(entries)} write-behind records from an idle ingester")
+            return entries
+
+        response = self.redis_client.xreadgroup(WRITE_BEHIND_CONSUMER_GROUP, self.consumer_name, {WRITE_BEHIND_STREAM: ">"}, count=self.BATCH_SIZE, block=block_ms)
+        if not response:
+            return []
+        return response[0][1]
+
+    def ingest_batch(self, block_ms=1000):
+        """
+        Reads up to BATCH_SIZE records, writes them to the database and acknowledges them. Returns the number of records written.
+        """
+        entries = [(entry_id, fields) for entry_id, fields in self.read_batch(block_ms) if fields]
+        if not entries:
+            return 0
+
+        records = [json.loads(fields[b"record"]) for _, fields in entries]
+        dead_letters = []
+        try:
+            self.write_records(records)
+        except Exception:
+            logger.exception(f"Failed to write batch of {len(records)} write-behind records, writing them one at a time")
+            entry_ids = []
+            for (entry_id, fields), record in zip(entries, records):
+                try:
+                    self.write_records([record])
+                    entry_ids.append(entry_id)
+                except Exception as e:
+                    if self.get_delivery_count(entry_id) >= self.MAX_DELIVERIES:
+                        logger.exception(f"Failed to write write-behind record {entry_id} after {self.MAX_DELIVERIES} deliveries, moving it to {WRITE_BEHIND_DEAD_LETTER_STREAM}")
+                        dead_letters.append((entry_id, {"record": fields[b"record"], "entry_id": entry_id, "error": repr(e)}))
+                    else:
+                        # Left pending, so it's retried once it has been idle for CLAIM_IDLE_MS
+                        logger.exception(f"Failed to write write-behind record {entry_id}")
+        else:
+            entry_ids = [entry_id for entry_id, _ in entries]
+
+        if entry_ids or dead_letters:
+            pipeline = self.redis_client.pipeline()
+            for _, dead_letter in dead_letters:
+                pipeline.xadd(WRITE_BEHIND_DEAD_LETTER_STREAM, dead_letter)
+            acknowledged_entry_ids = entry_ids + [entry_id for entry_id, _ in dead_letters]
+            pipeline.xack(WRITE_BEHIND_STREAM, WRITE_BEHIND_CONSUMER_GROUP, *acknowledged_entry_ids)
+            pipeline.xdel(WRITE_BEHIND_STREAM, *acknowledged_entry_ids)
+            pipeline.execute()
+        return len(entry_ids)
+
+    def get_delivery_count(self, entry_id):
+        pending = self.redis_client.xpending_range(WRITE_BEHIND_STREAM, WRITE_BEHIND_CONSUMER_GROUP, min=entry_id, max=entry_id, count=1)
+        return pending[0]["times_delivered"] if pending else 0
+
+    def write_records(self, records):
+        recordings_by_id = Recording.objects.in_bulk({record["recording_id"] for record in records})
+        participant_ids = {}
+
+        def get_participant_id(record):
+            key = (record["bot_id"], record["message"]["participant_uuid"])
+            if key not in participant_ids:
+                participant_ids[key] = get_or_create_participant(record["bot_id"], record["message"]).id
+            return participant_ids[key]
+
+        closed_captions_by_recording_id = {}
+        with transaction.atomic():
+            for record in records:
+                recording = recordings_by_id[record["recording_id"]]
+                message = record["message"]
+
+                if record["type"] == WriteBehindRecordTypes.CLOSED_CAPTION_UTTERANCE:
+                    closed_captions_by_recording_id.setdefault(recording.id, []).append((message, get_participant_id(record)))
+
+                elif record["type"] == WriteBehindRecordTypes.INDIVIDUAL_AUDIO_UTTERANCE:
+                    if Utterance.objects.filter(source_uuid=message["source_uuid"]).exists():
+                        continue
+                    message = {**message, "audio_data": base64.b64decode(message["audio_data"])}
+                    try:
+                        with transaction.atomic():
+                            create_individual_audio_utterance(recording, get_participant_id(record), message, source_uuid=message["source_uuid"])
+                    except IntegrityError:
+                        # Another ingester wrote it first
+                        continue
+
+                else:
+                    logger.error(f"Unknown write-behind record type {record['type']}")
+
+            for recording_id, messages_with_participant_ids in closed_captions_by_recording_id.items():
+                upsert_closed_caption_utterances(recordings_by_id[recording_id], messages_with_participant_ids)
+
+        for recording_id in closed_captions_by_recording_id:
+            RecordingManager.set_recording_transcription_in_progress(recordings_by_id[recording_id])
@@ -1659,8 +1659,8 @@ class WebSocketClient {
           // Set timestamp as BigInt64
           dataView.setBigInt64(4, BigInt(timestamp), true);
 
-          // Set streamId length and bytes
-          dataView.setInt32(12, streamId, true);
+          // Set the audio stream's number
+          dataView.setUint32(12, streamId, true);
 
           // Copy audio data after type and timestamp
           message.set(new Uint8Array(audioData.buffer), 16);
@@ -2176,6 +2176,15 @@ const handleVideoTrack = async (event) => {
   }
 };
 
+// Audio messages identify their stream by a number, so each audio track is numbered in the order it arrived
+const audioTrackNumbers = new Map();
+const getAudioTrackNumber = (track) => {
+  if (!audioTrackNumbers.has(track.id)) {
+    audioTrackNumbers.set(track.id, audioTrackNumbers.size);
+  }
+  return audioTrackNumbers.get(track.id);
+};
+
 const handleAudioTrack = async (event) => {
   let lastAudioFormat = null;  // Track last seen format
   
@@ -2188,7 +2197,7 @@ const handleAudioTrack = async (event) => {
     const readable = processor.readable;
     const writable = generator.writable;
 
-    const firstStreamId = event.streams[0]?.id;
+    const audioTrackNumber = getAudioTrackNumber(event.track);
 
     // Transform stream to intercept frames
     const transformStream = new TransformStream({
@@ -2263,7 +2272,7 @@ const handleAudioTrack = async (event) => {
 
                 // Send audio data through websocket
                 const currentTimeMicros = BigInt(Math.floor(performance.now() * 1000));
-                ws.sendAudio(currentTimeMicros, firstStreamId, audioData);
+                ws.sendAudio(currentTimeMicros, audioTrackNumber, audioData);
 
                 // Pass through the original frame
                 controller.enqueue(frame);